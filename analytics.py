@@ -0,0 +1,375 @@
+""" Отчеты по транзакциям на NumPy: суммы по группам, балансы нарастающим итогом, скользящие средние.
+
+Нужные колонки транзакций загружаются в массивы NumPy (снимок), дальше все расчеты
+векторные, без цикла по строкам в Python. Кортеж Python на строку не создается: один
+запрос склеивает каждую колонку в строку через group_concat, а NumPy разбирает ее
+целиком. Снимок кэшируется и перечитывается только после изменений в базе: своих
+(total_changes соединения для записи) или чужих (PRAGMA data_version).
+
+Итоги по категориям за месяцы, годы или все время без границ дат снимок не читают:
+их группировку уже сделали триггеры в category_month_totals, и отчет загружает только
+эти агрегаты. Итоги по счетам, по дням или за период считаются по снимку.
+
+Суммы в снимке - целые копейки, рядом знак типа транзакции. Изменение баланса -
+сумма со знаком, расход - сумма типа со знаком -1, доход - со знаком 1. У транзакции
+без типа или с типом без знака знак 0: как в балансах счетов и месячных итогах категорий,
+она не входит ни в изменение баланса, ни в расходы, ни в доходы.
+Итоги по группам возвращаются как Money, ряды по дням - массивами копеек.
+
+Суммы хранятся в валюте счета, а снимок их не пересчитывает: отчет, в который попали
+счета разных валют, завершается ValidationError. Такие отчеты строятся по одному счету
+(account_id, by='account') или через FinanceApp.get_consolidated_totals.
+
+Требует numpy (pip install numpy); остальное приложение от него не зависит.
+
+Пример:
+    python analytics.py finance.db --compare
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from dates import parse_date
+from finance_app import FinanceApp, NotFoundError, ValidationError
+from money import BASE_CURRENCY, Money
+
+# Колонки снимка; NULL в ссылках заменяется на 0, дата - число дней от 1970-01-01,
+# знак берется по типу транзакции
+SNAPSHOT_DTYPE = np.dtype([
+    ('id', np.int64),
+    ('day', np.int64),
+    ('amount', np.int64),
+    ('sign', np.int8),
+    ('category_id', np.int64),
+    ('account_id', np.int64),
+])
+
+# Каждая колонка - одной строкой через запятую. Агрегаты одного запроса получают строки
+# в одном и том же порядке, поэтому колонки выровнены. Даты в ISO-формате склеиваются без
+# разделителя по 10 символов; строки с другой датой (date(x) <> x) в снимок не входят.
+# Сортировка по (date, id) и знаки типов - уже в NumPy: ORDER BY и соединение в SQLite
+# стоят дороже, чем весь разбор
+SNAPSHOT_SQL = """
+    SELECT COUNT(*), group_concat(id), group_concat(date, ''), group_concat(amount),
+           group_concat(COALESCE(type_id, 0)), group_concat(COALESCE(category_id, 0)),
+           group_concat(COALESCE(account_id, 0))
+    FROM transactions
+    WHERE amount IS NOT NULL AND date(date) = date
+"""
+
+# Месячные итоги категорий (триггеры migrations); строки с неполной датой пропускаются
+MONTH_TOTALS_SQL = """
+    SELECT category_id, month, currency, spent, income
+    FROM category_month_totals
+    WHERE month GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]'
+"""
+
+# Период группировки -> единица datetime64
+PERIODS = {'day': 'D', 'month': 'M', 'year': 'Y'}
+
+
+def group_sum(keys, *values):
+    """ Точные суммы values по одинаковым keys: (уникальные ключи, суммы для каждого массива values) """
+    if not len(keys):
+        return keys[:0], [value[:0] for value in values]
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    return sorted_keys[starts], [np.add.reduceat(value[order], starts) for value in values]
+
+
+def daily_series(snapshot, values):
+    """ (дни, суммы values за день) без пропусков от первого до последнего дня снимка """
+    if not len(snapshot):
+        return np.empty(0, dtype='datetime64[D]'), np.empty(0, dtype=values.dtype)
+    first = snapshot.days[0]
+    offsets = (snapshot.days - first).astype(np.int64)
+    series = np.zeros(int(offsets[-1]) + 1, dtype=values.dtype)
+    unique_offsets, (sums,) = group_sum(offsets, values)
+    series[unique_offsets] = sums
+    return first + np.arange(len(series)), series
+
+
+class TransactionSnapshot:
+    """ Колонки транзакций в массивах NumPy в порядке (date, id) """
+
+    def __init__(self, data):
+        self.data = data
+        self.ids = data['id']
+        self.days = data['day'].astype('datetime64[D]')
+        self.signs = data['sign']
+        # Изменение баланса; расходы и доходы - для итогов по категориям
+        self.amounts = data['amount'] * self.signs
+        self.spent = np.where(self.signs < 0, data['amount'], 0)
+        self.income = np.where(self.signs > 0, data['amount'], 0)
+        self.category_ids = data['category_id']
+        self.account_ids = data['account_id']
+
+    def __len__(self):
+        return len(self.data)
+
+    @classmethod
+    def load(cls, conn):
+        # Типы и колонки транзакций читаются в одной транзакции - из одного состояния базы.
+        # Уже открытую транзакцию (соединение для записи) не трогаем
+        own = not conn.in_transaction
+        if own:
+            conn.execute("BEGIN")
+        try:
+            signs = conn.execute("SELECT id, COALESCE(sign, 0) FROM transaction_types").fetchall()
+            count, ids, dates, amounts, type_ids, category_ids, account_ids = conn.execute(SNAPSHOT_SQL).fetchone()
+        finally:
+            if own:
+                conn.rollback()
+        data = np.empty(count, dtype=SNAPSHOT_DTYPE)
+        if not count:
+            return cls(data)
+
+        def column(text):
+            return np.fromstring(text, dtype=np.int64, sep=',')
+
+        data['id'] = column(ids)
+        data['day'] = np.frombuffer(dates.encode('ascii'), dtype='S10').astype('datetime64[D]').astype(np.int64)
+        data['amount'] = column(amounts)
+        data['category_id'] = column(category_ids)
+        data['account_id'] = column(account_ids)
+        type_ids = column(type_ids)
+        # Знак по id типа; неизвестный тип (id вне таблицы) - 0, как у транзакции без типа
+        lookup = np.zeros(max([type_id for type_id, _ in signs], default=0) + 2, dtype=np.int8)
+        for type_id, sign in signs:
+            lookup[type_id] = sign
+        data['sign'] = lookup[np.where((type_ids > 0) & (type_ids < len(lookup)), type_ids, 0)]
+        return cls(data[np.lexsort((data['id'], data['day']))])
+
+    def select(self, start=None, end=None, account_id=None, category_id=None):
+        """ Снимок только со строками за период start..end (включительно), счета и категории """
+        mask = np.ones(len(self), dtype=bool)
+        if start is not None:
+            mask &= self.days >= np.datetime64(parse_date(start))
+        if end is not None:
+            mask &= self.days <= np.datetime64(parse_date(end))
+        if account_id is not None:
+            mask &= self.account_ids == account_id
+        if category_id is not None:
+            mask &= self.category_ids == category_id
+        return self if mask.all() else TransactionSnapshot(self.data[mask])
+
+
+class Analytics:
+    """ Векторные отчеты по транзакциям FinanceApp с кэшированным снимком """
+
+    def __init__(self, app):
+        self.app = app
+        self._snapshot = None
+        self._version = None
+
+    def _data_version(self):
+        # data_version меняется после фиксации другим соединением, total_changes - после записи своим
+        return self.app.conn.execute("PRAGMA data_version").fetchone()[0], self.app.conn.total_changes
+
+    def snapshot(self):
+        """ Снимок транзакций; перечитывается, только если база изменилась с прошлой загрузки """
+        version = self._data_version()
+        if self._snapshot is None or version != self._version:
+            if self.app.read_pool is None:
+                self._snapshot = TransactionSnapshot.load(self.app.conn)
+            else:
+                with self.app.read_pool.connection() as conn:
+                    self._snapshot = TransactionSnapshot.load(conn)
+            self._version = version
+        return self._snapshot
+
+    def invalidate(self):
+        self._snapshot = None
+
+    def _category_id(self, category):
+        if category is None:
+            return None
+        category_id = self.app.reference_cache.get_id('categories', category)
+        if category_id is None:
+            raise NotFoundError(f"Категория не найдена: {category}")
+        return category_id
+
+    def _single_currency(self, snapshot):
+        # Копейки разных валют не складываются; транзакции без счета - в базовой валюте
+        currencies = {row[0]: row[5] for row in self.app.get_accounts()}
+        self._check_currencies({currencies.get(account_id, BASE_CURRENCY)
+                                for account_id in np.unique(snapshot.account_ids).tolist()})
+
+    @staticmethod
+    def _check_currencies(used):
+        if len(used) > 1:
+            raise ValidationError(f"Суммы в разных валютах ({', '.join(sorted(used))}) нельзя сложить: "
+                                  "выберите счет или используйте FinanceApp.get_consolidated_totals")
+
+    def totals(self, by='category', period='month', start=None, end=None):
+        """ Суммы расходов и доходов по категориям или счетам и периодам.
+
+        by - 'category' или 'account', period - 'day', 'month', 'year' или None (за все время).
+        Возвращает список (название, период, spent, income) в порядке периода и id группы,
+        spent и income - Money. Транзакции без категории в итоги по категориям не входят,
+        группы без расходов и доходов не выводятся.
+        """
+        if by == 'category' and period in ('month', 'year', None) and start is None and end is None:
+            return self._month_totals(period)
+        return self._snapshot_totals(by, period, start, end)
+
+    def _month_totals(self, period):
+        # Итоги по категориям из category_month_totals: загружаются сотни агрегатов, а не строки
+        if self.app.read_pool is None:
+            rows = self.app.conn.execute(MONTH_TOTALS_SQL).fetchall()
+        else:
+            with self.app.read_pool.connection() as conn:
+                rows = conn.execute(MONTH_TOTALS_SQL).fetchall()
+        self._check_currencies({currency for _, _, currency, _, _ in rows})
+        names = {category_id: name for category_id, name in self.app.get_categories()}
+        totals = {}
+        for category_id, month, _, spent, income in rows:
+            key = (month[:4] if period == 'year' else month if period else None, category_id)
+            total = totals.setdefault(key, [0, 0])
+            total[0] += spent
+            total[1] += income
+        return [(names.get(category_id), label, Money(spent), Money(income))
+                for (label, category_id), (spent, income) in sorted(totals.items(), key=lambda item: item[0])
+                if spent or income]
+
+    def _snapshot_totals(self, by, period, start=None, end=None):
+        snapshot = self.snapshot().select(start, end)
+        if by == 'category':
+            snapshot = TransactionSnapshot(snapshot.data[snapshot.category_ids != 0])
+            self._single_currency(snapshot)
+            group_ids = snapshot.category_ids
+            names = {category_id: name for category_id, name in self.app.get_categories()}
+        elif by == 'account':
+            group_ids = snapshot.account_ids
+            names = {row[0]: row[2] for row in self.app.get_accounts()}
+        else:
+            raise ValueError(f"Неизвестная группировка: {by}")
+
+        if period is None:
+            period_ids = np.zeros(len(snapshot), dtype=np.int64)
+        elif period in PERIODS:
+            period_ids = snapshot.days.astype(f"datetime64[{PERIODS[period]}]").astype(np.int64)
+        else:
+            raise ValueError(f"Неизвестный период: {period}")
+
+        # Один целочисленный ключ на пару (период, группа)
+        width = int(group_ids.max()) + 1 if len(group_ids) else 1
+        keys, (spent, income) = group_sum(period_ids * width + group_ids, snapshot.spent, snapshot.income)
+        result = []
+        for key, spent_cents, income_cents in zip(keys.tolist(), spent.tolist(), income.tolist()):
+            if not spent_cents and not income_cents:
+                continue
+            period_id, group_id = divmod(key, width)
+            label = str(np.datetime64(period_id, PERIODS[period])) if period else None
+            result.append((names.get(group_id), label, Money(spent_cents), Money(income_cents)))
+        return result
+
+    def daily_net(self, start=None, end=None, account_id=None, category=None):
+        """ (дни, изменение за день в копейках) по всем дням от первой до последней транзакции """
+        snapshot = self.snapshot().select(start, end, account_id, self._category_id(category))
+        self._single_currency(snapshot)
+        return daily_series(snapshot, snapshot.amounts)
+
+    def running_balance(self, account_id=None):
+        """ (дни, баланс на конец дня в копейках) счета или всех счетов вместе.
+
+        Учитываются только транзакции со счетом, начальный баланс - opening_balance,
+        поэтому последнее значение совпадает с accounts.balance. Все счета вместе - только
+        если они в одной валюте.
+        """
+        snapshot = self.snapshot()
+        if account_id is None:
+            snapshot = TransactionSnapshot(snapshot.data[snapshot.account_ids != 0])
+        else:
+            snapshot = snapshot.select(account_id=account_id)
+        self._single_currency(snapshot)
+        opening = sum(row[4].cents for row in self.app.get_accounts()
+                      if row[4] is not None and account_id in (None, row[0]))
+        days, series = daily_series(snapshot, snapshot.amounts)
+        return days, opening + np.cumsum(series)
+
+    def moving_average(self, window=30, kind='spent', start=None, end=None, account_id=None, category=None):
+        """ Скользящее среднее за window дней: (последний день окна, среднее в копейках за день).
+
+        kind - 'spent' (расходы), 'income' (доходы) или 'net' (изменение баланса).
+        """
+        snapshot = self.snapshot().select(start, end, account_id, self._category_id(category))
+        if kind == 'spent':
+            values = snapshot.spent
+        elif kind == 'income':
+            values = snapshot.income
+        elif kind == 'net':
+            values = snapshot.amounts
+        else:
+            raise ValueError(f"Неизвестный вид ряда: {kind}")
+        self._single_currency(snapshot)
+        days, series = daily_series(snapshot, values)
+        if len(series) < window:
+            return np.empty(0, dtype='datetime64[D]'), np.empty(0, dtype=np.float64)
+        cumulative = np.concatenate(([0], np.cumsum(series)))
+        return days[window - 1:], (cumulative[window:] - cumulative[:-window]) / window
+
+
+def loop_category_totals(app):
+    """ Те же суммы по категориям и месяцам циклом Python по get_transactions - для сверки и сравнения """
+    categories = {category_id: name for category_id, name in app.get_categories()}
+    signs = dict(app.conn.execute("SELECT id, sign FROM transaction_types"))
+    totals = {}
+    for _, amount, category_id, _, date, _, type_id in app.get_transactions():
+        if amount is None or not date or category_id is None:
+            continue
+        key = (categories.get(category_id), date[:7])
+        spent, income = totals.get(key, (0, 0))
+        sign = signs.get(type_id) or 0
+        if sign > 0:
+            income += amount.cents
+        elif sign < 0:
+            spent += amount.cents
+        totals[key] = (spent, income)
+    return [(name, month, Money(spent), Money(income)) for (name, month), (spent, income) in totals.items()
+            if spent or income]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Отчеты по транзакциям на NumPy")
+    parser.add_argument('path', nargs='?', default='finance.db')
+    parser.add_argument('--by', choices=('category', 'account'), default='category')
+    parser.add_argument('--period', choices=('day', 'month', 'year'), default='month')
+    parser.add_argument('--compare', action='store_true', help="сравнить время и результат с циклом Python")
+    args = parser.parse_args(argv)
+
+    app = FinanceApp(args.path)
+    try:
+        analytics = Analytics(app)
+        # Первый отчет - без готового снимка
+        started = time.perf_counter()
+        rows = analytics.totals(args.by, args.period)
+        first = time.perf_counter() - started
+        for name, period, spent, income in rows:
+            print(f"{period or '-'}  {name or '-':30} расход {str(spent):>14}  доход {str(income):>14}")
+        started = time.perf_counter()
+        analytics.snapshot()
+        loaded = time.perf_counter() - started
+        started = time.perf_counter()
+        analytics._snapshot_totals(args.by, args.period)
+        computed = time.perf_counter() - started
+        print(f"Первый отчет: {first * 1000:.1f} мс; снимок: {len(analytics.snapshot())} строк за "
+              f"{loaded * 1000:.0f} мс, итоги по снимку за {computed * 1000:.1f} мс", file=sys.stderr)
+        if args.compare:
+            started = time.perf_counter()
+            expected = sorted(loop_category_totals(app), key=repr)
+            looped = time.perf_counter() - started
+            same = (expected == sorted(analytics.totals('category', 'month'), key=repr)
+                    == sorted(analytics._snapshot_totals('category', 'month'), key=repr))
+            print(f"Цикл Python: {looped * 1000:.0f} мс; результаты {'совпадают' if same else 'РАЗЛИЧАЮТСЯ'}",
+                  file=sys.stderr)
+    finally:
+        app.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,215 +1,35 @@
+import atexit
+import os
 import tkinter as tk
 from tkinter import ttk
 from tkinter import messagebox
 from tkcalendar import Calendar
-from datetime import datetime
-import sqlite3
-
-class FinanceApp:
-    def __init__(self, db_file):
-        self.conn = sqlite3.connect(db_file)
-        self.cursor = self.conn.cursor()
-
-    def get_category_name_by_id(self, category_id):
-        self.cursor.execute("SELECT name FROM categories WHERE id = ?", (category_id,))
-        result = self.cursor.fetchone()
-        return result[0] if result else None
-
-    def get_user_name_by_id(self, user_id):
-        self.cursor.execute("SELECT username FROM users WHERE id = ?", (user_id,))
-        result = self.cursor.fetchone()
-        return result[0] if result else None
-
-    def check_credentials(self, username, password):
-        self.cursor.execute("SELECT * FROM users WHERE username = ? AND password = ?", (username, password))
-        user = self.cursor.fetchone()
-        return user is not None
-
-    def user_exists(self, username):
-        """ Проверяет, существует ли пользователь с данным username """
-        self.cursor.execute("SELECT id FROM users WHERE username = ?", (username,))
-        return self.cursor.fetchone() is not None
-
-    def register_user(self, username, password):
-        """ Регистрирует нового пользователя, если тот еще не существует """
-        if self.user_exists(username):
-            messagebox.showerror("Ошибка", "Пользователь с таким именем уже существует")
-        else:
-            try:
-                self.cursor.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, password))
-                self.conn.commit()
-                messagebox.showinfo("Успех", "Пользователь успешно зарегистрирован")
-            except sqlite3.Error as e:
-                messagebox.showerror("Ошибка", f"Ошибка при регистрации пользователя: {e}")
-                self.conn.rollback()
-
-    # Методы удаления
-    def delete_user(self, user_id):
-        try:
-            self.cursor.execute("DELETE FROM users WHERE id=?", (user_id,))
-            self.conn.commit()
-            messagebox.showinfo("Успех", "Пользователь успешно удален")
-        except sqlite3.Error as e:
-            messagebox.showerror("Ошибка", f"Ошибка при удалении пользователя: {e}")
-            self.conn.rollback()
-
-    def delete_transaction(self, transaction_id):
-        try:
-            self.cursor.execute("DELETE FROM transactions WHERE id=?", (transaction_id,))
-            self.conn.commit()
-            messagebox.showinfo("Успех", "Транзакция успешно удалена")
-        except sqlite3.Error as e:
-            messagebox.showerror("Ошибка", f"Ошибка при удалении транзакции: {e}")
-            self.conn.rollback()
-
-    def delete_account(self, account_id):
-        try:
-            self.cursor.execute("DELETE FROM accounts WHERE id=?", (account_id,))
-            self.conn.commit()
-            messagebox.showinfo("Успех", "Счет успешно удален")
-        except sqlite3.Error as e:
-            messagebox.showerror("Ошибка", f"Ошибка при удалении счета: {e}")
-            self.conn.rollback()
-
-    def delete_category(self, category_id):
-        try:
-            self.cursor.execute("DELETE FROM categories WHERE id=?", (category_id,))
-            self.conn.commit()
-            messagebox.showinfo("Успех", "Категория успешно удалена")
-        except sqlite3.Error as e:
-            messagebox.showerror("Ошибка", f"Ошибка при удалении категории: {e}")
-            self.conn.rollback()
-
-    def delete_budget(self, budget_id):
-        try:
-            self.cursor.execute("DELETE FROM budget WHERE id=?", (budget_id,))
-            self.conn.commit()
-            messagebox.showinfo("Успех", "Бюджет успешно удален")
-        except sqlite3.Error as e:
-            messagebox.showerror("Ошибка", f"Ошибка при удалении бюджета: {e}")
-            self.conn.rollback()
-
-    def __del__(self):
-        self.conn.close()
-
-    def get_transactions(self):
-        self.cursor.execute("SELECT * FROM transactions ORDER BY date DESC")
-        return self.cursor.fetchall()
-
-    def validate_and_format_date(self, date_str):
-        try:
-            # Пробуем преобразовать дату в соответствующий формат
-            return datetime.strptime(date_str, "%d/%m/%Y").strftime("%Y-%m-%d")
-        except ValueError:
-            # Возвращаем None или выбрасываем ошибку, если формат некорректен
-            return None
-
-    def add_transaction(self, amount, category_name, description, date_str, type_name=None, tags=None):
-        # Проверка и форматирование даты
-        date_formatted = date_str # self.validate_and_format_date(date_str)
-        print(date_formatted)
-        if not date_formatted:
-            raise ValueError("Неверный формат даты, используйте DD/MM/YYYY")
-
-        self.cursor.execute("SELECT id FROM categories WHERE name=?", (category_name,))
-        category_id = self.cursor.fetchone()[0]
-        type_id = None
-        if type_name:
-            self.cursor.execute("SELECT id FROM transaction_types WHERE name=?", (type_name,))
-            type_id_result = self.cursor.fetchone()
-            type_id = type_id_result[0] if type_id_result else None
-
-        self.cursor.execute(
-            "INSERT INTO transactions (amount, category_id, description, date) VALUES (?, ?, ?, ?)",
-            (amount, category_id, description, date_formatted)
-        )
-        transaction_id = self.cursor.lastrowid
-        if type_id:
-            self.add_transaction_type_mapping(transaction_id, type_id)
-        if tags:
-            for tag in tags.split(','):
-                self.add_transaction_tag(transaction_id, tag)
-        self.conn.commit()
-        
-    def get_categories(self):
-        self.cursor.execute("SELECT * FROM categories")
-        return self.cursor.fetchall()
-
-    def add_category(self, name):
-        self.cursor.execute("INSERT INTO categories (name) VALUES (?)", (name,))
-        self.conn.commit()
-
-    def get_budget(self):
-        self.cursor.execute("SELECT * FROM budget")
-        return self.cursor.fetchall()
-
-    def add_budget(self, category_name, amount):
-        # Get category ID from name
-        self.cursor.execute("SELECT id FROM categories WHERE name=?", (category_name,))
-        category_id = self.cursor.fetchone()[0]
-
-        self.cursor.execute("INSERT INTO budget (category_id, amount) VALUES (?, ?)", (category_id, float(amount)))
-        self.conn.commit()
-
-    def get_users(self):
-        self.cursor.execute("SELECT * FROM users")
-        return self.cursor.fetchall()
-
-    def add_user(self, username, password):
-        self.cursor.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, password))
-        self.conn.commit()
-
-    def get_accounts(self):
-        self.cursor.execute("SELECT * FROM accounts")
-        return self.cursor.fetchall()
-
-    def add_account(self, username, name, balance):
-        try:
-            # Получаем user_id по имени пользователя
-            self.cursor.execute("SELECT id FROM users WHERE username=?", (username,))
-            user_id_result = self.cursor.fetchone()
-            if user_id_result:
-                user_id = user_id_result[0]
-                # Добавляем счет с user_id
-                self.cursor.execute("INSERT INTO accounts (user_id, name, balance) VALUES (?, ?, ?)", (user_id, name, float(balance)))
-                self.conn.commit()
-                messagebox.showinfo("Успех", "Счет успешно добавлен")
-            else:
-                messagebox.showerror("Ошибка", "Пользователь не найден")
-        except sqlite3.Error as e:
-            print(f"Ошибка при добавлении счета: {e}")
-            self.conn.rollback()
-
-    def get_transaction_types(self):
-        self.cursor.execute("SELECT * FROM transaction_types")
-        return self.cursor.fetchall()
-
-    def add_transaction_type(self, name):
-        self.cursor.execute("INSERT INTO transaction_types (name) VALUES (?)", (name,))
-        self.conn.commit()
+from db_worker import DBWorker
+from finance_app import FinanceApp
+from money import BASE_CURRENCY, Money
+from profiling import QueryStats
 
-    def get_transaction_type_mapping(self):
-        self.cursor.execute("SELECT * FROM transaction_type_mapping")
-        return self.cursor.fetchall()
+# Пауза в наборе перед поиском и число показываемых результатов
+SEARCH_DELAY_MS = 300
+SEARCH_LIMIT = 200
 
-    def add_transaction_type_mapping(self, transaction_id, type_id):
-        self.cursor.execute("INSERT INTO transaction_type_mapping (transaction_id, type_id) VALUES (?, ?)",
-                            (transaction_id, type_id))
-        self.conn.commit()
+# Периодичность регулярного платежа в диалоге -> ключ dates.FREQUENCIES
+FREQUENCY_LABELS = {'Ежемесячно': 'monthly', 'Еженедельно': 'weekly', 'Ежедневно': 'daily', 'Ежегодно': 'yearly'}
 
-    def get_transaction_tags(self):
-        self.cursor.execute("SELECT * FROM transaction_tags")
-        return self.cursor.fetchall()
 
-    def add_transaction_tag(self, transaction_id, tag):
-        self.cursor.execute("INSERT INTO transaction_tags (transaction_id, tag) VALUES (?, ?)", (transaction_id, tag))
-        self.conn.commit()
+def fill_option_menu(dropdown, variable, options):
+    """ Заполняет OptionMenu списком, полученным асинхронно """
+    menu = dropdown['menu']
+    menu.delete(0, 'end')
+    for option in options:
+        menu.add_command(label=option, command=tk._setit(variable, option))
 
 
 class LoginWindow:
-    def __init__(self, master, app):
+    def __init__(self, master, worker):
         self.master = master
-        self.app = app
+        self.worker = worker
+        self.worker.on_error = lambda e: messagebox.showerror("Ошибка", str(e))
         self.master.title("Вход")
         
         self.master.geometry('400x300')
@@ -252,8 +72,12 @@ class LoginWindow:
             username = username_entry.get()
             password = password_entry.get()
             if username and password:  # Проверка на непустые значения
-                self.app.register_user(username, password)
-                dialog.destroy()
+                def registered(result):
+                    messagebox.showinfo("Успех", "Пользователь успешно зарегистрирован")
+                    dialog.destroy()
+
+                self.worker.submit('register_user', username, password, callback=registered,
+                                   errback=lambda e: messagebox.showerror("Ошибка", f"Ошибка при регистрации пользователя: {e}"))
             else:
                 messagebox.showwarning("Предупреждение", "Имя пользователя и пароль не могут быть пустыми")
         
@@ -263,21 +87,266 @@ class LoginWindow:
     def login(self):
         username = self.username_entry.get()
         password = self.password_entry.get()
-        if self.app.check_credentials(username, password):
+        self.login_button.config(state="disabled")
+        self.worker.submit('login', username, password, callback=self.on_login, errback=self.on_login_error)
+
+    def on_login_error(self, error):
+        # Ошибка базы (например, она заблокирована): кнопка снова доступна для повторной попытки
+        self.login_button.config(state="normal")
+        messagebox.showerror("Ошибка", f"Не удалось выполнить вход: {error}")
+
+    def on_login(self, session):
+        if session is not None:
             self.master.destroy()  # Закрываем окно входа
             root = tk.Tk()  # Create a new Tkinter root window
-            gui = FinanceAppGUI(root, self.app)  # Instantiate FinanceAppGUI directly
+            self.worker.attach(root)  # Результаты запросов теперь забирает новое окно
+            gui = FinanceAppGUI(root, self.worker, session)  # Окно показывает только данные вошедшего пользователя
             root.mainloop()  # Start the main event loop
         else:
+            self.login_button.config(state="normal")
             messagebox.showerror("Ошибка", "Неверное имя пользователя или пароль")
 
 
+class TreeviewSync:
+    """ Обновление Treeview по разнице с результатом запроса.
+
+    Хранит отображение iid -> значения строки и применяет к виджету только вставки,
+    изменения и удаления, поэтому выделение сохраняется, а добавление или удаление
+    одной строки стоит постоянного числа операций с виджетом.
+    """
+
+    def __init__(self, treeview):
+        self.treeview = treeview
+        self.rows = {}
+        self.order = []
+
+    def sync(self, items):
+        """ items - список (iid, values) в порядке отображения """
+        items = [(str(iid), tuple(values)) for iid, values in items]
+        new_rows = dict(items)
+        new_order = [iid for iid, values in items]
+
+        deleted = [iid for iid in self.order if iid not in new_rows]
+        if deleted:
+            self.treeview.delete(*deleted)
+        retained = [iid for iid in new_order if iid in self.rows]
+        if retained != [iid for iid in self.order if iid in new_rows]:
+            # Порядок оставшихся строк изменился - переставляем их
+            for index, iid in enumerate(retained):
+                self.treeview.move(iid, '', index)
+        for index, (iid, values) in enumerate(items):
+            old_values = self.rows.get(iid)
+            if old_values is None:
+                self.treeview.insert('', index, iid=iid, values=values)
+            elif old_values != values:
+                self.treeview.item(iid, values=values)
+
+        self.rows = new_rows
+        self.order = new_order
+
+    def insert(self, index, items):
+        """ Вставка строк без сравнения, index - позиция или 'end' """
+        if index == 'end':
+            index = len(self.order)
+        for offset, (iid, values) in enumerate(items):
+            iid, values = str(iid), tuple(values)
+            self.treeview.insert('', index + offset, iid=iid, values=values)
+            self.rows[iid] = values
+        self.order[index:index] = [str(iid) for iid, values in items]
+
+    def delete(self, iids):
+        iids = [str(iid) for iid in iids]
+        if iids:
+            self.treeview.delete(*iids)
+        for iid in iids:
+            del self.rows[iid]
+        removed = set(iids)
+        self.order = [iid for iid in self.order if iid not in removed]
+
+
+class PagedTreeview:
+    """ Постраничная загрузка строк в Treeview с пагинацией по ключу.
+
+    В виджете хранится только окно из max_pages страниц: при прокрутке к краю окна
+    подгружается соседняя страница, а страница с противоположного края удаляется,
+    поэтому память и время обновления не зависят от размера таблицы.
+    Страницы запрашиваются асинхронно: fetch_page передает строки в обратный вызов.
+    """
+
+    def __init__(self, treeview, fetch_page, key, make_item, page_size=200, max_pages=3):
+        self.treeview = treeview
+        self.fetch_page = fetch_page  # fetch_page(after, limit, backward, callback), callback(список строк)
+        self.key = key  # ключ пагинации строки
+        self.make_item = make_item  # строка -> (iid, values) или None, если строку не показываем
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.pages = []  # [(первый ключ, последний ключ, [iid, ...]), ...]
+        self.has_before = False
+        self.has_after = False
+        self.scrollbar = None
+        self.treeview_sync = TreeviewSync(treeview)
+        self._loading = False
+        self._generation = 0  # ответы на запросы до последнего refresh() отбрасываются
+        self._check_pending = False
+        self.treeview.configure(yscrollcommand=self._on_scroll)
+
+    def attach_scrollbar(self, scrollbar):
+        self.scrollbar = scrollbar
+        scrollbar.configure(command=self.treeview.yview)
+
+    def refresh(self):
+        """ Перечитывает текущее окно и применяет к виджету только изменения """
+        self._generation += 1
+        generation = self._generation
+        self._loading = True
+        page_count = max(len(self.pages), 1)
+
+        def load_window(start):
+            self.fetch_page(start, self.page_size * page_count, False,
+                            lambda rows: self._apply_window(generation, start, page_count, rows))
+
+        if self.pages and self.has_before:
+            # Ключ строки перед окном, чтобы перечитать окно с его начала
+            self.fetch_page(self.pages[0][0], 1, True,
+                            lambda before: load_window(self.key(before[0]) if before else None))
+        else:
+            load_window(None)
+
+    def show(self, rows):
+        """ Показывает фиксированный набор строк без подгрузки (например, результаты поиска).
+
+        Следующий refresh() возвращает обычный постраничный режим.
+        """
+        self._generation += 1
+        self._loading = False
+        self.pages = []
+        self.has_before = self.has_after = False
+        self.treeview_sync.sync(self._make_items(rows))
+
+    def _apply_window(self, generation, start, page_count, rows):
+        if generation != self._generation:
+            return
+        self._loading = False
+        self.has_before = start is not None
+        self.has_after = len(rows) == self.page_size * page_count
+
+        self.pages = []
+        items = []
+        for offset in range(0, len(rows), self.page_size):
+            page_rows = rows[offset:offset + self.page_size]
+            page_items = self._make_items(page_rows)
+            self.pages.append((self.key(page_rows[0]), self.key(page_rows[-1]), [iid for iid, values in page_items]))
+            items.extend(page_items)
+        self.treeview_sync.sync(items)
+
+    def _make_items(self, rows):
+        items = []
+        for row in rows:
+            item = self.make_item(row)
+            if item is not None:
+                items.append((str(item[0]), item[1]))
+        return items
+
+    def _add_page(self, rows, index):
+        items = self._make_items(rows)
+        self.treeview_sync.insert(index, items)
+        return self.key(rows[0]), self.key(rows[-1]), [iid for iid, values in items]
+
+    def _row_count(self):
+        return len(self.treeview_sync.order)
+
+    def _on_scroll(self, first, last):
+        if self.scrollbar is not None:
+            self.scrollbar.set(first, last)
+        # Подгрузку откладываем, чтобы не менять виджет внутри его собственного обратного вызова
+        if not self._check_pending:
+            self._check_pending = True
+            self.treeview.after_idle(self._check_edges, float(first), float(last))
+
+    def _check_edges(self, first, last):
+        self._check_pending = False
+        total = self._row_count()
+        if self._loading or not self.pages:
+            return
+        margin = self.page_size // 2
+        if self.has_after and total - last * total < margin:
+            self._load_after(first * total)
+        elif self.has_before and first * total < margin:
+            self._load_before(first * total)
+
+    def _load_after(self, top):
+        self._loading = True
+        generation = self._generation
+        self.fetch_page(self.pages[-1][1], self.page_size, False,
+                        lambda rows: self._apply_after(generation, top, rows))
+
+    def _apply_after(self, generation, top, rows):
+        if generation != self._generation:
+            return
+        self._loading = False
+        self.has_after = len(rows) == self.page_size
+        if not rows:
+            return
+        self.pages.append(self._add_page(rows, 'end'))
+        if len(self.pages) > self.max_pages:
+            removed = self.pages.pop(0)[2]
+            self.treeview_sync.delete(removed)
+            self.has_before = True
+            self._move_view(top - len(removed))
+
+    def _load_before(self, top):
+        self._loading = True
+        generation = self._generation
+        self.fetch_page(self.pages[0][0], self.page_size, True,
+                        lambda rows: self._apply_before(generation, top, rows))
+
+    def _apply_before(self, generation, top, rows):
+        if generation != self._generation:
+            return
+        self._loading = False
+        self.has_before = len(rows) == self.page_size
+        if not rows:
+            return
+        page = self._add_page(rows, 0)
+        self.pages.insert(0, page)
+        if len(self.pages) > self.max_pages:
+            self.treeview_sync.delete(self.pages.pop()[2])
+            self.has_after = True
+        self._move_view(top + len(page[2]))
+
+    def _move_view(self, top):
+        # Сохраняем положение прокрутки после удаления или вставки строк над видимой областью
+        total = self._row_count()
+        if total:
+            self.treeview.yview_moveto(max(top, 0) / total)
+
+
 class FinanceAppGUI:
-    def __init__(self, master, app):
+    def __init__(self, master, worker, session):
         self.master = master
-        self.app = app
-        self.master.title("Финансовое приложение")
-        
+        self.worker = worker
+        # Все запросы на чтение передают user_id сессии и видят только счета этого пользователя
+        self.session = session
+        self.master.title(f"Финансовое приложение - {session.username}")
+
+        # Меню отладки: статистика запросов профилировщика (FINANCE_PROFILE=1)
+        self.menu = tk.Menu(self.master)
+        debug_menu = tk.Menu(self.menu, tearoff=0)
+        debug_menu.add_command(label="Статистика запросов", command=self.show_query_stats)
+        debug_menu.add_command(label="Сбросить статистику", command=lambda: self.worker.submit('reset_query_stats'))
+        self.menu.add_cascade(label="Отладка", menu=debug_menu)
+        recurring_menu = tk.Menu(self.menu, tearoff=0)
+        recurring_menu.add_command(label="Добавить регулярный платеж", command=self.add_recurring_rule)
+        recurring_menu.add_command(label="Создать наступившие платежи", command=self.run_recurring_rules)
+        self.menu.add_cascade(label="Регулярные платежи", menu=recurring_menu)
+        self.master.config(menu=self.menu)
+
+        # Индикатор занятости: запросы к базе выполняются в фоновом потоке
+        self.busy_label = tk.Label(self.master, text="", fg="gray")
+        self.busy_label.pack(anchor="w", padx=10)
+        self.worker.on_busy = self.show_busy
+        self.worker.on_error = lambda e: messagebox.showerror("Ошибка", str(e))
+
         self.transaction_frame = tk.Frame(self.master)
         self.transaction_frame.pack(padx=10, pady=10)
 
@@ -295,21 +364,54 @@ class FinanceAppGUI:
         
         self.transaction_label = tk.Label(self.transaction_frame, text="Транзакции:")
         self.transaction_label.pack()
+
+        # Поиск по описаниям: запрос отправляется после паузы в наборе
+        self.search_frame = tk.Frame(self.transaction_frame)
+        self.search_frame.pack(fill="x")
+        tk.Label(self.search_frame, text="Поиск:").pack(side="left")
+        self.search_var = tk.StringVar()
+        self.search_entry = tk.Entry(self.search_frame, textvariable=self.search_var)
+        self.search_entry.pack(side="left", fill="x", expand=True)
+        self.search_query = ""
+        self._search_after_id = None
+        self.search_var.trace_add('write', self.on_search_changed)
             
-        self.transaction_treeview = ttk.Treeview(self.transaction_frame, columns=('Сумма', 'Категория', 'Описание', 'Дата'), show="headings")
+        self.transaction_list_frame = tk.Frame(self.transaction_frame)
+        self.transaction_list_frame.pack()
+
+        self.transaction_treeview = ttk.Treeview(self.transaction_list_frame, columns=('Сумма', 'Категория', 'Описание', 'Дата'), show="headings")
         self.transaction_treeview.heading('Сумма', text='Сумма')
         self.transaction_treeview.heading('Категория', text='Категория')
         self.transaction_treeview.heading('Описание', text='Описание')
         self.transaction_treeview.heading('Дата', text='Дата')
-        self.transaction_treeview.pack()
+        self.transaction_treeview.pack(side="left")
+
+        self.transaction_scrollbar = ttk.Scrollbar(self.transaction_list_frame, orient="vertical")
+        self.transaction_scrollbar.pack(side="right", fill="y")
+
+        # В списке транзакций держим только видимое окно и запас для прокрутки
+        self.transaction_pager = PagedTreeview(
+            self.transaction_treeview,
+            lambda after, limit, backward, callback: self.worker.submit(
+                'get_transactions_page', after, limit, backward, user_id=self.session.user_id, callback=callback),
+            key=lambda transaction: (transaction[4], transaction[0]),
+            make_item=self.make_transaction_item
+        )
+        self.transaction_pager.attach_scrollbar(self.transaction_scrollbar)
 
         self.category_treeview = ttk.Treeview(self.category_frame, columns=('Категория',), show="headings")
         self.category_treeview.heading('Категория', text='Категория')
         self.category_treeview.pack()
 
-        self.budget_treeview = ttk.Treeview(self.budget_frame, columns=('Категория', 'Сумма'), show="headings")
+        self.budget_treeview = ttk.Treeview(self.budget_frame, columns=('Категория', 'Месяц', 'Сумма', 'Потрачено', 'Остаток', '%'), show="headings")
         self.budget_treeview.heading('Категория', text='Категория')
+        self.budget_treeview.heading('Месяц', text='Месяц')
         self.budget_treeview.heading('Сумма', text='Сумма')
+        self.budget_treeview.heading('Потрачено', text='Потрачено')
+        self.budget_treeview.heading('Остаток', text='Остаток')
+        self.budget_treeview.heading('%', text='%')
+        for column in ('Месяц', 'Сумма', 'Потрачено', 'Остаток', '%'):
+            self.budget_treeview.column(column, width=80)
         self.budget_treeview.pack()
 
         self.user_treeview = ttk.Treeview(self.user_frame, columns=('Имя', 'Пароль'), show="headings")
@@ -317,12 +419,24 @@ class FinanceAppGUI:
         self.user_treeview.heading('Пароль', text='Пароль')
         self.user_treeview.pack()
 
-        self.account_treeview = ttk.Treeview(self.account_frame, columns=('Пользователь', 'Название счета', 'Баланс'), show="headings")
+        self.account_treeview = ttk.Treeview(self.account_frame, columns=('Пользователь', 'Название счета', 'Баланс', 'Валюта'), show="headings")
         self.account_treeview.heading('Пользователь', text='Пользователь')
         self.account_treeview.heading('Название счета', text='Название счета')
         self.account_treeview.heading('Баланс', text='Баланс')
+        self.account_treeview.heading('Валюта', text='Валюта')
+        self.account_treeview.column('Валюта', width=60)
         self.account_treeview.pack()
 
+        # Списки обновляются по разнице с последним результатом запроса
+        self.category_sync = TreeviewSync(self.category_treeview)
+        self.budget_sync = TreeviewSync(self.budget_treeview)
+        self.user_sync = TreeviewSync(self.user_treeview)
+        self.account_sync = TreeviewSync(self.account_treeview)
+
+        # Регулярные платежи, пропущенные с прошлого запуска, создаются одной пачкой.
+        # Запросы DBWorker выполняются по порядку, поэтому списки ниже уже увидят их
+        self.worker.submit('run_recurring_rules')
+
         self.refresh_transactions()
         
         self.add_transaction_button = tk.Button(self.transaction_frame, text="Добавить транзакцию", command=self.add_transaction)
@@ -339,8 +453,6 @@ class FinanceAppGUI:
         self.delete_transaction_button = tk.Button(self.transaction_frame, text="Удалить выбранную транзакцию", command=self.delete_transaction)
         self.delete_transaction_button.pack(pady=5)
         
-        self.delete_category_button = tk.Button(self.category_frame, text="Удалить выбранную категорию", command=self.delete_category)
-        self.delete_category_button.pack(pady=5)
 
         # добавляем кнопку и функцию для отображения бюджета
         self.budget_label = tk.Label(self.budget_frame, text="Бюджет:")
@@ -369,6 +481,9 @@ class FinanceAppGUI:
         self.add_account_button = tk.Button(self.account_frame, text="Добавить счет", command=self.add_account)
         self.add_account_button.pack(pady=5)
 
+        self.consolidated_button = tk.Button(self.account_frame, text="Сводный баланс", command=self.show_consolidated_balance)
+        self.consolidated_button.pack(pady=5)
+
         self.delete_user_button = tk.Button(self.user_frame, text="Удалить пользователя", command=self.delete_user)
         self.delete_user_button.pack(pady=5)
 
@@ -387,10 +502,10 @@ class FinanceAppGUI:
         category_label = tk.Label(dialog, text="Категория:")
         category_label.pack(padx=5, pady=5)
         category_var = tk.StringVar(dialog)
-        categories = self.app.get_categories()
-        category_options = [category[1] for category in categories]
-        category_dropdown = tk.OptionMenu(dialog, category_var, *category_options)
+        category_dropdown = tk.OptionMenu(dialog, category_var, '')
         category_dropdown.pack(padx=5, pady=5)
+        self.worker.submit('get_categories', callback=lambda categories: fill_option_menu(
+            category_dropdown, category_var, [category[1] for category in categories]))
 
         amount_label = tk.Label(dialog, text="Сумма:")
         amount_label.pack(padx=5, pady=5)
@@ -398,13 +513,24 @@ class FinanceAppGUI:
         amount_entry = tk.Entry(dialog)
         amount_entry.pack(padx=5, pady=5)
 
+        month_label = tk.Label(dialog, text="Месяц (ГГГГ-ММ, пусто - каждый месяц):")
+        month_label.pack(padx=5, pady=5)
+
+        month_entry = tk.Entry(dialog)
+        month_entry.pack(padx=5, pady=5)
+
         def add_budget_to_db():
             category = category_var.get()
             amount = amount_entry.get()
-            self.app.add_budget(category, amount)
-            messagebox.showinfo("Успех", "Бюджет успешно добавлен")
-            dialog.destroy()
-            self.refresh_budget()
+
+            def added(result):
+                messagebox.showinfo("Успех", "Бюджет успешно добавлен")
+                dialog.destroy()
+                self.refresh_budget()
+
+            self.worker.submit('add_budget', category, amount, month_entry.get().strip(), self.session.user_id,
+                               callback=added,
+                               errback=lambda e: messagebox.showerror("Ошибка ввода", str(e)))
 
         add_button = tk.Button(dialog, text="Добавить", command=add_budget_to_db)
         add_button.pack(pady=5)
@@ -429,10 +555,13 @@ class FinanceAppGUI:
         def add_user_to_db():
             username = username_entry.get()
             password = password_entry.get()
-            self.app.add_user(username, password)
-            messagebox.showinfo("Успех", "Пользователь успешно добавлен")
-            dialog.destroy()
-            self.refresh_users()
+
+            def added(result):
+                messagebox.showinfo("Успех", "Пользователь успешно добавлен")
+                dialog.destroy()
+                self.refresh_users()
+
+            self.worker.submit('add_user', username, password, callback=added)
 
         add_button = tk.Button(dialog, text="Добавить", command=add_user_to_db)
         add_button.pack(pady=5)
@@ -446,10 +575,10 @@ class FinanceAppGUI:
         user_label = tk.Label(dialog, text="Пользователь:")
         user_label.pack(padx=5, pady=5)
         user_var = tk.StringVar(dialog)
-        users = self.app.get_users()
-        user_options = [user[1] for user in users]
-        user_dropdown = tk.OptionMenu(dialog, user_var, *user_options)
+        user_dropdown = tk.OptionMenu(dialog, user_var, '')
         user_dropdown.pack(padx=5, pady=5)
+        self.worker.submit('get_users', user_id=self.session.user_id, callback=lambda users: fill_option_menu(
+            user_dropdown, user_var, [user[1] for user in users]))
 
         user_entry = tk.Entry(dialog)
         user_entry.pack(padx=5, pady=5)
@@ -466,229 +595,279 @@ class FinanceAppGUI:
         balance_entry = tk.Entry(dialog)
         balance_entry.pack(padx=5, pady=5)
 
+        currency_label = tk.Label(dialog, text="Валюта:")
+        currency_label.pack(padx=5, pady=5)
+
+        currency_entry = tk.Entry(dialog)
+        currency_entry.insert(0, BASE_CURRENCY)
+        currency_entry.pack(padx=5, pady=5)
+
         def add_account_to_db():
             user = user_var.get()
             name = name_entry.get()
             balance = balance_entry.get()
-            self.app.add_account(user, name, balance)
-            messagebox.showinfo("Успех", "Счет успешно добавлен")
-            dialog.destroy()
-            self.refresh_accounts()
+            currency = currency_entry.get()
+
+            def added(result):
+                messagebox.showinfo("Успех", "Счет успешно добавлен")
+                dialog.destroy()
+                self.refresh_accounts()
+
+            self.worker.submit('add_account', user, name, balance, currency, callback=added,
+                               errback=lambda e: messagebox.showerror("Ошибка", f"Ошибка при добавлении счета: {e}"))
 
         add_button = tk.Button(dialog, text="Добавить", command=add_account_to_db)
         add_button.pack(pady=5)
             
+    def show_consolidated_balance(self):
+        # Балансы счетов пользователя в базовой валюте по последним курсам
+        def show(result):
+            rows, total = result
+            lines = [f"{row[2]}: {row[3]} {row[4]} = {row[5]} {BASE_CURRENCY}" for row in rows]
+            lines.append(f"Итого: {total} {BASE_CURRENCY}")
+            messagebox.showinfo("Сводный баланс", "\n".join(lines))
+
+        self.worker.submit('get_consolidated_balances', user_id=self.session.user_id, callback=show,
+                           errback=lambda e: messagebox.showerror("Ошибка", f"Не удалось свести балансы: {e}"))
+
     def delete_transaction(self):
         selected_item = self.transaction_treeview.selection()
         if selected_item:
-            transaction_id = selected_item[0]  
-            transaction_id_numeric = int(transaction_id[1:])
-            # Получаем список всех транзакций
-            transactions = self.app.get_transactions()
-            # Проверяем, существует ли транзакция с заданным идентификатором
-            if any(transaction[0] == transaction_id_numeric for transaction in transactions):
-                # Удаляем транзакцию
-                self.app.delete_transaction(transaction_id_numeric)
-                # Удаляем выбранный элемент из таблицы транзакций на форме
-                self.transaction_treeview.delete(transaction_id)
-                # Обновляем список транзакций
+            transaction_id = selected_item[0]
+            transaction_id_numeric = int(transaction_id)
+
+            def deleted(result):
+                # Обновляем список транзакций и балансы счетов
                 self.refresh_transactions()
-                # Обновляем другие таблицы
-                self.refresh_categories()
-                self.refresh_users()
                 self.refresh_accounts()
                 self.refresh_budget()
                 messagebox.showinfo("Успех", "Транзакция успешно удалена")
-            else:
-                messagebox.showerror("Ошибка", "Выбранная транзакция не существует!")
+
+            def checked(exists):
+                # Проверяем, существует ли транзакция с заданным идентификатором
+                if exists:
+                    # Удаляем транзакцию
+                    self.worker.submit('delete_transaction', transaction_id_numeric, user_id=self.session.user_id, callback=deleted,
+                                       errback=lambda e: messagebox.showerror("Ошибка", f"Ошибка при удалении транзакции: {e}"))
+                else:
+                    messagebox.showerror("Ошибка", "Выбранная транзакция не существует!")
+
+            self.worker.submit('transaction_exists', transaction_id_numeric, callback=checked)
         else:
             messagebox.showwarning("Предупреждение", "Выберите транзакцию для удаления!")
 
-    def delete_category(self):
-        selected_items = self.category_treeview.selection()
-        if selected_items:
-            for item_id in selected_items:
-                try:
-                    # Удалить категорию
-                    self.app.delete_category(int(item_id))
-                    # Удалить выбранный элемент из таблицы категорий на форме
-                    self.category_treeview.delete(item_id)
-                    # Обновить другие таблицы
-                    self.refresh_transactions()
-                    self.refresh_budget()
-                    messagebox.showinfo("Успех", "Категория успешно удалена")
-                except Exception as e:
-                    messagebox.showerror("Ошибка", f"Произошла ошибка при удалении категории: {e}")
-        else:
-            messagebox.showwarning("Предупреждение", "Выберите категорию для удаления!")
-            
     def delete_user(self):
         selected_items = self.user_treeview.selection()
         if selected_items:
+            def deleted(result):
+                # Обновить таблицу пользователей на форме
+                self.refresh_users()
+                # Каскадно удалены счета пользователя и их транзакции
+                self.refresh_accounts()
+                self.refresh_transactions()
+                self.refresh_budget()
+                messagebox.showinfo("Успех", "Пользователь успешно удален")
+
             for item_id in selected_items:
-                try:
-                    # Удалить пользователя
-                    self.app.delete_user(int(item_id))
-                    # Удалить выбранный элемент из таблицы пользователей на форме
-                    self.user_treeview.delete(item_id)
-                    # Обновить другие таблицы
-                    self.refresh_transactions()
-                    messagebox.showinfo("Успех", "Пользователь успешно удален")
-                except Exception as e:
-                    messagebox.showerror("Ошибка", f"Произошла ошибка при удалении пользователя: {e}")
+                # Удалить пользователя
+                self.worker.submit('delete_user', int(item_id), callback=deleted,
+                                   errback=lambda e: messagebox.showerror("Ошибка", f"Произошла ошибка при удалении пользователя: {e}"))
         else:
             messagebox.showwarning("Предупреждение", "Выберите пользователя для удаления!")
 
     def delete_account(self):
         selected_items = self.account_treeview.selection()
         if selected_items:
+            def deleted(result):
+                # Обновить таблицу счетов на форме
+                self.refresh_accounts()
+                # Каскадно удалены транзакции счета
+                self.refresh_transactions()
+                self.refresh_budget()
+                messagebox.showinfo("Успех", "Счет успешно удален")
+
             for item_id in selected_items:
-                try:
-                    # Удалить счет
-                    self.app.delete_account(int(item_id))
-                    # Удалить выбранный элемент из таблицы счетов на форме
-                    self.account_treeview.delete(item_id)
-                    # Обновить другие таблицы
-                    self.refresh_transactions()
-                    messagebox.showinfo("Успех", "Счет успешно удален")
-                except Exception as e:
-                    messagebox.showerror("Ошибка", f"Произошла ошибка при удалении счета: {e}")
+                # Удалить счет
+                self.worker.submit('delete_account', int(item_id), user_id=self.session.user_id, callback=deleted,
+                                   errback=lambda e: messagebox.showerror("Ошибка", f"Произошла ошибка при удалении счета: {e}"))
         else:
             messagebox.showwarning("Предупреждение", "Выберите счет для удаления!")
 
     def delete_budget(self):
         selected_items = self.budget_treeview.selection()
         if selected_items:
+            def deleted(result):
+                # Обновить таблицу бюджетов на форме
+                self.refresh_budget()
+                messagebox.showinfo("Успех", "Бюджет успешно удален")
+
             for item_id in selected_items:
-                try:
-                    # Удалить бюджет
-                    self.app.delete_budget(int(item_id))
-                    # Удалить выбранный элемент из таблицы бюджетов на форме
-                    self.budget_treeview.delete(item_id)
-                    # Обновить другие таблицы
-                    self.refresh_transactions()
-                    messagebox.showinfo("Успех", "Бюджет успешно удален")
-                except Exception as e:
-                    messagebox.showerror("Ошибка", f"Произошла ошибка при удалении бюджета: {e}")
+                # Удалить бюджет
+                self.worker.submit('delete_budget', int(item_id), user_id=self.session.user_id, callback=deleted,
+                                   errback=lambda e: messagebox.showerror("Ошибка", f"Произошла ошибка при удалении бюджета: {e}"))
         else:
             messagebox.showwarning("Предупреждение", "Выберите бюджет для удаления!")
 
+    def run_recurring_rules(self):
+        def done(count):
+            self.refresh_transactions()
+            self.refresh_accounts()
+            self.refresh_budget()
+            messagebox.showinfo("Регулярные платежи", f"Создано транзакций: {count}")
+
+        self.worker.submit('run_recurring_rules', callback=done)
+
+    def add_recurring_rule(self):
+        # Диалог правила регулярного платежа: зарплата, аренда, коммунальные услуги
+        dialog = tk.Toplevel(self.master)
+        dialog.title("Регулярный платеж")
+
+        tk.Label(dialog, text="Сумма:").grid(row=0, column=0, padx=5, pady=5)
+        amount_entry = tk.Entry(dialog)
+        amount_entry.grid(row=0, column=1, padx=5, pady=5)
+
+        tk.Label(dialog, text="Категория:").grid(row=1, column=0, padx=5, pady=5)
+        category_var = tk.StringVar(dialog)
+        category_dropdown = tk.OptionMenu(dialog, category_var, '')
+        category_dropdown.grid(row=1, column=1, padx=5, pady=5)
+        self.worker.submit('get_categories', callback=lambda categories: fill_option_menu(
+            category_dropdown, category_var, [category[1] for category in categories]))
+
+        tk.Label(dialog, text="Описание:").grid(row=2, column=0, padx=5, pady=5)
+        description_entry = tk.Entry(dialog)
+        description_entry.grid(row=2, column=1, padx=5, pady=5)
+
+        tk.Label(dialog, text="Первая дата:").grid(row=3, column=0, padx=5, pady=5)
+        start_entry = tk.Entry(dialog)
+        start_entry.grid(row=3, column=1, padx=5, pady=5)
+
+        tk.Label(dialog, text="Повторять:").grid(row=4, column=0, padx=5, pady=5)
+        frequency_var = tk.StringVar(dialog, value=next(iter(FREQUENCY_LABELS)))
+        tk.OptionMenu(dialog, frequency_var, *FREQUENCY_LABELS).grid(row=4, column=1, padx=5, pady=5)
+
+        tk.Label(dialog, text="Последняя дата (необязательно):").grid(row=5, column=0, padx=5, pady=5)
+        end_entry = tk.Entry(dialog)
+        end_entry.grid(row=5, column=1, padx=5, pady=5)
+
+        tk.Label(dialog, text="Тип:").grid(row=6, column=0, padx=5, pady=5)
+        type_var = tk.StringVar(dialog)
+        type_dropdown = tk.OptionMenu(dialog, type_var, '')
+        type_dropdown.grid(row=6, column=1, padx=5, pady=5)
+        self.worker.submit('get_transaction_types', callback=lambda types: fill_option_menu(
+            type_dropdown, type_var, [type[1] for type in types]))
+
+        tk.Label(dialog, text="Счет:").grid(row=7, column=0, padx=5, pady=5)
+        account_var = tk.StringVar(dialog)
+        account_ids = {}
+        account_dropdown = tk.OptionMenu(dialog, account_var, '')
+        account_dropdown.grid(row=7, column=1, padx=5, pady=5)
+
+        def fill_accounts(accounts):
+            account_ids.update((f"{account[2]} ({account[1]})", account[0]) for account in accounts)
+            fill_option_menu(account_dropdown, account_var, list(account_ids))
+
+        self.worker.submit('get_accounts_view', user_id=self.session.user_id, callback=fill_accounts)
+
+        def add_rule_to_db():
+            account_id = account_ids.get(account_var.get())
+            if account_id is None:
+                messagebox.showerror("Ошибка", "Выберите счет")
+                return
+            if not type_var.get():
+                messagebox.showerror("Ошибка", "Выберите тип")
+                return
+
+            def added(result):
+                dialog.destroy()
+                # Повторения, срок которых уже наступил, создаются сразу
+                self.run_recurring_rules()
+
+            self.worker.submit('add_recurring_rule', amount_entry.get(), category_var.get(), description_entry.get(),
+                               start_entry.get(), FREQUENCY_LABELS[frequency_var.get()],
+                               type_name=type_var.get(), account_id=account_id,
+                               end_date=end_entry.get().strip() or None, callback=added,
+                               errback=lambda e: messagebox.showerror("Ошибка ввода", str(e)))
+
+        tk.Button(dialog, text="Добавить", command=add_rule_to_db).grid(row=8, column=0, columnspan=2, padx=5, pady=5)
+
+    def show_query_stats(self):
+        def show(report):
+            if report is None:
+                messagebox.showinfo("Статистика запросов",
+                                    "Профилирование выключено. Запустите приложение с FINANCE_PROFILE=1")
+                return
+            dialog = tk.Toplevel(self.master)
+            dialog.title("Статистика запросов")
+            columns = ('Вызовов', 'Всего, мс', 'p50', 'p95', 'p99', 'Строк', 'Запрос')
+            treeview = ttk.Treeview(dialog, columns=columns, show="headings", height=15)
+            for column in columns:
+                treeview.heading(column, text=column)
+                treeview.column(column, width=70, anchor="e")
+            treeview.column('Запрос', width=600, anchor="w")
+            for stats in report['statements']:
+                treeview.insert('', 'end', values=(
+                    stats['count'], f"{stats['total_ms']:.1f}", f"{stats['p50_ms']:.2f}", f"{stats['p95_ms']:.2f}",
+                    f"{stats['p99_ms']:.2f}", stats['rows'], stats['sql']))
+            treeview.pack(fill="both", expand=True, padx=5, pady=5)
+
+            tk.Label(dialog, text=f"Медленные запросы (>= {report['slow_ms']} мс):").pack(anchor="w", padx=5)
+            slow_text = tk.Text(dialog, height=12, width=120)
+            for entry in reversed(report['slow']):
+                slow_text.insert('end', f"{entry['time']}  {entry['ms']:.1f} мс, строк {entry['rows']}: {entry['sql']}\n")
+                if entry['plan']:
+                    slow_text.insert('end', entry['plan'] + "\n")
+            slow_text.config(state="disabled")
+            slow_text.pack(fill="both", expand=True, padx=5, pady=5)
+
+        self.worker.submit('query_stats', callback=show)
+
+    def show_busy(self, busy):
+        self.busy_label.config(text="Загрузка..." if busy else "")
+        self.master.config(cursor="watch" if busy else "")
+
+    def on_search_changed(self, *args):
+        if self._search_after_id is not None:
+            self.master.after_cancel(self._search_after_id)
+        self._search_after_id = self.master.after(SEARCH_DELAY_MS, self.run_search)
+
+    def run_search(self):
+        self._search_after_id = None
+        self.search_query = self.search_var.get().strip()
+        self.refresh_transactions()
+
     # Методы обновления данных
     def refresh_transactions(self):
-        self.transaction_treeview.delete(*self.transaction_treeview.get_children())
-        transactions = self.app.get_transactions()
-        categories = self.app.get_categories()
-        category_ids = set(category[0] for category in categories)  # Создаем множество идентификаторов категорий
-        for transaction in transactions:
-            category_id = transaction[2]
-            # Проверяем, что категория существует в списке категорий
-            if category_id in category_ids:
-                category_name = self.app.get_category_name_by_id(category_id)
-                date = datetime.strptime(transaction[4], "%Y-%m-%d")
-                date_display = date.strftime("%Y-%m-%d")
-                self.transaction_treeview.insert('', 'end', values=(transaction[1], category_name, transaction[3], date_display))
+        if not self.search_query:
+            self.transaction_pager.refresh()
+            return
+        query = self.search_query
 
-    def refresh_categories(self):
-        self.category_treeview.delete(*self.category_treeview.get_children())
-        categories = self.app.get_categories()
-        category_ids = set(category[0] for category in categories)
-        for category in categories:
-            if category[0] in category_ids:
-                self.category_treeview.insert('', 'end', iid=category[0], values=(category[1],))
+        def found(transactions):
+            # Ответ на устаревший запрос не показываем
+            if query == self.search_query:
+                self.transaction_pager.show(transactions)
 
+        self.worker.submit('search_transactions', query, SEARCH_LIMIT, user_id=self.session.user_id, callback=found)
 
-    def refresh_users(self):
-        self.user_treeview.delete(*self.user_treeview.get_children())
-        users = self.app.get_users()
-        user_ids = set(user[0] for user in users)
-        for user in users:
-            if user[0] in user_ids:
-                self.user_treeview.insert('', 'end', iid=user[0], values=(user[1], user[2]))
-
-    def refresh_accounts(self):
-        self.account_treeview.delete(*self.account_treeview.get_children())
-        accounts = self.app.get_accounts()
-        account_ids = set(account[0] for account in accounts)
-        for account in accounts:
-            if account[0] in account_ids:
-                user_name = self.app.get_user_name_by_id(account[1])
-                self.account_treeview.insert('', 'end', iid=account[0], values=(user_name, account[2], account[3]))
-    
-    def refresh_budget(self):
-        self.budget_treeview.delete(*self.budget_treeview.get_children())
-        budgets = self.app.get_budget()
-        budget_ids = set(budget[0] for budget in budgets)
-        for budget in budgets:
-            if budget[0] in budget_ids:
-                category_name = self.app.get_category_name_by_id(budget[1])
-                self.budget_treeview.insert('', 'end', iid=budget[0], values=(category_name, budget[2]))
-    '''
+    def make_transaction_item(self, transaction):
+        # Название категории уже подставлено запросом TRANSACTION_VIEW_SQL, дата хранится в ISO-формате
+        return transaction[0], (transaction[1], transaction[2], transaction[3], transaction[4])
 
     def refresh_categories(self):
-        self.category_treeview.delete(*self.category_treeview.get_children())
-        categories = self.app.get_categories()
-        category_ids = set(category[0] for category in categories)
-        for category in categories:
-            if category[0] in category_ids:
-                # Проверяем связанные транзакции и удаляем их из treeview
-                transactions_to_delete = []
-                for item in self.transaction_treeview.get_children():
-                    if self.transaction_treeview.item(item, "values")[1] == category[1]:
-                        transactions_to_delete.append(item)
-                for item in transactions_to_delete:
-                    self.transaction_treeview.delete(item)
-                self.category_treeview.insert('', 'end', iid=category[0], values=(category[1],))
-                
+        self.worker.submit('get_categories', callback=lambda categories: self.category_sync.sync(
+            (category[0], (category[1],)) for category in categories))
+
     def refresh_users(self):
-        self.user_treeview.delete(*self.user_treeview.get_children())
-        users = self.app.get_users()
-        user_ids = set(user[0] for user in users)
-        for user in users:
-            if user[0] in user_ids:
-                # Проверяем связанные счета и удаляем их из treeview
-                accounts_to_delete = []
-                for item in self.account_treeview.get_children():
-                    if self.account_treeview.item(item, "values")[0] == user[1]:
-                        accounts_to_delete.append(item)
-                for item in accounts_to_delete:
-                    self.account_treeview.delete(item)
-
-                self.user_treeview.insert('', 'end', iid=user[0], values=(user[1], user[2]))
+        self.worker.submit('get_users', user_id=self.session.user_id, callback=lambda users: self.user_sync.sync(
+            (user[0], (user[1], user[2])) for user in users))
 
     def refresh_accounts(self):
-        self.account_treeview.delete(*self.account_treeview.get_children())
-        accounts = self.app.get_accounts()
-        account_ids = set(account[0] for account in accounts)
-        for account in accounts:
-            if account[0] in account_ids:
-                # Проверяем связанные транзакции и удаляем их из treeview
-                transactions_to_delete = []
-                for item in self.transaction_treeview.get_children():
-                    if self.transaction_treeview.item(item, "values")[0] == account[2]:
-                        transactions_to_delete.append(item)
-                for item in transactions_to_delete:
-                    self.transaction_treeview.delete(item)
-
-                user_name = self.app.get_user_name_by_id(account[1])
-                self.account_treeview.insert('', 'end', iid=account[0], values=(user_name, account[2], account[3]))
+        self.worker.submit('get_accounts_view', user_id=self.session.user_id, callback=lambda accounts: self.account_sync.sync(
+            (account[0], account[1:]) for account in accounts))
 
     def refresh_budget(self):
-        self.budget_treeview.delete(*self.budget_treeview.get_children())
-        budgets = self.app.get_budget()
-        budget_ids = set(budget[0] for budget in budgets)
-        for budget in budgets:
-            if budget[0] in budget_ids:
-                # Проверяем связанные транзакции и удаляем их из treeview
-                transactions_to_delete = []
-                for item in self.transaction_treeview.get_children():
-                    if self.transaction_treeview.item(item, "values")[1] == self.app.get_category_name_by_id(budget[1]):
-                        transactions_to_delete.append(item)
-                for item in transactions_to_delete:
-                    self.transaction_treeview.delete(item)
-
-                category_name = self.app.get_category_name_by_id(budget[1])
-                self.budget_treeview.insert('', 'end', iid=budget[0], values=(category_name, budget[2]))
-    '''
+        self.worker.submit('get_budget_view', user_id=self.session.user_id, callback=lambda budgets: self.budget_sync.sync(
+            (budget[0], budget[1:]) for budget in budgets))
     
     def add_transaction(self):
         # Создаем диалоговое окно для ввода данных о новой транзакции
@@ -703,10 +882,10 @@ class FinanceAppGUI:
         category_label = tk.Label(dialog, text="Категория:")
         category_label.grid(row=1, column=0, padx=5, pady=5)
         category_var = tk.StringVar(dialog)
-        categories = self.app.get_categories()
-        category_options = [category[1] for category in categories]
-        category_dropdown = tk.OptionMenu(dialog, category_var, *category_options)
+        category_dropdown = tk.OptionMenu(dialog, category_var, '')
         category_dropdown.grid(row=1, column=1, padx=5, pady=5)
+        self.worker.submit('get_categories', callback=lambda categories: fill_option_menu(
+            category_dropdown, category_var, [category[1] for category in categories]))
         
         description_label = tk.Label(dialog, text="Описание:")
         description_label.grid(row=2, column=0, padx=5, pady=5)
@@ -722,15 +901,29 @@ class FinanceAppGUI:
         type_label = tk.Label(dialog, text="Тип:")
         type_label.grid(row=4, column=0, padx=5, pady=5)
         type_var = tk.StringVar(dialog)
-        types = self.app.get_transaction_types()
-        type_options = [type[1] for type in types]
-        type_dropdown = tk.OptionMenu(dialog, type_var, *type_options)
+        type_dropdown = tk.OptionMenu(dialog, type_var, '')
         type_dropdown.grid(row=4, column=1, padx=5, pady=5)
+        self.worker.submit('get_transaction_types', callback=lambda types: fill_option_menu(
+            type_dropdown, type_var, [type[1] for type in types]))
         
         tags_label = tk.Label(dialog, text="Теги:")
         tags_label.grid(row=5, column=0, padx=5, pady=5)
         tags_entry = tk.Entry(dialog)
         tags_entry.grid(row=5, column=1, padx=5, pady=5)
+
+        account_label = tk.Label(dialog, text="Счет:")
+        account_label.grid(row=6, column=0, padx=5, pady=5)
+        account_var = tk.StringVar(dialog)
+        # Название счета с именем владельца -> id счета
+        account_ids = {}
+        account_dropdown = tk.OptionMenu(dialog, account_var, '')
+        account_dropdown.grid(row=6, column=1, padx=5, pady=5)
+
+        def fill_accounts(accounts):
+            account_ids.update((f"{account[2]} ({account[1]})", account[0]) for account in accounts)
+            fill_option_menu(account_dropdown, account_var, list(account_ids))
+
+        self.worker.submit('get_accounts_view', user_id=self.session.user_id, callback=fill_accounts)
                 
         # Добавляем возможность выбора даты из календаря
         def choose_date():
@@ -740,7 +933,6 @@ class FinanceAppGUI:
             def set_date():
                 selected_date = cal.selection_get()
                 formatted_date = selected_date.strftime("%d/%m/%Y")  # Ensure the output is in the right format
-                print(formatted_date)
                 date_var.set(formatted_date)
                 cal.destroy()  # Destroy the calendar widget after date is chosen
                 ok_button.destroy()  # Destroy the OK button after it's used
@@ -753,28 +945,45 @@ class FinanceAppGUI:
         
         def add_transaction_to_db():
             try:
-                amount = float(amount_entry.get())
+                amount = Money.parse(amount_entry.get())
                 category = category_var.get()
                 description = description_entry.get()
                 date_str = date_var.get()
                 
                 # Валидация и форматирование даты
-                date = self.app.validate_and_format_date(date_str)
+                date = FinanceApp.validate_and_format_date(date_str)
                 if not date:
                     messagebox.showerror("Ошибка", "Некорректный формат даты. Используйте формат DD/MM/YYYY.")
                     return
 
                 type_name = type_var.get() if type_var.get() != 'Выберите тип' else None
+                # Тип обязателен: от него зависит, уменьшит транзакция баланс или увеличит
+                if not type_name:
+                    messagebox.showerror("Ошибка", "Выберите тип")
+                    return
                 
-                self.app.add_transaction(amount, category, description, date, type_name, tags_entry.get())
-                messagebox.showinfo("Успех", "Транзакция успешно добавлена")
-                dialog.destroy()
-                self.refresh_transactions()
+
+                # Транзакция без счета не принадлежит пользователю и не попала бы в его список
+                account_id = account_ids.get(account_var.get())
+                if account_id is None:
+                    messagebox.showerror("Ошибка", "Выберите счет")
+                    return
+
+                def added(result):
+                    messagebox.showinfo("Успех", "Транзакция успешно добавлена")
+                    dialog.destroy()
+                    self.refresh_transactions()
+                    self.refresh_accounts()
+                    self.refresh_budget()
+
+                self.worker.submit('add_transaction', amount, category, description, date, type_name,
+                                   tags_entry.get(), account_id, callback=added,
+                                   errback=lambda e: messagebox.showerror("Ошибка ввода", str(e)))
             except ValueError as e:
                 messagebox.showerror("Ошибка ввода", str(e))
         
         add_button = tk.Button(dialog, text="Добавить", command=add_transaction_to_db)
-        add_button.grid(row=6, column=0, columnspan=2, padx=5, pady=5)
+        add_button.grid(row=7, column=0, columnspan=2, padx=5, pady=5)
     
     def add_category(self):
         # Создаем диалоговое окно для ввода названия новой категории
@@ -789,16 +998,24 @@ class FinanceAppGUI:
         
         def add_category_to_db():
             category = category_entry.get()
-            self.app.add_category(category)
-            messagebox.showinfo("Успех", "Категория успешно добавлена")
-            dialog.destroy()
-            self.refresh_categories()
+
+            def added(result):
+                messagebox.showinfo("Успех", "Категория успешно добавлена")
+                dialog.destroy()
+                self.refresh_categories()
+
+            self.worker.submit('add_category', category, callback=added)
         
         add_button = tk.Button(dialog, text="Добавить", command=add_category_to_db)
         add_button.pack(pady=5)
 
 if __name__ == "__main__":
     root = tk.Tk()
-    app = FinanceApp('finance.db')
-    login_window = LoginWindow(root, app)
+    # Профилирование запросов включается переменной окружения; отчет выводится при выходе
+    profiler = QueryStats.from_env()
+    if profiler is not None:
+        atexit.register(profiler.dump, os.environ.get('FINANCE_PROFILE_FILE'))
+    # Соединение с базой открывается и используется только в потоке DBWorker
+    worker = DBWorker(root, lambda: FinanceApp('finance.db', profiler=profiler))
+    login_window = LoginWindow(root, worker)
     root.mainloop()
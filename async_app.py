@@ -0,0 +1,136 @@
+""" Асинхронный фасад FinanceApp для asyncio.
+
+AsyncFinanceApp владеет своим FinanceApp и двумя ограниченными пулами потоков:
+- запись и все методы, которые трогают соединение для записи, выполняются в одном
+  потоке, которому принадлежит это соединение, поэтому они строго последовательны;
+- методы из CONCURRENT_READ_METHODS идут через пул соединений для чтения в
+  read_workers потоках параллельно друг с другом и с записью (WAL).
+
+Любой публичный метод FinanceApp доступен как корутина с тем же именем и
+аргументами. Сотни корутин могут вызывать один AsyncFinanceApp одновременно:
+вызовы ждут в очереди пула, цикл событий не блокируется. Отмена корутины не
+отменяет уже начатый вызов - запись будет зафиксирована.
+
+Пример:
+    async with AsyncFinanceApp('finance.db') as app:
+        page, budget = await asyncio.gather(app.get_transactions_page(limit=50),
+                                            app.get_budget_status(user_id=1))
+        await app.add_transaction('12.50', 'Продукты', 'Хлеб', '2024-05-01')
+        async with aclosing(app.iter_transactions_export(start='2024-01-01')) as rows:
+            async for row in rows:
+                ...
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from finance_app import CONCURRENT_READ_METHODS, FinanceApp, FinanceError
+
+
+class AsyncFinanceApp:
+    """ FinanceApp для корутин: параллельное чтение через пул, запись в одном потоке """
+
+    def __init__(self, db_file, pragmas=None, read_workers=4, profiler=None):
+        self.db_file = db_file
+        self.pragmas = pragmas
+        self.read_workers = read_workers
+        self.profiler = profiler
+        self.app = None
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='finance-writer')
+        self._reader = ThreadPoolExecutor(max_workers=max(1, read_workers), thread_name_prefix='finance-reader')
+        # Открытый экспорт держит соединение из пула между порциями. Соединений на одно
+        # больше, чем экспортов, поэтому обычное чтение всегда может дождаться свободного
+        self._export_slots = asyncio.Semaphore(max(1, read_workers))
+
+    async def open(self):
+        """ Открывает базу (с миграциями) в потоке записи; возвращает self """
+        if self.app is None:
+            # Соединение для записи создается в потоке, который будет им пользоваться
+            self.app = await self._run(self._writer, FinanceApp, self.db_file, self.pragmas,
+                                       read_pool_size=max(1, self.read_workers) + 1, profiler=self.profiler)
+        return self
+
+    async def close(self):
+        """ Дожидается начатых вызовов и закрывает соединения """
+        if self.app is not None:
+            await asyncio.to_thread(self._reader.shutdown)
+            await self._run(self._writer, self._close_app)
+        await asyncio.to_thread(self._writer.shutdown)
+
+    def _close_app(self):
+        # Последняя ссылка на FinanceApp освобождается в потоке записи: соединение
+        # для записи нельзя закрывать (в том числе из __del__) в другом потоке
+        app, self.app = self.app, None
+        app.close()
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def __getattr__(self, name):
+        if name.startswith('_') or not callable(getattr(FinanceApp, name, None)):
+            raise AttributeError(name)
+        method = functools.partial(self.call, name)
+        functools.update_wrapper(method, getattr(FinanceApp, name))
+        return method
+
+    @staticmethod
+    async def _run(executor, function, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(executor, functools.partial(function, *args, **kwargs))
+
+    def _executor(self, method):
+        # Без пула чтения (база в памяти) все вызовы идут через поток записи
+        if method in CONCURRENT_READ_METHODS and self.app.read_pool is not None:
+            return self._reader
+        return self._writer
+
+    async def call(self, method, *args, **kwargs):
+        """ Вызывает метод FinanceApp по имени в подходящем пуле и возвращает результат """
+        if self.app is None:
+            raise FinanceError("AsyncFinanceApp не открыт: вызовите open() или используйте async with")
+        return await self._run(self._executor(method), getattr(self.app, method), *args, **kwargs)
+
+    async def iter_transactions(self, page_size=500, user_id=None):
+        """ Асинхронный итератор по строкам get_transactions_page в порядке (date DESC, id DESC).
+
+        Каждая страница - отдельный запрос по ключу (date, id) последней строки, поэтому
+        между страницами соединения не удерживаются, а в памяти одна страница.
+        """
+        after = None
+        while True:
+            rows = await self.call('get_transactions_page', after=after, limit=page_size, user_id=user_id)
+            for row in rows:
+                yield row
+            if len(rows) < page_size:
+                break
+            after = (rows[-1][4], rows[-1][0])
+
+    async def iter_transactions_export(self, start=None, end=None, account_id=None, fetch_size=1000, user_id=None):
+        """ Асинхронный итератор по строкам FinanceApp.iter_transactions_export.
+
+        Строки читаются порциями по fetch_size в пуле чтения одним запросом (согласованный
+        снимок). Итератор держит соединение из пула, пока не дочитан или не закрыт:
+        прерывая цикл, закрывайте его через contextlib.aclosing.
+        """
+        if self.app is None:
+            raise FinanceError("AsyncFinanceApp не открыт: вызовите open() или используйте async with")
+        executor = self._reader if self.app.read_pool is not None else self._writer
+        async with self._export_slots:
+            rows = self.app.iter_transactions_export(start, end, account_id, fetch_size, user_id)
+            try:
+                while True:
+                    chunk = await self._run(executor, next_chunk, rows, fetch_size)
+                    for row in chunk:
+                        yield row
+                    if len(chunk) < fetch_size:
+                        break
+            finally:
+                # Генератор возвращает соединение в пул в своем finally
+                await self._run(executor, rows.close)
+
+
+def next_chunk(rows, size):
+    """ До size следующих элементов итератора rows списком """
+    return [row for _, row in zip(range(size), rows)]
@@ -1,8 +1,9 @@
 import sqlite3
 from datetime import datetime
+import migrations
 
-def create_database():
-    conn = sqlite3.connect('finance.db')
+def create_database(db_file='finance.db'):
+    conn = sqlite3.connect(db_file)
     cursor = conn.cursor()
 
     # Создание таблицы категорий
@@ -79,8 +80,8 @@ def create_database():
     conn.commit()
     conn.close()
 
-def populate_initial_data():
-    conn = sqlite3.connect('finance.db')
+def populate_initial_data(db_file='finance.db'):
+    conn = sqlite3.connect(db_file)
     cursor = conn.cursor()
 
     # Добавление начальных данных, если необходимо
@@ -132,3 +133,6 @@ def populate_initial_data():
 if __name__ == "__main__":
     create_database()
     populate_initial_data()
+    conn = sqlite3.connect('finance.db')
+    migrations.migrate(conn)
+    conn.close()
@@ -0,0 +1,175 @@
+""" Нагрузочный тест HTTP-сервиса server.py локальным клиентом.
+
+Несколько потоков держат по одному соединению HTTP/1.1 и в течение заданного времени
+читают страницы транзакций, ищут по описаниям и добавляют транзакции пачками.
+В конце печатается пропускная способность и задержки по каждому виду запросов.
+
+Пример:
+    python bench_server.py --db bench.db --threads 8 --duration 10
+    python bench_server.py --url http://127.0.0.1:8765 --write-ratio 0.2 --json
+"""
+import argparse
+import http.client
+import json
+import random
+import sys
+import threading
+import time
+from urllib.parse import quote, urlsplit
+
+SEARCH_WORDS = ('покупка', 'магазин', 'зарплата', 'такси', 'кофе')
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+class Client:
+    """ Соединение keep-alive с сервисом; request возвращает (статус, JSON) """
+
+    def __init__(self, host, port):
+        self.connection = http.client.HTTPConnection(host, port, timeout=30)
+
+    def request(self, method, path, body=None):
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        headers = {'Content-Type': 'application/json'} if data else {}
+        self.connection.request(method, path, body=data, headers=headers)
+        response = self.connection.getresponse()
+        return response.status, json.loads(response.read())
+
+    def close(self):
+        self.connection.close()
+
+
+def run_worker(host, port, deadline, categories, write_ratio, batch_size, results):
+    client = Client(host, port)
+    latencies = {'page': [], 'search': [], 'batch': []}
+    errors = 0
+    inserted = 0
+    try:
+        while time.perf_counter() < deadline:
+            roll = random.random()
+            if roll < write_ratio:
+                kind = 'batch'
+                rows = [{
+                    'amount': f"{random.randint(1, 500000) / 100:.2f}",
+                    'category': random.choice(categories),
+                    'description': f"{random.choice(SEARCH_WORDS)} нагрузочный тест",
+                    'date': f"2024-{random.randint(1, 12):02d}-{random.randint(1, 28):02d}",
+                    'type': 'Расход',
+                } for _ in range(batch_size)]
+                method, path, body = 'POST', '/transactions/batch', {'transactions': rows}
+            elif roll < write_ratio + (1 - write_ratio) / 2:
+                kind, method, path, body = 'page', 'GET', '/transactions?limit=50', None
+            else:
+                kind, method, path, body = 'search', 'GET', f"/transactions/search?q={quote(random.choice(SEARCH_WORDS))}&limit=20", None
+            started = time.perf_counter()
+            try:
+                status, payload = client.request(method, path, body)
+            except (OSError, http.client.HTTPException):
+                # Соединение оборвано - считаем ошибкой и открываем новое
+                errors += 1
+                client.close()
+                client = Client(host, port)
+                continue
+            latencies[kind].append(time.perf_counter() - started)
+            if status >= 400:
+                errors += 1
+            elif kind == 'batch':
+                inserted += payload['inserted']
+    finally:
+        client.close()
+    results.append((latencies, errors, inserted))
+
+
+def benchmark(host, port, threads=8, duration=10.0, write_ratio=0.1, batch_size=100):
+    """ Запускает нагрузку и возвращает словарь с результатами """
+    setup = Client(host, port)
+    status, payload = setup.request('GET', '/categories')
+    setup.close()
+    categories = [category['name'] for category in payload.get('categories', [])]
+    if not categories:
+        raise RuntimeError("В базе нет категорий для добавления транзакций")
+
+    results = []
+    started = time.perf_counter()
+    deadline = started + duration
+    workers = [threading.Thread(target=run_worker,
+                                args=(host, port, deadline, categories, write_ratio, batch_size, results))
+               for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    report = {'threads': threads, 'seconds': elapsed, 'write_ratio': write_ratio, 'batch_size': batch_size,
+              'requests': 0, 'errors': sum(errors for _, errors, _ in results),
+              'rows_inserted': sum(inserted for _, _, inserted in results), 'operations': {}}
+    for kind in ('page', 'search', 'batch'):
+        values = sorted(value for latencies, _, _ in results for value in latencies[kind])
+        report['requests'] += len(values)
+        report['operations'][kind] = {
+            'count': len(values),
+            'per_second': len(values) / elapsed,
+            'p50_ms': percentile(values, 0.50) * 1000,
+            'p95_ms': percentile(values, 0.95) * 1000,
+            'p99_ms': percentile(values, 0.99) * 1000,
+        }
+    report['requests_per_second'] = report['requests'] / elapsed
+    report['rows_inserted_per_second'] = report['rows_inserted'] / elapsed
+    return report
+
+
+def print_report(report):
+    print(f"Потоков: {report['threads']}, время: {report['seconds']:.1f} с, "
+          f"запросов: {report['requests']} ({report['requests_per_second']:.0f}/с), ошибок: {report['errors']}")
+    print(f"Добавлено строк: {report['rows_inserted']} ({report['rows_inserted_per_second']:.0f}/с)")
+    for kind, stats in report['operations'].items():
+        print(f"  {kind:7} {stats['count']:7d} запросов {stats['per_second']:8.0f}/с  "
+              f"p50 {stats['p50_ms']:6.1f} мс  p95 {stats['p95_ms']:6.1f} мс  p99 {stats['p99_ms']:6.1f} мс")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный тест HTTP-сервиса FinanceApp")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--url', default='http://127.0.0.1:8765', help="адрес запущенного server.py")
+    target.add_argument('--db', help="запустить сервис на этой базе внутри процесса")
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10.0, help="секунд нагрузки")
+    parser.add_argument('--write-ratio', type=float, default=0.1, help="доля запросов на запись")
+    parser.add_argument('--batch-size', type=int, default=100, help="транзакций в одном запросе на запись")
+    parser.add_argument('--json', action='store_true', help="вывести результат в JSON")
+    args = parser.parse_args(argv)
+
+    server = app = None
+    if args.db:
+        # Импорт здесь: для нагрузки на внешний сервис FinanceApp не нужен
+        from finance_app import FinanceApp
+        from server import make_server
+        app = FinanceApp(args.db, read_pool_size=args.threads, check_same_thread=False)
+        server = make_server(app, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        host, port = server.server_address[:2]
+    else:
+        url = urlsplit(args.url)
+        host, port = url.hostname, url.port or 80
+
+    try:
+        report = benchmark(host, port, args.threads, args.duration, args.write_ratio, args.batch_size)
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+            app.close()
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+    return 0 if not report['errors'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,230 @@
+""" Замеры времени основных операций FinanceApp на копии базы.
+
+Исходная база не меняется: замеры идут на временной копии, сделанной через
+backup API SQLite. Каждая операция повторяется --repeat раз; в результате
+минимум, медиана, среднее и максимум в миллисекундах. Результат в JSON можно
+сохранить и сравнить с замером другого коммита.
+
+Пример:
+    python generate_data.py bench.db --transactions 1000000
+    python benchmark.py bench.db --output before.json
+    python benchmark.py bench.db --output after.json
+    python benchmark.py --compare before.json after.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+import connection
+from finance_app import FinanceApp
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def copy_database(source, target):
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(target)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+
+def timed(function, repeat):
+    """ Вызывает function repeat раз; возвращает (длительности в секундах, результат последнего вызова) """
+    durations = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        durations.append(time.perf_counter() - started)
+    return durations, result
+
+
+def summarize(durations, rows=None):
+    values = [value * 1000 for value in durations]
+    stats = {
+        'runs': len(values),
+        'min_ms': min(values),
+        'median_ms': statistics.median(values),
+        'mean_ms': statistics.fmean(values),
+        'max_ms': max(values),
+    }
+    if rows is not None:
+        stats['rows'] = rows
+    return stats
+
+
+def sample_rows(app, count):
+    """ Строки для add_transactions_bulk на существующих категориях и счетах """
+    categories = [name for _, name in app.get_categories()]
+    accounts = [row[0] for row in app.get_accounts()] or [None]
+    today = date.today()
+    return [(f"{random.randint(100, 500000) / 100:.2f}", random.choice(categories), "Замер производительности",
+             (today - timedelta(days=random.randrange(365))).isoformat(), 'Расход', None, random.choice(accounts))
+            for _ in range(count)]
+
+
+def run_benchmarks(app, conn, repeat=5, inserts=200, bulk_size=10000, deletes=200):
+    """ Замеры операций на открытой app; возвращает словарь имя -> статистика.
+
+    conn - отдельное соединение с той же базой для служебных запросов самого замера
+    (выбор глубокой страницы и удаляемых строк), чтобы они не шли через FinanceApp.
+    """
+    results = {}
+
+    def record(name, function, runs=repeat, rows=None):
+        durations, result = timed(function, runs)
+        if rows is None and isinstance(result, list):
+            rows = len(result)
+        results[name] = summarize(durations, rows)
+        return result
+
+    if not app.get_categories():
+        raise RuntimeError("В базе нет категорий: сначала заполните ее generate_data.py")
+
+    # Запись: одиночные транзакции (по коммиту на каждую) и пакетная вставка
+    single = iter(sample_rows(app, inserts))
+    record('add_transaction', lambda: app.add_transaction(*next(single)), runs=inserts)
+    bulk = sample_rows(app, bulk_size)
+    record('add_transactions_bulk', lambda: app.add_transactions_bulk(bulk), runs=1, rows=bulk_size)
+
+    # Чтение: полная выборка, выборка для окна и постраничный просмотр
+    record('get_transactions', app.get_transactions)
+    record('get_transactions_view', app.get_transactions_view)
+    first_page = record('get_transactions_page.first', lambda: app.get_transactions_page(limit=200))
+    # Глубокая страница - из середины истории: keyset не должен зависеть от смещения
+    total = conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+    deep = conn.execute("SELECT date, id FROM transactions ORDER BY date DESC, id DESC LIMIT 1 OFFSET ?",
+                        (total // 2,)).fetchone()
+    if deep:
+        record('get_transactions_page.deep', lambda: app.get_transactions_page(after=tuple(deep), limit=200))
+    if first_page:
+        word = (first_page[0][3] or '').split()
+        if word:
+            record('search_transactions', lambda: app.search_transactions(word[0], limit=50))
+
+    # Бюджет и теги
+    month = datetime.now().strftime("%Y-%m")
+    record('get_budget_status', lambda: app.get_budget_status(month))
+    record('get_budget_view', lambda: app.get_budget_view(month))
+    tag_counts = record('get_tag_counts', app.get_tag_counts)
+    if tag_counts:
+        top_tags = [name for name, _ in tag_counts[:2]]
+        record('get_transactions_by_tags.any', lambda: app.get_transactions_by_tags(top_tags, match_all=False, limit=200))
+
+    # Удаление: самые свежие строки, включая только что добавленные
+    ids = iter([row[0] for row in conn.execute("SELECT id FROM transactions ORDER BY id DESC LIMIT ?", (deletes,))])
+    if deletes:
+        record('delete_transaction', lambda: app.delete_transaction(next(ids)), runs=min(deletes, total))
+    return results
+
+
+def benchmark(db_file, repeat=5, inserts=200, bulk_size=10000, deletes=200, label=None, seed=42):
+    """ Замеры на временной копии db_file; возвращает отчет для JSON """
+    random.seed(seed)
+    with tempfile.TemporaryDirectory() as directory:
+        work_file = os.path.join(directory, 'bench.db')
+        copy_database(db_file, work_file)
+        app = FinanceApp(work_file)
+        conn = connection.connect(work_file, read_only=True)
+        try:
+            transactions = conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+            operations = run_benchmarks(app, conn, repeat, inserts, bulk_size, deletes)
+        finally:
+            conn.close()
+            app.close()
+    return {
+        'label': label,
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'database': os.path.abspath(db_file),
+        'transactions': transactions,
+        'operations': operations,
+    }
+
+
+def compare(old, new):
+    """ Строки сравнения двух отчетов по медиане: (операция, было, стало, отношение) """
+    rows = []
+    for name in sorted(set(old['operations']) | set(new['operations'])):
+        before = old['operations'].get(name, {}).get('median_ms')
+        after = new['operations'].get(name, {}).get('median_ms')
+        ratio = after / before if before and after is not None else None
+        rows.append((name, before, after, ratio))
+    return rows
+
+
+def print_report(report):
+    print(f"{report.get('label') or report.get('commit') or ''}  транзакций: {report['transactions']}, "
+          f"Python {report['python']}, SQLite {report['sqlite']}")
+    for name, stats in report['operations'].items():
+        print(f"  {name:30} min {stats['min_ms']:9.2f}  медиана {stats['median_ms']:9.2f}  "
+              f"макс {stats['max_ms']:9.2f} мс  ({stats['runs']} запусков)")
+
+
+def print_comparison(old, new):
+    print(f"Было: {old.get('label') or old.get('commit')}, стало: {new.get('label') or new.get('commit')} (медиана, мс)")
+    for name, before, after, ratio in compare(old, new):
+        before_text = f"{before:9.2f}" if before is not None else f"{'-':>9}"
+        after_text = f"{after:9.2f}" if after is not None else f"{'-':>9}"
+        ratio_text = f"x{ratio:.2f}" if ratio is not None else ''
+        print(f"  {name:30} {before_text} {after_text}  {ratio_text}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры операций FinanceApp")
+    parser.add_argument('path', nargs='?', default='finance.db', help="база для замеров (не изменяется)")
+    parser.add_argument('--repeat', type=int, default=5, help="повторов каждой операции чтения")
+    parser.add_argument('--inserts', type=int, default=200, help="число одиночных вставок")
+    parser.add_argument('--bulk-size', type=int, default=10000, help="строк в пакетной вставке")
+    parser.add_argument('--deletes', type=int, default=200, help="число удалений")
+    parser.add_argument('--label', help="метка замера в отчете (по умолчанию коммит git)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="сохранить отчет в JSON-файл")
+    parser.add_argument('--json', action='store_true', help="вывести отчет в JSON")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="сравнить два сохраненных отчета")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0], encoding='utf-8') as f:
+            old = json.load(f)
+        with open(args.compare[1], encoding='utf-8') as f:
+            new = json.load(f)
+        print_comparison(old, new)
+        return 0
+
+    if not os.path.exists(args.path):
+        print(f"{args.path} не найден; создайте базу generate_data.py", file=sys.stderr)
+        return 1
+    report = benchmark(args.path, args.repeat, args.inserts, args.bulk_size, args.deletes, args.label, args.seed)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from urllib.parse import quote
+
+from profiling import ProfiledConnection
+
+# Настройки соединения по умолчанию; каждую можно переопределить или отключить значением None
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',  # читатели не блокируют писателя и наоборот
+    'synchronous': 'NORMAL',  # в режиме WAL безопасно и без fsync на каждую фиксацию
+    'cache_size': -20000,  # отрицательное значение - размер в КиБ
+    'mmap_size': 268435456,
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000,  # мс ожидания вместо "database is locked"
+    'foreign_keys': 'ON',  # без этого SQLite не выполняет ON DELETE CASCADE из bd_create.py
+}
+
+# Эти настройки хранятся в самом файле базы и задаются только соединением для записи
+WRITER_ONLY_PRAGMAS = ('journal_mode',)
+
+
+def connect(db_file, pragmas=None, read_only=False, check_same_thread=True, profiler=None):
+    """ Открывает соединение и применяет к нему PRAGMA из DEFAULT_PRAGMAS и pragmas.
+
+    С profiler (profiling.QueryStats) соединение учитывает время каждого запроса.
+    """
+    factory = ProfiledConnection if profiler is not None else sqlite3.Connection
+    if read_only:
+        conn = sqlite3.connect(f"file:{quote(db_file)}?mode=ro", uri=True, check_same_thread=check_same_thread,
+                               factory=factory)
+    else:
+        conn = sqlite3.connect(db_file, check_same_thread=check_same_thread, factory=factory)
+    if profiler is not None:
+        conn.profiler = profiler
+    settings = dict(DEFAULT_PRAGMAS)
+    settings.update(pragmas or {})
+    for name, value in settings.items():
+        if value is None or (read_only and name in WRITER_ONLY_PRAGMAS):
+            continue
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+
+class ReadPool:
+    """ Небольшой пул соединений только для чтения.
+
+    Соединения создаются по мере надобности, но не больше size; если все заняты,
+    запрос ждет освобождения. Соединение в каждый момент используется одним потоком.
+    """
+
+    def __init__(self, db_file, size=4, pragmas=None, profiler=None):
+        self.db_file = db_file
+        self.size = size
+        self.pragmas = pragmas
+        self.profiler = profiler
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    conn = connect(self.db_file, self.pragmas, read_only=True, check_same_thread=False,
+                                   profiler=self.profiler)
+                except sqlite3.Error:
+                    self._created -= 1
+                    raise
+                self._connections.append(conn)
+                return conn
+        return self._idle.get()
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+            self._created = 0
+        self._idle = queue.LifoQueue()
@@ -0,0 +1,66 @@
+import calendar
+from datetime import date, datetime, timedelta
+
+# Форматы дат, которые принимаются на входе. В базе даты хранятся только как
+# ISO-8601 (YYYY-MM-DD): такой текст сортируется как дата, на нем держатся диапазоны
+# BETWEEN по индексам и ключи месяцев substr(date, 1, 7).
+DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d.%m.%Y", "%Y%m%d", "%Y-%m-%d %H:%M:%S")
+
+# Периодичность регулярных транзакций -> (единица, шаг в этих единицах)
+FREQUENCIES = {'daily': ('days', 1), 'weekly': ('days', 7), 'monthly': ('months', 1), 'yearly': ('months', 12)}
+
+
+def parse_date(value):
+    """ Дата из ввода (строка в одном из DATE_FORMATS, date или datetime) -> 'YYYY-MM-DD' """
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    text = value.strip() if isinstance(value, str) else ''
+    try:
+        # Быстрый путь для дат, которые уже в ISO-формате
+        return date.fromisoformat(text).isoformat()
+    except ValueError:
+        pass
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).date().isoformat()
+        except ValueError:
+            continue
+    raise ValueError(f"Неверный формат даты: {value}")
+
+
+def add_months(value, months):
+    """ value + months месяцев; день ограничивается концом месяца (31.01 + 1 -> 28.02 или 29.02) """
+    month = value.month - 1 + months
+    year = value.year + month // 12
+    month = month % 12 + 1
+    return value.replace(year=year, month=month, day=min(value.day, calendar.monthrange(year, month)[1]))
+
+
+def month_end(month):
+    """ Последний день месяца 'YYYY-MM' -> date """
+    value = datetime.strptime(month, "%Y-%m").date()
+    return value.replace(day=calendar.monthrange(value.year, value.month)[1])
+
+
+def recurrence_dates(start, frequency, interval=1, since=None):
+    """ Бесконечный генератор дат (date) повторения от start с шагом interval единиц frequency.
+
+    Даты начинаются с первой не раньше since. Каждая дата отсчитывается от start, а не
+    от предыдущей, поэтому повторение 31-го числа после короткого месяца снова 31-го.
+    """
+    unit, step = FREQUENCIES[frequency]
+    step *= interval
+    index = 0
+    if since is not None and since > start:
+        # Сразу к ближайшему к since повторению, без перебора всех пропущенных
+        if unit == 'days':
+            index = (since - start).days // step
+        else:
+            index = max(0, ((since.year - start.year) * 12 + since.month - start.month) // step - 1)
+    while True:
+        value = start + timedelta(days=index * step) if unit == 'days' else add_months(start, index * step)
+        if since is None or value >= since:
+            yield value
+        index += 1
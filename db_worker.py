@@ -0,0 +1,103 @@
+import queue
+import threading
+
+
+class DBWorker:
+    """ Выполняет вызовы FinanceApp в отдельном потоке, которому принадлежит соединение с базой.
+
+    GUI ставит запросы в очередь через submit, а результаты забирает опросом очереди
+    через after() и вызывает обратные вызовы в потоке Tk, поэтому главный цикл
+    никогда не ждет SQLite.
+    """
+
+    def __init__(self, widget, app_factory, poll_interval=20):
+        self.widget = widget
+        self.poll_interval = poll_interval
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        self.pending = 0
+        self.busy = False
+        self.on_busy = None  # on_busy(True/False) - показать или скрыть индикатор занятости
+        self.on_error = None  # обработчик ошибок для запросов без errback
+        self._poll_id = None
+        self.thread = threading.Thread(target=self._run, args=(app_factory,), daemon=True)
+        self.thread.start()
+        self._schedule_poll()
+
+    def attach(self, widget):
+        """ Переносит опрос результатов на другой виджет (например, новое главное окно) """
+        self.widget = widget
+        self._poll_id = None
+        self._schedule_poll()
+
+    def submit(self, method, *args, callback=None, errback=None, **kwargs):
+        """ Ставит вызов в очередь.
+
+        method - имя метода FinanceApp или функция f(app, *args, **kwargs).
+        callback(result) и errback(error) вызываются в потоке Tk.
+        """
+        self.pending += 1
+        self._set_busy(True)
+        self.requests.put((method, args, kwargs, callback, errback))
+
+    def stop(self):
+        self.requests.put(None)
+        self.thread.join()
+
+    def _run(self, app_factory):
+        try:
+            app = app_factory()
+            startup_error = None
+        except Exception as e:
+            # Без соединения каждый запрос завершается ошибкой открытия базы
+            app = None
+            startup_error = e
+        while True:
+            request = self.requests.get()
+            if request is None:
+                break
+            method, args, kwargs, callback, errback = request
+            try:
+                if startup_error is not None:
+                    raise startup_error
+                if isinstance(method, str):
+                    result = getattr(app, method)(*args, **kwargs)
+                else:
+                    result = method(app, *args, **kwargs)
+                self.results.put((callback, errback, result, None))
+            except Exception as e:
+                self.results.put((callback, errback, None, e))
+        # Соединение закрывается в том же потоке, в котором было открыто
+        del app
+
+    def _set_busy(self, busy):
+        if busy != self.busy:
+            self.busy = busy
+            if self.on_busy:
+                self.on_busy(busy)
+
+    def _schedule_poll(self):
+        if self._poll_id is None:
+            self._poll_id = self.widget.after(self.poll_interval, self._poll)
+
+    def _poll(self):
+        self._poll_id = None
+        while True:
+            try:
+                callback, errback, result, error = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.pending -= 1
+            if error is not None:
+                handler = errback or self.on_error
+                if handler:
+                    handler(error)
+            elif callback:
+                callback(result)
+        if self.pending == 0:
+            self._set_busy(False)
+        try:
+            self._schedule_poll()
+        except Exception:
+            # Виджет уничтожен - опрос продолжится после attach()
+            self._poll_id = None
@@ -0,0 +1,96 @@
+""" Потоковая выгрузка транзакций в CSV или JSON Lines.
+
+Строки читаются через FinanceApp.iter_transactions_export порциями и сразу пишутся
+в файл (при необходимости сжатый gzip), поэтому пиковая память не зависит от числа строк.
+
+Пример:
+    python exporter.py transactions.jsonl.gz --from 2024-01-01 --to 2024-12-31 --account 1
+"""
+import argparse
+import csv
+import gzip
+import json
+import sys
+import time
+
+from finance_app import FinanceApp
+
+EXPORT_COLUMNS = ('id', 'date', 'amount', 'category', 'type', 'account', 'description', 'tags')
+
+
+def open_output(path, compress=None):
+    """ Открывает файл для записи текста; .gz или compress=True включают gzip """
+    if path == '-':
+        return sys.stdout
+    if compress or (compress is None and path.endswith('.gz')):
+        return gzip.open(path, 'wt', encoding='utf-8', newline='')
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+def write_csv(rows, output):
+    writer = csv.writer(output)
+    writer.writerow(EXPORT_COLUMNS)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+def write_jsonl(rows, output):
+    count = 0
+    for row in rows:
+        record = dict(zip(EXPORT_COLUMNS, row))
+        # JSON печатает float кратчайшей записью: 1234 копейки становятся 12.34
+        record['amount'] = float(record['amount']) if record['amount'] is not None else None
+        record['tags'] = record['tags'].split(',') if record['tags'] else []
+        output.write(json.dumps(record, ensure_ascii=False))
+        output.write('\n')
+        count += 1
+    return count
+
+
+WRITERS = {'csv': write_csv, 'jsonl': write_jsonl}
+
+
+def detect_format(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    return 'jsonl' if name.endswith(('.jsonl', '.json')) else 'csv'
+
+
+def export_transactions(app, output, file_format='csv', start=None, end=None, account_id=None, fetch_size=1000):
+    """ Выгружает транзакции в открытый файл. Возвращает словарь со статистикой """
+    started = time.perf_counter()
+    rows = app.iter_transactions_export(start, end, account_id, fetch_size)
+    count = WRITERS[file_format](rows, output)
+    seconds = time.perf_counter() - started
+    return {'rows': count, 'seconds': seconds, 'rows_per_second': count / seconds if seconds else 0.0}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Выгрузка транзакций из finance.db")
+    parser.add_argument('path', help="файл для выгрузки (.csv, .jsonl, с .gz - сжатый) или - для stdout")
+    parser.add_argument('--db', default='finance.db')
+    parser.add_argument('--format', choices=sorted(WRITERS), help="по умолчанию определяется по расширению")
+    parser.add_argument('--from', dest='start', help="начальная дата YYYY-MM-DD")
+    parser.add_argument('--to', dest='end', help="конечная дата YYYY-MM-DD включительно")
+    parser.add_argument('--account', type=int, help="id счета")
+    parser.add_argument('--gzip', action='store_true', default=None, help="сжимать gzip независимо от расширения")
+    parser.add_argument('--fetch-size', type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    app = FinanceApp(args.db)
+    output = open_output(args.path, args.gzip)
+    try:
+        stats = export_transactions(app, output, args.format or detect_format(args.path),
+                                    args.start, args.end, args.account, args.fetch_size)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    print(f"Выгружено: {stats['rows']}, время: {stats['seconds']:.2f} с, {stats['rows_per_second']:.0f} строк/с",
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1321 @@
+import re
+import sqlite3
+from collections import OrderedDict
+from datetime import date, datetime
+
+import connection
+import migrations
+from dates import FREQUENCIES, month_end, parse_date, recurrence_dates
+from money import BASE_CURRENCY, Money, money_columns
+
+
+class FinanceError(Exception):
+    """ Базовая ошибка слоя данных FinanceApp """
+
+
+class ValidationError(FinanceError, ValueError):
+    """ Некорректные входные данные """
+
+
+class NotFoundError(ValidationError):
+    """ Запись, на которую ссылается запрос, не существует """
+
+
+class ConflictError(ValidationError):
+    """ Запись с таким именем уже существует или на нее еще ссылаются другие записи """
+
+
+# Транзакции с названиями категории, счета и типа: (id, amount, category, description, date, account, type).
+# Транзакции удаленных категорий не показываются, как и раньше. amount хранится в копейках.
+TRANSACTION_VIEW_SQL = """
+    SELECT t.id, t.amount, c.name, t.description, t.date, a.name,
+           tt.name
+    FROM transactions t
+    JOIN categories c ON c.id = t.category_id
+    LEFT JOIN accounts a ON a.id = t.account_id
+    LEFT JOIN transaction_types tt ON tt.id = t.type_id
+"""
+
+# Те же колонки для транзакций одного пользователя (параметр - user_id). CROSS JOIN
+# закрепляет порядок соединения: сначала счета пользователя по индексу accounts(user_id),
+# затем их транзакции по (account_id, date), поэтому стоимость зависит только от его данных.
+# Транзакции без счета не принадлежат никому и в выборку пользователя не попадают.
+USER_TRANSACTION_VIEW_SQL = """
+    SELECT t.id, t.amount, c.name, t.description, t.date, a.name,
+           tt.name
+    FROM accounts a
+    CROSS JOIN transactions t ON t.account_id = a.id
+    JOIN categories c ON c.id = t.category_id
+    LEFT JOIN transaction_types tt ON tt.id = t.type_id
+    WHERE a.user_id = ?
+"""
+
+# Условие "транзакция принадлежит пользователю" для запросов, где t - не ведущая таблица
+USER_TRANSACTIONS_SQL = "t.account_id IN (SELECT id FROM accounts WHERE user_id = ?)"
+
+# Расходы пользователя за месяц (YYYY-MM): (category_id, валюта счета, копейки) на транзакцию.
+# Месяц читается по (account_id, date) только со счетов пользователя, один раз на все категории;
+# складывает строки _month_spent, так что временного B-дерева для GROUP BY нет
+USER_MONTH_SPENT_SQL = """
+    SELECT t.category_id, a.currency, CASE WHEN ty.sign < 0 THEN t.amount ELSE 0 END
+    FROM accounts a
+    CROSS JOIN transactions t ON t.account_id = a.id
+    LEFT JOIN transaction_types ty ON ty.id = t.type_id
+    WHERE a.user_id = ? AND t.date >= ? AND t.date < ? || '~'
+"""
+
+# Курс валюты к базовой на дату: последний курс не позже нее
+RATE_SQL = "SELECT rate FROM fx_rates WHERE currency = ? AND date <= ? ORDER BY date DESC LIMIT 1"
+
+
+# Счетов в одном запросе страницы пользователя: по части UNION ALL на счет, а SQLite
+# допускает не больше 500 частей в составном SELECT (SQLITE_MAX_COMPOUND_SELECT)
+ACCOUNTS_PER_PAGE_QUERY = 400
+
+
+# Методы FinanceApp, которые читают только через пул соединений (или вовсе не трогают
+# базу) и поэтому могут выполняться параллельно из разных потоков. Остальные методы
+# работают с соединением для записи или кэшем справочников и вызываются по одному.
+CONCURRENT_READ_METHODS = frozenset({
+    'get_transactions', 'get_transactions_view', 'get_transactions_page', 'get_transactions_between',
+    'search_transactions', 'transaction_exists', 'get_categories', 'get_budget', 'get_budget_view',
+    'get_budget_status', 'get_users', 'get_accounts', 'get_accounts_view', 'get_transaction_types',
+    'get_transaction_type_mapping', 'get_transaction_tags', 'get_tags', 'get_tag_counts',
+    'get_recurring_rules', 'get_fx_rates', 'login', 'check_credentials', 'query_stats',
+})
+
+
+def transaction_view_sql(user_id, conditions=()):
+    """ (SQL, параметры) выборки строк TRANSACTION_VIEW_SQL с условиями, для всех или для пользователя """
+    if user_id is None:
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        return TRANSACTION_VIEW_SQL + where, []
+    return USER_TRANSACTION_VIEW_SQL + "".join(" AND " + condition for condition in conditions), [user_id]
+
+
+def fts_query(text):
+    """ Превращает строку поиска в запрос FTS5: все слова обязательны, последнее может быть началом слова.
+
+    Слова берутся в кавычки, поэтому операторы и спецсимволы FTS5 во вводе пользователя
+    не вызывают синтаксических ошибок.
+    """
+    words = re.findall(r"\w+", text)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    # Префикс из одной буквы совпадает почти со всем словарем и не попадает в prefix-индекс
+    if len(words[-1]) > 1:
+        terms[-1] += '*'
+    return " ".join(terms)
+
+
+def split_tags(tags):
+    """ Теги из строки через запятую или списка: без пробелов по краям, пустых и повторов """
+    if not tags:
+        return []
+    if isinstance(tags, str):
+        tags = tags.split(',')
+    return list(dict.fromkeys(tag.strip() for tag in tags if tag and tag.strip()))
+
+
+class ReferenceCache:
+    """ Кэш справочников с отображениями имя -> id и id -> имя.
+
+    Справочник загружается целиком при первом обращении. Кэш сбрасывается методами
+    добавления и удаления FinanceApp, а также при изменении PRAGMA data_version,
+    то есть после фиксации изменений другим соединением.
+    """
+
+    # Таблица справочника -> колонка с именем
+    TABLES = {'categories': 'name', 'users': 'username', 'transaction_types': 'name', 'tags': 'name'}
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.maps = {}
+        self.data_version = None
+        self.hits = 0
+        self.misses = 0
+
+    def _get_maps(self, table):
+        version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self.data_version:
+            self.maps.clear()
+            self.data_version = version
+        maps = self.maps.get(table)
+        if maps is not None:
+            self.hits += 1
+            return maps
+        self.misses += 1
+        ids_by_name, names_by_id = {}, {}
+        for ref_id, name in self.conn.execute(f"SELECT id, {self.TABLES[table]} FROM {table} ORDER BY id"):
+            ids_by_name.setdefault(name, ref_id)
+            names_by_id[ref_id] = name
+        maps = self.maps[table] = (ids_by_name, names_by_id)
+        return maps
+
+    def get_id(self, table, name):
+        return self._get_maps(table)[0].get(name)
+
+    def get_name(self, table, ref_id):
+        return self._get_maps(table)[1].get(ref_id)
+
+    def get_ids(self, table):
+        """ Отображение имя -> id целиком (для массовых операций) """
+        return self._get_maps(table)[0]
+
+    def invalidate(self, table=None):
+        if table is None:
+            self.maps.clear()
+        else:
+            self.maps.pop(table, None)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+
+class RateCache:
+    """ Курсы валют к базовой с вытеснением давно не использованных записей (LRU).
+
+    Ключ - (валюта, дата), значение - последний курс валюты не позже этой даты, поэтому
+    сводный отчет обращается к fx_rates один раз на валюту и дату, а не на строку.
+    Кэш сбрасывается методами FinanceApp, меняющими курсы, и в sync() при изменении
+    PRAGMA data_version (курсы записало другое соединение).
+    """
+
+    def __init__(self, conn, maxsize=4096):
+        self.conn = conn
+        self.maxsize = maxsize
+        self.rates = OrderedDict()
+        self.data_version = None
+        self.hits = 0
+        self.misses = 0
+
+    def sync(self):
+        # Вызывается раз в начале отчета, а не на каждый курс
+        version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self.data_version:
+            self.rates.clear()
+            self.data_version = version
+
+    def get(self, currency, on):
+        """ Курс currency к базовой валюте на дату on (YYYY-MM-DD) """
+        if currency == BASE_CURRENCY:
+            return 1.0
+        key = (currency, on)
+        rate = self.rates.get(key)
+        if rate is not None:
+            self.rates.move_to_end(key)
+            self.hits += 1
+            return rate
+        self.misses += 1
+        row = self.conn.execute(RATE_SQL, key).fetchone()
+        if row is None:
+            raise NotFoundError(f"Нет курса {currency} на {on}")
+        self.rates[key] = row[0]
+        if len(self.rates) > self.maxsize:
+            self.rates.popitem(last=False)
+        return row[0]
+
+    def invalidate(self):
+        self.rates.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self.rates),
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+
+def currency_code(value):
+    """ Код валюты ISO 4217 из ввода: ' usd' -> 'USD' """
+    code = str(value or '').strip().upper()
+    if not re.fullmatch(r'[A-Z]{3}', code):
+        raise ValidationError(f"Неверный код валюты: {value}")
+    return code
+
+
+class Session:
+    """ Вошедший пользователь. Его user_id передается методам чтения FinanceApp,
+    которые тогда возвращают только данные этого пользователя (через accounts.user_id).
+    """
+
+    __slots__ = ('user_id', 'username')
+
+    def __init__(self, user_id, username):
+        self.user_id = user_id
+        self.username = username
+
+    def __repr__(self):
+        return f"Session(user_id={self.user_id!r}, username={self.username!r})"
+
+
+class FinanceApp:
+    def __init__(self, db_file, pragmas=None, read_pool_size=4, check_same_thread=True, profiler=None):
+        # Единственное соединение для записи; PRAGMA берутся из connection.DEFAULT_PRAGMAS и pragmas.
+        # check_same_thread=False - для вызывающего кода, который сам сериализует запись (server.py).
+        # profiler - profiling.QueryStats, если нужна статистика запросов всех соединений
+        self.profiler = profiler
+        self.conn = connection.connect(db_file, pragmas, check_same_thread=check_same_thread, profiler=profiler)
+        self.cursor = self.conn.cursor()
+        # Обновляем схему существующей базы до актуальной версии
+        migrations.migrate(self.conn)
+        self.reference_cache = ReferenceCache(self.conn)
+        self.rate_cache = RateCache(self.conn)
+        # Чтение идет через пул соединений только для чтения; у базы в памяти других соединений нет
+        if db_file == ':memory:' or not read_pool_size:
+            self.read_pool = None
+        else:
+            self.read_pool = connection.ReadPool(db_file, read_pool_size, pragmas, profiler)
+
+    def _read(self, sql, params=()):
+        """ Выполняет запрос на чтение и возвращает все строки """
+        if self.read_pool is None:
+            return self.conn.execute(sql, params).fetchall()
+        with self.read_pool.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def query_stats(self):
+        """ Отчет профилировщика запросов (profiling.QueryStats.report) или None, если он выключен """
+        return self.profiler.report() if self.profiler is not None else None
+
+    def reset_query_stats(self):
+        if self.profiler is not None:
+            self.profiler.reset()
+
+    def get_category_name_by_id(self, category_id):
+        return self.reference_cache.get_name('categories', category_id)
+
+    def get_user_name_by_id(self, user_id):
+        return self.reference_cache.get_name('users', user_id)
+
+    def check_credentials(self, username, password):
+        return self.login(username, password) is not None
+
+    def login(self, username, password):
+        """ Session пользователя или None, если имя или пароль неверны """
+        rows = self._read("SELECT id FROM users WHERE username = ? AND password = ?", (username, password))
+        return Session(rows[0][0], username) if rows else None
+
+    def user_exists(self, username):
+        """ Проверяет, существует ли пользователь с данным username """
+        return self.reference_cache.get_id('users', username) is not None
+
+    def register_user(self, username, password):
+        """ Регистрирует нового пользователя, если тот еще не существует """
+        if self.user_exists(username):
+            raise ConflictError("Пользователь с таким именем уже существует")
+        self.add_user(username, password)
+
+    # Методы удаления. Ошибки откатывают изменения и передаются вызывающему коду.
+    def delete_user(self, user_id):
+        try:
+            self.cursor.execute("DELETE FROM users WHERE id=?", (user_id,))
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+        self.reference_cache.invalidate('users')
+        if not self.cursor.rowcount:
+            raise NotFoundError(f"Пользователь не найден: {user_id}")
+
+    def delete_transaction(self, transaction_id, user_id=None):
+        # С user_id удаляется только транзакция счета этого пользователя, как и в выборках
+        try:
+            if user_id is None:
+                self.cursor.execute("DELETE FROM transactions WHERE id=?", (transaction_id,))
+            else:
+                self.cursor.execute(f"DELETE FROM transactions AS t WHERE t.id = ? AND {USER_TRANSACTIONS_SQL}",
+                                    (transaction_id, user_id))
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+        if not self.cursor.rowcount:
+            raise NotFoundError(f"Транзакция не найдена: {transaction_id}")
+
+    def delete_account(self, account_id, user_id=None):
+        # С user_id удаляется только счет этого пользователя
+        try:
+            if user_id is None:
+                self.cursor.execute("DELETE FROM accounts WHERE id=?", (account_id,))
+            else:
+                self.cursor.execute("DELETE FROM accounts WHERE id = ? AND user_id = ?", (account_id, user_id))
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+        if not self.cursor.rowcount:
+            raise NotFoundError(f"Счет не найден: {account_id}")
+
+    def delete_category(self, category_id):
+        # Категория общая для всех пользователей: ее транзакции, бюджеты и правила не удаляются
+        # вместе с ней, а удаление категории, на которую они ссылаются, запрещено
+        try:
+            self.cursor.execute("BEGIN IMMEDIATE")
+            self.cursor.execute("""
+                SELECT (SELECT COUNT(*) FROM transactions WHERE category_id = ?),
+                       (SELECT COUNT(*) FROM budget WHERE category_id = ?),
+                       (SELECT COUNT(*) FROM recurring_rules WHERE category_id = ?)
+            """, (category_id, category_id, category_id))
+            transactions, budgets, rules = self.cursor.fetchone()
+            if transactions or budgets or rules:
+                raise ConflictError(f"Категория используется: транзакций {transactions}, "
+                                    f"бюджетов {budgets}, правил {rules}")
+            self.cursor.execute("DELETE FROM categories WHERE id=?", (category_id,))
+            self.conn.commit()
+        except sqlite3.IntegrityError:
+            self.conn.rollback()
+            raise ConflictError("На категорию ссылаются другие записи")
+        except Exception:
+            self.conn.rollback()
+            raise
+        self.reference_cache.invalidate('categories')
+        if not self.cursor.rowcount:
+            raise NotFoundError(f"Категория не найдена: {category_id}")
+
+    def delete_budget(self, budget_id, user_id=None):
+        # С user_id удаляется только личный бюджет пользователя; общие бюджеты (user_id IS NULL)
+        # он видит, но удалить не может
+        try:
+            if user_id is None:
+                self.cursor.execute("DELETE FROM budget WHERE id=?", (budget_id,))
+            else:
+                self.cursor.execute("DELETE FROM budget WHERE id = ? AND user_id = ?", (budget_id, user_id))
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+        if not self.cursor.rowcount:
+            raise NotFoundError(f"Бюджет не найден: {budget_id}")
+
+    def delete_recurring_rule(self, rule_id):
+        # Уже созданные по правилу транзакции остаются, recurring_rule_id у них обнуляется
+        try:
+            self.cursor.execute("DELETE FROM recurring_rules WHERE id=?", (rule_id,))
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+        if not self.cursor.rowcount:
+            raise NotFoundError(f"Правило не найдено: {rule_id}")
+
+    def rebuild_balances(self):
+        """ Сверяет балансы счетов с транзакциями и исправляет расхождения.
+
+        Возвращает список (id счета, сохраненный баланс, правильный баланс).
+        """
+        try:
+            drift = migrations.rebuild_balances(self.cursor)
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+        return money_columns(drift, 1, 2)
+
+    def find_orphans(self):
+        """ Число строк, ссылающихся на несуществующие записи: {таблица: число строк}. Ничего не удаляет """
+        return migrations.find_orphans(self.cursor)
+
+    def sweep_orphans(self):
+        """ Удаляет строки, ссылающиеся на несуществующие записи. Возвращает {таблица: число строк} """
+        try:
+            removed = migrations.sweep_orphans(self.cursor)
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+        self.reference_cache.invalidate()
+        return removed
+
+    def close(self):
+        if getattr(self, 'read_pool', None) is not None:
+            self.read_pool.close()
+        self.conn.close()
+
+    def __del__(self):
+        self.close()
+
+    def get_transactions(self, user_id=None):
+        if user_id is None:
+            return money_columns(self._read("""
+                SELECT id, amount, category_id, description, date, account_id, type_id
+                FROM transactions ORDER BY date DESC
+            """), 1)
+        return money_columns(self._read("""
+            SELECT t.id, t.amount, t.category_id, t.description, t.date, t.account_id, t.type_id
+            FROM accounts a
+            CROSS JOIN transactions t ON t.account_id = a.id
+            WHERE a.user_id = ?
+            ORDER BY t.date DESC
+        """, (user_id,)), 1)
+
+    def get_transactions_view(self, user_id=None):
+        """ Все транзакции (или транзакции пользователя user_id) в виде строк TRANSACTION_VIEW_SQL """
+        sql, params = transaction_view_sql(user_id)
+        return money_columns(self._read(sql + " ORDER BY t.date DESC, t.id DESC", params), 1)
+
+    def get_transactions_page(self, after=None, limit=200, backward=False, user_id=None):
+        """ Страница строк TRANSACTION_VIEW_SQL в порядке (date DESC, id DESC) с пагинацией по ключу.
+
+        after - ключ (date, id) граничной строки. Без backward возвращаются строки после нее,
+        с backward=True - строки перед ней, в том же порядке сортировки.
+        С user_id - только транзакции счетов этого пользователя.
+        """
+        order = "ASC" if backward else "DESC"
+        key_condition = []
+        key = []
+        if after is not None:
+            key_condition = ["(t.date, t.id) > (?, ?)" if backward else "(t.date, t.id) < (?, ?)"]
+            key = [after[0], after[1]]
+        if user_id is None:
+            sql, params = transaction_view_sql(None, key_condition)
+            params += key
+        else:
+            account_ids = [row[0] for row in self._read("SELECT id FROM accounts WHERE user_id = ?", (user_id,))]
+            # Страница каждого счета берется по индексу (account_id, date) с тем же LIMIT,
+            # затем страницы сливаются: стоимость не зависит от объема данных пользователя.
+            # В составном SELECT не больше 500 частей, поэтому счета идут группами, а страницы
+            # групп сливаются здесь
+            account_page = (f"SELECT id FROM (SELECT t.id FROM transactions t WHERE t.account_id = ?"
+                            f"{''.join(' AND ' + condition for condition in key_condition)}"
+                            f" ORDER BY t.date {order}, t.id {order} LIMIT ?)")
+            rows = []
+            for start in range(0, len(account_ids), ACCOUNTS_PER_PAGE_QUERY):
+                group = account_ids[start:start + ACCOUNTS_PER_PAGE_QUERY]
+                sql, params = transaction_view_sql(None, [f"t.id IN ({' UNION ALL '.join([account_page] * len(group))})"])
+                for account_id in group:
+                    params += [account_id] + key + [limit]
+                rows += self._read(sql + f" ORDER BY t.date {order}, t.id {order} LIMIT ?", params + [limit])
+            if len(account_ids) > ACCOUNTS_PER_PAGE_QUERY:
+                rows.sort(key=lambda row: (row[4] or '', row[0]), reverse=not backward)
+                del rows[limit:]
+            return money_columns(rows[::-1] if backward else rows, 1)
+        rows = self._read(sql + f" ORDER BY t.date {order}, t.id {order} LIMIT ?", params + [limit])
+        return money_columns(rows[::-1] if backward else rows, 1)
+
+    def iter_transactions_export(self, start=None, end=None, account_id=None, fetch_size=1000, user_id=None):
+        """ Генератор транзакций с категорией, типом, счетом и тегами в порядке (date, id).
+
+        Строки читаются с курсора порциями по fetch_size, поэтому память не зависит
+        от размера таблицы. Фильтры: даты start..end включительно, счет и пользователь.
+        Строка: (id, date, amount, category, type, account, description, tags), amount - Money.
+        """
+        conditions, params = [], []
+        if start:
+            conditions.append("t.date >= ?")
+            params.append(parse_date(start))
+        if end:
+            conditions.append("t.date <= ?")
+            params.append(parse_date(end))
+        if account_id is not None:
+            conditions.append("t.account_id = ?")
+            params.append(account_id)
+        if user_id is not None:
+            conditions.append(USER_TRANSACTIONS_SQL)
+            params.append(user_id)
+        where = "WHERE " + " AND ".join(conditions) if conditions else ""
+        # Генератор держит свое соединение из пула (или отдельный курсор) все время чтения
+        if self.read_pool is None:
+            yield from self._iter_export_rows(self.conn, where, params, fetch_size)
+        else:
+            with self.read_pool.connection() as conn:
+                yield from self._iter_export_rows(conn, where, params, fetch_size)
+
+    def _iter_export_rows(self, conn, where, params, fetch_size):
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT t.id, t.date, t.amount, c.name, tt.name, a.name, t.description,
+                   (SELECT group_concat(tg.name, ',') FROM transaction_tags x
+                    JOIN tags tg ON tg.id = x.tag_id WHERE x.transaction_id = t.id)
+            FROM transactions t
+            LEFT JOIN categories c ON c.id = t.category_id
+            LEFT JOIN transaction_types tt ON tt.id = t.type_id
+            LEFT JOIN accounts a ON a.id = t.account_id
+            {where}
+            ORDER BY t.date, t.id
+        """, params)
+        try:
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                yield from money_columns(rows, 2)
+        finally:
+            cursor.close()
+
+    def get_transactions_between(self, start, end, account=None, category=None, user_id=None):
+        """ Транзакции с датой от start до end включительно в порядке (date, id).
+
+        start и end - date или строка в одном из форматов dates.DATE_FORMATS, account - id счета,
+        category - название категории, user_id - владелец счетов. Строки как у
+        get_transactions_view, amount - Money.
+        Диапазон идет по индексу (date), (account_id, date) или (category_id, date).
+        """
+        conditions = ["t.date BETWEEN ? AND ?"]
+        params = [parse_date(start), parse_date(end)]
+        if account is not None:
+            conditions.append("t.account_id = ?")
+            params.append(account)
+        if category is not None:
+            # Через пул, а не кэш справочников: метод входит в CONCURRENT_READ_METHODS
+            rows = self._read("SELECT id FROM categories WHERE name = ? ORDER BY id LIMIT 1", (category,))
+            if not rows:
+                raise NotFoundError(f"Категория не найдена: {category}")
+            conditions.append("t.category_id = ?")
+            params.append(rows[0][0])
+        sql, user_params = transaction_view_sql(user_id, conditions)
+        return money_columns(self._read(sql + " ORDER BY t.date, t.id", user_params + params), 1)
+
+    def search_transactions(self, query, limit=50, offset=0, user_id=None):
+        """ Поиск по описаниям транзакций через индекс transactions_fts.
+
+        Возвращает строки TRANSACTION_VIEW_SQL, лучшие совпадения (по bm25) первыми.
+        С user_id ищутся только транзакции счетов этого пользователя.
+        """
+        match = fts_query(query)
+        if match is None:
+            return []
+        # Сначала выбираем страницу совпадений по индексу, затем подставляем названия.
+        # Фильтр по пользователю - внутри подзапроса, иначе LIMIT отрежет его строки
+        if user_id is None:
+            matches = "SELECT rowid, rank FROM transactions_fts WHERE transactions_fts MATCH ?"
+            params = [match]
+        else:
+            matches = ("SELECT s.rowid, s.rank FROM transactions_fts s JOIN transactions t ON t.id = s.rowid "
+                       "WHERE transactions_fts MATCH ? AND " + USER_TRANSACTIONS_SQL)
+            params = [match, user_id]
+        rows = self._read(
+            TRANSACTION_VIEW_SQL + f"""
+            JOIN ({matches} ORDER BY rank LIMIT ? OFFSET ?) f ON f.rowid = t.id
+            ORDER BY f.rank
+            """,
+            params + [limit, offset]
+        )
+        return money_columns(rows, 1)
+
+    def rebuild_search_index(self):
+        try:
+            migrations.rebuild_search_index(self.cursor)
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+
+    def transaction_exists(self, transaction_id):
+        return bool(self._read("SELECT 1 FROM transactions WHERE id = ?", (transaction_id,)))
+
+    @staticmethod
+    def validate_and_format_date(date_str):
+        # Дата в формате хранения (YYYY-MM-DD) или None, если формат некорректен
+        try:
+            return parse_date(date_str)
+        except ValueError:
+            return None
+
+    def add_transaction(self, amount, category_name, description, date_str, type_name=None, tags=None, account_id=None):
+        # Одиночная вставка идет через тот же путь, что и массовая: одна фиксация на транзакцию
+        inserted, rejected = self.add_transactions_bulk([(amount, category_name, description, date_str, type_name, tags, account_id)])
+        if rejected:
+            raise ValidationError(rejected[0][1])
+
+    def add_transactions_bulk(self, rows, batch_size=1000):
+        """ Массовое добавление транзакций.
+
+        rows - итерируемый набор кортежей (amount, category_name, description, date_str[, type_name[, tags[, account_id]]]).
+        Строка без типа или с типом без знака отклоняется. Категории и типы разрешаются один раз, вставка идет через executemany,
+        фиксация выполняется один раз на пачку из batch_size строк.
+        Возвращает (inserted, rejected), где rejected - список (номер строки, причина).
+        """
+        category_ids = self.reference_cache.get_ids('categories')
+        type_ids = self.reference_cache.get_ids('transaction_types')
+        self.cursor.execute("SELECT id FROM transaction_types WHERE sign IS NOT NULL")
+        signed_type_ids = set(row[0] for row in self.cursor.fetchall())
+        self.cursor.execute("SELECT id FROM accounts")
+        account_ids = set(row[0] for row in self.cursor.fetchall())
+
+        inserted = 0
+        rejected = []
+        batch = []
+        for index, row in enumerate(rows):
+            try:
+                batch.append(self._prepare_transaction(row, category_ids, type_ids, signed_type_ids, account_ids))
+            except ValueError as e:
+                rejected.append((index, str(e)))
+                continue
+            if len(batch) >= batch_size:
+                inserted += self._insert_transaction_batch(batch)
+                batch = []
+        if batch:
+            inserted += self._insert_transaction_batch(batch)
+        return inserted, rejected
+
+    def _prepare_transaction(self, row, category_ids, type_ids, signed_type_ids, account_ids):
+        # Проверка строки и разрешение названий в идентификаторы
+        amount, category_name, description, date_str = row[:4]
+        type_name = row[4] if len(row) > 4 else None
+        tags = row[5] if len(row) > 5 else None
+        account_id = row[6] if len(row) > 6 else None
+
+        cents = Money.parse(amount).cents
+        # Даты хранятся только в ISO-формате: по ним сортируют, выбирают диапазоны и месяцы
+        date_str = parse_date(date_str)
+        if category_name not in category_ids:
+            raise NotFoundError(f"Категория не найдена: {category_name}")
+        if account_id is not None and account_id not in account_ids:
+            raise NotFoundError(f"Счет не найден: {account_id}")
+        type_id = self._signed_type_id(type_name, type_ids, signed_type_ids)
+        tag_list = split_tags(tags)
+        return cents, category_ids[category_name], description, date_str, type_id, tag_list, account_id
+
+    @staticmethod
+    def _signed_type_id(type_name, type_ids, signed_type_ids):
+        # Тип обязателен: от знака типа зависит, уменьшит транзакция баланс или увеличит
+        if not type_name:
+            raise ValidationError("Не указан тип транзакции")
+        type_id = type_ids.get(type_name)
+        if type_id is None:
+            raise NotFoundError(f"Тип транзакции не найден: {type_name}")
+        if type_id not in signed_type_ids:
+            raise ValidationError(f"У типа транзакции не задан знак: {type_name}")
+        return type_id
+
+    def _insert_transaction_batch(self, batch, rule_ids=None):
+        # rule_ids - правила регулярных транзакций для строк batch (run_recurring_rules)
+        try:
+            # Блокируем запись сразу, чтобы идентификаторы пачки никто не занял
+            if not self.conn.in_transaction:
+                self.cursor.execute("BEGIN IMMEDIATE")
+            self.cursor.execute("SELECT COALESCE(MAX(id), 0) FROM transactions")
+            next_id = self.cursor.fetchone()[0] + 1
+
+            tag_ids = self._resolve_tags(set(tag for row in batch for tag in row[5]))
+            transactions, mappings, tags = [], [], []
+            for offset, (amount, category_id, description, on, type_id, tag_list, account_id) in enumerate(batch):
+                transaction_id = next_id + offset
+                rule_id = rule_ids[offset] if rule_ids else None
+                transactions.append((transaction_id, amount, category_id, description, on, account_id, type_id, rule_id))
+                if type_id:
+                    mappings.append((transaction_id, type_id))
+                tags.extend((transaction_id, tag_ids[tag]) for tag in tag_list)
+
+            self.cursor.executemany(
+                "INSERT INTO transactions (id, amount, category_id, description, date, account_id, type_id, recurring_rule_id) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                transactions
+            )
+            self.cursor.executemany("INSERT INTO transaction_type_mapping (transaction_id, type_id) VALUES (?, ?)", mappings)
+            self.cursor.executemany("INSERT INTO transaction_tags (transaction_id, tag_id) VALUES (?, ?)", tags)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            self.reference_cache.invalidate('tags')
+            raise
+        return len(batch)
+
+    def _resolve_tags(self, names):
+        """ Отображение имя тега -> id; недостающие теги добавляются в текущей транзакции """
+        known = self.reference_cache.get_ids('tags')
+        tag_ids = dict((name, known[name]) for name in names if name in known)
+        missing = [name for name in names if name not in tag_ids]
+        if missing:
+            self.cursor.executemany("INSERT OR IGNORE INTO tags (name) VALUES (?)", [(name,) for name in missing])
+            for name in missing:
+                self.cursor.execute("SELECT id FROM tags WHERE name = ?", (name,))
+                tag_ids[name] = self.cursor.fetchone()[0]
+            self.reference_cache.invalidate('tags')
+        return tag_ids
+
+    def add_recurring_rule(self, amount, category_name, description, start_date, frequency='monthly', interval=1,
+                           type_name=None, account_id=None, end_date=None, user_id=None):
+        """ Правило регулярной транзакции: с start_date каждые interval дней, недель, месяцев или лет.
+
+        frequency - ключ dates.FREQUENCIES, end_date - последняя возможная дата (включительно),
+        type_name - обязательный тип транзакций. Владелец правила - владелец счета account_id или user_id для правила без счета.
+        Транзакции по правилу создает run_recurring_rules. Возвращает id правила.
+        """
+        if frequency not in FREQUENCIES:
+            raise ValidationError(f"Неизвестная периодичность: {frequency}")
+        try:
+            interval = int(interval)
+        except (TypeError, ValueError):
+            raise ValidationError(f"Неверный интервал повторения: {interval!r}")
+        if interval < 1:
+            raise ValidationError("Интервал повторения должен быть не меньше 1")
+        try:
+            start_date = parse_date(start_date)
+            end_date = parse_date(end_date) if end_date else None
+        except ValueError as e:
+            raise ValidationError(str(e))
+        category_id = self.reference_cache.get_id('categories', category_name)
+        if category_id is None:
+            raise NotFoundError(f"Категория не найдена: {category_name}")
+        self.cursor.execute("SELECT id FROM transaction_types WHERE sign IS NOT NULL")
+        type_id = self._signed_type_id(type_name, self.reference_cache.get_ids('transaction_types'),
+                                       set(row[0] for row in self.cursor.fetchall()))
+        if account_id is not None:
+            self.cursor.execute("SELECT user_id FROM accounts WHERE id = ?", (account_id,))
+            row = self.cursor.fetchone()
+            if row is None:
+                raise NotFoundError(f"Счет не найден: {account_id}")
+            user_id = row[0]
+        try:
+            self.cursor.execute("""
+                INSERT INTO recurring_rules (user_id, account_id, category_id, type_id, amount, description,
+                                             frequency, interval, start_date, end_date, next_date)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (user_id, account_id, category_id, type_id, Money.parse(amount).cents, description,
+                  frequency, interval, start_date, end_date,
+                  start_date if end_date is None or start_date <= end_date else None))
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+        return self.cursor.lastrowid
+
+    def get_recurring_rules(self, user_id=None):
+        """ Правила (id, amount, category, description, type, account_id, frequency, interval,
+        start_date, end_date, next_date) в порядке ближайшего повторения; amount - Money """
+        where = "WHERE r.user_id = ?" if user_id is not None else ""
+        return money_columns(self._read(f"""
+            SELECT r.id, r.amount, c.name, r.description, tt.name, r.account_id, r.frequency, r.interval,
+                   r.start_date, r.end_date, r.next_date
+            FROM recurring_rules r
+            LEFT JOIN categories c ON c.id = r.category_id
+            LEFT JOIN transaction_types tt ON tt.id = r.type_id
+            {where}
+            ORDER BY r.next_date IS NULL, r.next_date, r.id
+        """, (user_id,) if user_id is not None else ()), 1)
+
+    def run_recurring_rules(self, today=None):
+        """ Создает транзакции по всем повторениям правил, срок которых наступил к today.
+
+        Все повторения, пропущенные с прошлого запуска (хоть за несколько лет), вставляются
+        одной пачкой в одной транзакции вместе со сдвигом next_date правил. Повторный запуск
+        ничего не добавляет, а уникальный индекс (recurring_rule_id, date) не дает создать
+        повторение дважды, даже если next_date отстает. Возвращает число новых транзакций.
+        """
+        today = date.fromisoformat(parse_date(today or date.today()))
+        try:
+            # Блокировка записи на все время: правила и их повторения читает и сдвигает только этот запуск
+            self.cursor.execute("BEGIN IMMEDIATE")
+            self.cursor.execute("""
+                SELECT id, amount, category_id, description, type_id, account_id, frequency, interval,
+                       start_date, end_date, next_date
+                FROM recurring_rules WHERE next_date <= ?
+            """, (today.isoformat(),))
+            batch, rule_ids, updates = [], [], []
+            for (rule_id, amount, category_id, description, type_id, account_id, frequency, interval,
+                 start_date, end_date, next_date) in self.cursor.fetchall():
+                end = date.fromisoformat(end_date) if end_date else None
+                last = min(today, end) if end else today
+                self.cursor.execute("SELECT date FROM transactions WHERE recurring_rule_id = ? AND date >= ?",
+                                    (rule_id, next_date))
+                existing = set(row[0] for row in self.cursor.fetchall())
+                for value in recurrence_dates(date.fromisoformat(start_date), frequency, interval,
+                                              date.fromisoformat(next_date)):
+                    if value > last:
+                        break
+                    if value.isoformat() not in existing:
+                        batch.append((amount, category_id, description, value.isoformat(), type_id, [], account_id))
+                        rule_ids.append(rule_id)
+                updates.append((None if end and value > end else value.isoformat(), rule_id))
+            self.cursor.executemany("UPDATE recurring_rules SET next_date = ? WHERE id = ?", updates)
+            if batch:
+                # Фиксирует и вставку, и сдвиг правил
+                return self._insert_transaction_batch(batch, rule_ids)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        return 0
+
+    def get_categories(self):
+        return self._read("SELECT * FROM categories")
+
+    def add_category(self, name):
+        self._add_reference('categories', "INSERT INTO categories (name) VALUES (?)", (name,),
+                            f"Категория уже существует: {name}")
+
+    def _add_reference(self, table, sql, params, conflict_message):
+        # Вставка в справочник с уникальным именем; повтор имени - ConflictError
+        try:
+            self.cursor.execute(sql, params)
+            self.conn.commit()
+        except sqlite3.IntegrityError:
+            self.conn.rollback()
+            raise ConflictError(conflict_message)
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+        self.reference_cache.invalidate(table)
+
+    def get_budget(self, user_id=None):
+        """ Бюджеты (id, category_id, amount, month); для user_id - его личные и общие (user_id IS NULL) """
+        if user_id is None:
+            return money_columns(self._read("SELECT id, category_id, amount, month FROM budget"), 2)
+        return money_columns(self._read("""
+            SELECT id, category_id, amount, month FROM budget WHERE user_id = ?
+            UNION ALL
+            SELECT id, category_id, amount, month FROM budget WHERE user_id IS NULL
+        """, (user_id, )), 2)
+
+    def get_budget_view(self, month=None, user_id=None):
+        """ Бюджеты с названием категории и расходом из месячных итогов.
+
+        Возвращает (id, category, month, amount, spent, remaining, percent). Для бюджета
+        без месяца берется месяц month (по умолчанию текущий). С user_id - бюджеты
+        пользователя и общие, а расход считается только по его счетам.
+        """
+        month = month or datetime.now().strftime("%Y-%m")
+        sql = """
+            SELECT b.id, c.name, COALESCE(b.month, ?), b.amount, b.category_id
+            FROM budget b
+            LEFT JOIN categories c ON c.id = b.category_id
+        """
+        if user_id is None:
+            rows = self._read(sql, (month,))
+        else:
+            rows = self._read(sql + " WHERE b.user_id = ? OR b.user_id IS NULL", (month, user_id))
+        spent = self._month_spent([row[2] for row in rows], user_id)
+        rows = [row[:4] + (spent.get((row[4], row[2]), 0),) for row in rows]
+        return money_columns([row + self._budget_remaining(row[3], row[4]) for row in rows], 3, 4, 5)
+
+    def get_budget_status(self, month, user_id=None):
+        """ Исполнение бюджета за месяц (YYYY-MM) по всем категориям.
+
+        Возвращает (category_id, category, budget, spent, remaining, percent), где budget -
+        бюджет на этот месяц, а если его нет - бюджет без месяца. Расход берется из
+        category_month_totals, таблица транзакций не читается. С user_id учитываются
+        бюджеты пользователя и общие, а расход - по его счетам через индекс (account_id, date).
+        Расход в валютах счетов пересчитывается в BASE_CURRENCY (см. _month_spent).
+        """
+        if user_id is None:
+            rows = self._read("""
+                SELECT c.id, c.name,
+                       COALESCE(
+                           (SELECT SUM(amount) FROM budget WHERE category_id = c.id AND month = ?),
+                           (SELECT SUM(amount) FROM budget WHERE category_id = c.id AND month IS NULL)
+                       )
+                FROM categories c
+                ORDER BY c.id
+            """, (month, ))
+        else:
+            own = "category_id = c.id AND (user_id = ? OR user_id IS NULL)"
+            rows = self._read(f"""
+                SELECT c.id, c.name,
+                       COALESCE(
+                           (SELECT SUM(amount) FROM budget WHERE {own} AND month = ?),
+                           (SELECT SUM(amount) FROM budget WHERE {own} AND month IS NULL)
+                       )
+                FROM categories c
+                ORDER BY c.id
+            """, (user_id, month, user_id))
+        spent = self._month_spent([month], user_id)
+        rows = [row + (spent.get((row[0], month), 0),) for row in rows]
+        return money_columns([row + self._budget_remaining(row[2], row[3]) for row in rows], 2, 3, 4)
+
+    def _month_spent(self, months, user_id=None):
+        """ Расход по категориям за месяцы months: {(category_id, месяц): копейки BASE_CURRENCY}.
+
+        Итоги хранятся по валютам счетов; сумма в другой валюте пересчитывается по курсу
+        на конец месяца, а для текущего месяца - на сегодня. Без курса - NotFoundError.
+        """
+        spent, rates = {}, {}
+        for month in set(months):
+            try:
+                month_end(month)
+            except ValueError:
+                raise ValidationError("Неверный формат месяца, используйте YYYY-MM")
+            if user_id is None:
+                rows = self._read("SELECT category_id, currency, spent FROM category_month_totals WHERE month = ?",
+                                  (month,))
+            else:
+                rows = self._read(USER_MONTH_SPENT_SQL, (user_id, month, month))
+            for category_id, currency, cents in rows:
+                key = (category_id, month)
+                spent[key] = spent.get(key, 0) + cents * self._base_rate(currency, month, rates)
+        return {key: round(cents) for key, cents in spent.items()}
+
+    def _base_rate(self, currency, month, rates):
+        # Курс к BASE_CURRENCY для итогов за месяц. Читается через пул, а не через RateCache:
+        # тот работает с соединением для записи, а отчеты бюджета выполняются параллельно
+        # (CONCURRENT_READ_METHODS). rates - курсы одного отчета
+        if currency == BASE_CURRENCY:
+            return 1
+        if (currency, month) not in rates:
+            on = min(month_end(month), date.today()).isoformat()
+            rows = self._read(RATE_SQL, (currency, on))
+            if not rows:
+                raise NotFoundError(f"Нет курса {currency} на {on}")
+            rates[currency, month] = rows[0][0]
+        return rates[currency, month]
+
+    def _budget_remaining(self, budget, spent):
+        # (остаток, процент исполнения) или (None, None) для категории без бюджета; суммы в копейках
+        if budget is None:
+            return None, None
+        percent = round(spent / budget * 100, 1) if budget else None
+        return budget - spent, percent
+
+    def add_budget(self, category_name, amount, month=None, user_id=None):
+        # Бюджет без user_id общий для всех пользователей
+        # Get category ID from name
+        category_id = self.reference_cache.get_id('categories', category_name)
+        if category_id is None:
+            raise NotFoundError(f"Категория не найдена: {category_name}")
+        if month:
+            # Проверяем формат месяца YYYY-MM
+            try:
+                datetime.strptime(month, "%Y-%m")
+            except ValueError:
+                raise ValidationError("Неверный формат месяца, используйте YYYY-MM")
+
+        amount = Money.parse(amount)
+        try:
+            self.cursor.execute("INSERT INTO budget (category_id, amount, month, user_id) VALUES (?, ?, ?, ?)",
+                                (category_id, amount.cents, month or None, user_id))
+            self.conn.commit()
+        except sqlite3.IntegrityError:
+            # Внешний ключ: пользователя user_id нет или категорию успели удалить
+            self.conn.rollback()
+            raise ValidationError(f"Бюджет ссылается на несуществующую запись: пользователь {user_id}, "
+                                  f"категория {category_name}")
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+
+    def rebuild_month_totals(self):
+        """ Пересчитывает месячные итоги категорий по всем транзакциям """
+        try:
+            migrations.rebuild_month_totals(self.cursor)
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+
+    def get_users(self, user_id=None):
+        # Пользователь после входа видит только себя
+        if user_id is None:
+            return self._read("SELECT * FROM users")
+        return self._read("SELECT * FROM users WHERE id = ?", (user_id,))
+
+    def add_user(self, username, password):
+        self._add_reference('users', "INSERT INTO users (username, password) VALUES (?, ?)", (username, password),
+                            "Пользователь с таким именем уже существует")
+
+    def get_accounts(self, user_id=None):
+        sql = "SELECT id, user_id, name, balance, opening_balance, currency FROM accounts"
+        if user_id is None:
+            return money_columns(self._read(sql), 3, 4)
+        return money_columns(self._read(sql + " WHERE user_id = ?", (user_id,)), 3, 4)
+
+    def get_accounts_view(self, user_id=None):
+        """ Счета с именем пользователя: (id, username, name, balance, currency) """
+        sql = """
+            SELECT a.id, u.username, a.name, a.balance, a.currency
+            FROM accounts a
+            LEFT JOIN users u ON u.id = a.user_id
+        """
+        if user_id is None:
+            return money_columns(self._read(sql), 3)
+        return money_columns(self._read(sql + " WHERE a.user_id = ?", (user_id,)), 3)
+
+    def add_account(self, username, name, balance, currency=BASE_CURRENCY):
+        # Получаем user_id по имени пользователя
+        user_id = self.reference_cache.get_id('users', username)
+        if user_id is None:
+            raise NotFoundError("Пользователь не найден")
+        balance = Money.parse(balance)
+        currency = currency_code(currency)
+        try:
+            # Добавляем счет с user_id; баланс и суммы транзакций счета - в его валюте
+            self.cursor.execute("INSERT INTO accounts (user_id, name, balance, currency) VALUES (?, ?, ?, ?)",
+                                (user_id, name, balance.cents, currency))
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+
+    def add_fx_rates(self, rows):
+        """ Курсы валют: rows - набор (currency, date, rate), rate - цена единицы валюты в BASE_CURRENCY.
+
+        Курс на ту же дату заменяется. Все строки проверяются до записи и пишутся одной
+        транзакцией. Возвращает число записанных курсов.
+        """
+        rates = []
+        for currency, on, rate in rows:
+            currency = currency_code(currency)
+            if currency == BASE_CURRENCY:
+                raise ValidationError(f"Курс базовой валюты {BASE_CURRENCY} всегда 1")
+            try:
+                on = parse_date(on)
+                rate = float(rate)
+            except (TypeError, ValueError):
+                raise ValidationError(f"Неверный курс {currency} на {on}: {rate}")
+            if not rate > 0:
+                raise ValidationError(f"Курс должен быть положительным: {rate}")
+            rates.append((currency, on, rate))
+        try:
+            self.cursor.executemany("INSERT OR REPLACE INTO fx_rates (currency, date, rate) VALUES (?, ?, ?)", rates)
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+        self.rate_cache.invalidate()
+        return len(rates)
+
+    def set_fx_rate(self, currency, on, rate):
+        self.add_fx_rates([(currency, on, rate)])
+
+    def get_fx_rates(self, currency=None):
+        """ Курсы (currency, date, rate) по валюте и дате """
+        if currency is None:
+            return self._read("SELECT currency, date, rate FROM fx_rates ORDER BY currency, date")
+        return self._read("SELECT currency, date, rate FROM fx_rates WHERE currency = ? ORDER BY date",
+                          (currency_code(currency),))
+
+    def convert(self, amount, currency, to=BASE_CURRENCY, on=None):
+        """ Сумма amount в валюте currency, пересчитанная в валюту to по курсам на дату on (по умолчанию сегодня) """
+        amount = Money.parse(amount)
+        currency, to = currency_code(currency), currency_code(to)
+        if currency == to:
+            return amount
+        on = parse_date(on or date.today())
+        self.rate_cache.sync()
+        return Money(amount.cents * self.rate_cache.get(currency, on) / self.rate_cache.get(to, on))
+
+    def get_consolidated_balances(self, currency=BASE_CURRENCY, on=None, user_id=None):
+        """ Балансы счетов в одной валюте по курсам на дату on (по умолчанию сегодня).
+
+        Возвращает (строки, итог): строки - (id, username, name, balance, currency, converted),
+        balance - в валюте счета, converted и итог - Money в валюте currency.
+        """
+        currency = currency_code(currency)
+        on = parse_date(on or date.today())
+        self.rate_cache.sync()
+        target = self.rate_cache.get(currency, on)
+        rows = []
+        total = 0
+        for account in self.get_accounts_view(user_id):
+            cents = account[3].cents if account[3] is not None else 0
+            converted = cents if account[4] == currency else cents * self.rate_cache.get(account[4], on) / target
+            rows.append(account + (Money(converted),))
+            total += converted
+        return rows, Money(total)
+
+    def get_consolidated_totals(self, start, end, currency=BASE_CURRENCY, user_id=None):
+        """ Расходы и доходы по категориям за период start..end в одной валюте.
+
+        Каждая сумма пересчитывается по курсу на дату транзакции. Транзакции суммируются
+        в SQL по (категория, дата) с парой сумм на каждую валюту счетов, а курс берется
+        из кэша один раз на валюту и дату, а не на строку. Транзакции без счета - в базовой
+        валюте. Возвращает список (category, spent, income), суммы - Money в валюте currency.
+        """
+        currency = currency_code(currency)
+        currencies = [row[0] for row in self._read("SELECT DISTINCT currency FROM accounts ORDER BY currency")]
+        if BASE_CURRENCY not in currencies:
+            currencies.append(BASE_CURRENCY)
+        # Группы (категория, дата) идут в порядке индекса (category_id, date), без сортировки
+        columns = ", ".join(
+            "SUM(CASE WHEN COALESCE(a.currency, ?) = ? AND ty.sign < 0 THEN t.amount END), "
+            "SUM(CASE WHEN COALESCE(a.currency, ?) = ? AND ty.sign > 0 THEN t.amount END)"
+            for _ in currencies)
+        params = [value for code in currencies for value in (BASE_CURRENCY, code, BASE_CURRENCY, code)]
+        conditions = ["t.date BETWEEN ? AND ?"]
+        params += [parse_date(start), parse_date(end)]
+        if user_id is None:
+            source = "transactions t LEFT JOIN accounts a ON a.id = t.account_id"
+        else:
+            # Как в USER_TRANSACTION_VIEW_SQL: от счетов пользователя к их транзакциям
+            source = "accounts a CROSS JOIN transactions t ON t.account_id = a.id"
+            conditions.append("a.user_id = ?")
+            params.append(user_id)
+        groups = self._read(f"""
+            SELECT c.name, t.date, {columns}
+            FROM {source}
+            LEFT JOIN categories c ON c.id = t.category_id
+            LEFT JOIN transaction_types ty ON ty.id = t.type_id
+            WHERE {" AND ".join(conditions)}
+            GROUP BY t.category_id, t.date
+        """, params)
+        self.rate_cache.sync()
+        totals = {}
+        for category, on, *sums in groups:
+            spent, income = totals.get(category, (0, 0))
+            for index, code in enumerate(currencies):
+                group_spent, group_income = sums[2 * index] or 0, sums[2 * index + 1] or 0
+                if not group_spent and not group_income:
+                    continue
+                rate = 1.0 if code == currency else self.rate_cache.get(code, on) / self.rate_cache.get(currency, on)
+                spent += group_spent * rate
+                income += group_income * rate
+            totals[category] = (spent, income)
+        return [(category, Money(spent), Money(income))
+                for category, (spent, income) in sorted(totals.items(), key=lambda item: item[0] or '')]
+
+    def get_transaction_types(self):
+        return self._read("SELECT * FROM transaction_types")
+
+    def add_transaction_type(self, name, sign):
+        """ Тип транзакции со знаком sign: -1 - расход (уменьшает баланс), 1 - доход """
+        self._add_reference('transaction_types', "INSERT INTO transaction_types (name, sign) VALUES (?, ?)",
+                            (name, self._type_sign(sign)), f"Тип транзакции уже существует: {name}")
+
+    def set_transaction_type_sign(self, name, sign):
+        """ Задает знак типа name (например, старого типа без знака) и пересчитывает балансы и итоги """
+        sign = self._type_sign(sign)
+        try:
+            self.cursor.execute("UPDATE transaction_types SET sign = ? WHERE name = ?", (sign, name))
+            if not self.cursor.rowcount:
+                raise NotFoundError(f"Тип транзакции не найден: {name}")
+            # Триггеры таблицы транзакций смену знака типа не видят
+            migrations.rebuild_balances(self.cursor)
+            migrations.rebuild_month_totals(self.cursor)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    @staticmethod
+    def _type_sign(sign):
+        if sign not in (-1, 1):
+            raise ValidationError(f"Знак типа транзакции должен быть -1 (расход) или 1 (доход): {sign}")
+        return sign
+
+    def get_transaction_type_mapping(self):
+        return self._read("SELECT * FROM transaction_type_mapping")
+
+    def add_transaction_type_mapping(self, transaction_id, type_id):
+        self.cursor.execute("INSERT INTO transaction_type_mapping (transaction_id, type_id) VALUES (?, ?)",
+                            (transaction_id, type_id))
+        self.conn.commit()
+
+    def get_transaction_tags(self):
+        """ Пары (transaction_id, имя тега) """
+        return self._read("""
+            SELECT tt.transaction_id, tg.name
+            FROM transaction_tags tt
+            JOIN tags tg ON tg.id = tt.tag_id
+        """)
+
+    def add_transaction_tag(self, transaction_id, tag):
+        tags = split_tags([tag])
+        if not tags:
+            raise ValidationError("Пустой тег")
+        try:
+            tag_id = self._resolve_tags(tags)[tags[0]]
+            self.cursor.execute("INSERT OR IGNORE INTO transaction_tags (transaction_id, tag_id) VALUES (?, ?)",
+                                (transaction_id, tag_id))
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            self.reference_cache.invalidate('tags')
+            raise
+
+    def get_tags(self):
+        return self._read("SELECT * FROM tags ORDER BY name")
+
+    def get_tag_counts(self, user_id=None):
+        """ (тег, число транзакций) по убыванию числа; считается по индексу (tag_id, transaction_id).
+
+        С user_id считаются только транзакции его счетов: от счетов к транзакциям и их тегам.
+        """
+        if user_id is None:
+            return self._read("""
+                SELECT tg.name, c.count
+                FROM (SELECT tag_id, COUNT(*) AS count FROM transaction_tags GROUP BY tag_id) c
+                JOIN tags tg ON tg.id = c.tag_id
+                ORDER BY c.count DESC, tg.name
+            """)
+        return self._read("""
+            SELECT tg.name, c.count
+            FROM (
+                SELECT x.tag_id, COUNT(*) AS count
+                FROM accounts a
+                CROSS JOIN transactions t ON t.account_id = a.id
+                JOIN transaction_tags x ON x.transaction_id = t.id
+                WHERE a.user_id = ?
+                GROUP BY x.tag_id
+            ) c
+            JOIN tags tg ON tg.id = c.tag_id
+            ORDER BY c.count DESC, tg.name
+        """, (user_id,))
+
+    def get_transactions_by_tags(self, tags, match_all=True, limit=None, user_id=None):
+        """ Строки TRANSACTION_VIEW_SQL с тегами tags: со всеми (match_all) или хотя бы с одним.
+
+        Для каждого тега берется диапазон индекса (tag_id, transaction_id), а списки
+        транзакций пересекаются (INTERSECT) или объединяются (UNION).
+        """
+        tag_ids = self.reference_cache.get_ids('tags')
+        names = split_tags(tags)
+        ids = [tag_ids[name] for name in names if name in tag_ids]
+        if not ids or (match_all and len(ids) < len(names)):
+            return []
+        operator = " INTERSECT " if match_all else " UNION "
+        matching = operator.join(["SELECT transaction_id FROM transaction_tags WHERE tag_id = ?"] * len(ids))
+        conditions, params = [f"t.id IN ({matching})"], list(ids)
+        if user_id is not None:
+            conditions.append(USER_TRANSACTIONS_SQL)
+            params.append(user_id)
+        sql = TRANSACTION_VIEW_SQL + " WHERE " + " AND ".join(conditions) + " ORDER BY t.date DESC, t.id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return money_columns(self._read(sql, params), 1)
+
+    def get_tag_month_totals(self, tags=None, start_month=None, end_month=None, user_id=None):
+        """ Итоги по тегам и месяцам: (тег, месяц YYYY-MM, расход, доход).
+
+        tags ограничивает выборку заданными тегами, start_month и end_month - диапазоном месяцев,
+        user_id - транзакциями счетов пользователя. Суммы в BASE_CURRENCY: итоги считаются
+        по валютам счетов и пересчитываются по курсу на конец месяца, как в _month_spent.
+        """
+        conditions, params = [], []
+        if tags is not None:
+            tag_ids = self.reference_cache.get_ids('tags')
+            ids = [tag_ids[name] for name in split_tags(tags) if name in tag_ids]
+            if not ids:
+                return []
+            conditions.append(f"tt.tag_id IN ({', '.join('?' * len(ids))})")
+            params.extend(ids)
+        if start_month:
+            conditions.append("t.date >= ?")
+            params.append(start_month)
+        if end_month:
+            # Конец месяца включительно: все даты месяца меньше 'YYYY-MM~'
+            conditions.append("t.date < ?")
+            params.append(end_month + "~")
+        if user_id is not None:
+            conditions.append(USER_TRANSACTIONS_SQL)
+            params.append(user_id)
+        where = "WHERE " + " AND ".join(conditions) if conditions else ""
+        rows = self._read(f"""
+            SELECT tg.name, substr(t.date, 1, 7) AS month, COALESCE(a.currency, ?) AS currency,
+                   SUM(CASE WHEN ty.sign < 0 THEN t.amount ELSE 0 END),
+                   SUM(CASE WHEN ty.sign > 0 THEN t.amount ELSE 0 END)
+            FROM transaction_tags tt
+            JOIN tags tg ON tg.id = tt.tag_id
+            JOIN transactions t ON t.id = tt.transaction_id
+            LEFT JOIN accounts a ON a.id = t.account_id
+            LEFT JOIN transaction_types ty ON ty.id = t.type_id
+            {where}
+            GROUP BY tt.tag_id, month, currency
+            ORDER BY tg.name, month
+        """, [BASE_CURRENCY] + params)
+        totals, rates = {}, {}
+        for name, month, currency, spent, income in rows:
+            rate = self._base_rate(currency, month, rates)
+            total = totals.setdefault((name, month), [0, 0])
+            total[0] += spent * rate
+            total[1] += income * rate
+        return money_columns([(name, month, round(spent), round(income))
+                              for (name, month), (spent, income) in totals.items()], 2, 3)
@@ -0,0 +1,179 @@
+""" Генератор синтетической базы finance.db для нагрузочных тестов.
+
+Создает пользователей со счетами, категории, теги, месячные бюджеты и заданное число
+транзакций. Суммы распределены логнормально со своим масштабом для каждой категории,
+доходы приходят редко, но в сумме покрывают расходы, расходы чаще бывают в выходные. Данные пишутся через
+FinanceApp.add_transactions_bulk, поэтому балансы, месячные итоги и поисковый индекс
+согласованы так же, как в рабочей базе. При одинаковом --seed база получается одинаковой.
+
+Пример:
+    python generate_data.py bench.db --users 20 --transactions 2000000
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+import bd_create
+from finance_app import FinanceApp
+from money import Money
+
+# Категория расходов -> (медиана суммы, разброс логнормального распределения, частота, описания)
+EXPENSE_CATEGORIES = {
+    'Продукты': (1500, 0.8, 30, ('Покупка в магазине', 'Супермаркет', 'Рынок', 'Пекарня')),
+    'Транспорт': (300, 0.9, 15, ('Такси', 'Метро', 'Бензин', 'Парковка')),
+    'Жилье': (35000, 0.2, 1, ('Аренда квартиры', 'Ипотека')),
+    'Коммунальные услуги': (6000, 0.4, 2, ('Электричество', 'Вода', 'Интернет', 'Телефон')),
+    'Развлечения': (2000, 1.0, 6, ('Кино', 'Ресторан', 'Концерт', 'Кофе с друзьями')),
+    'Здоровье': (2500, 1.1, 2, ('Аптека', 'Врач', 'Анализы')),
+    'Одежда': (4000, 0.9, 2, ('Одежда', 'Обувь', 'Магазин одежды')),
+    'Подарки': (3000, 0.8, 1, ('Подарок', 'Цветы')),
+}
+
+# Категория доходов -> (медиана суммы, разброс, описания); суммы масштабируются под число расходов
+INCOME_CATEGORIES = {
+    'Зарплата': (120000, 0.1, ('Зарплата за месяц',)),
+    'Фриланс': (25000, 0.7, ('Оплата проекта', 'Консультация')),
+    'Инвестиции': (5000, 1.0, ('Дивиденды', 'Купон по облигациям')),
+}
+
+TAG_WORDS = ('семья', 'работа', 'отпуск', 'дети', 'дом', 'машина', 'онлайн', 'наличные', 'кэшбэк', 'срочно')
+
+
+def lognormal_money(median, sigma):
+    return Money(max(1, round(random.lognormvariate(math.log(median * 100), sigma))))
+
+
+def mean_amount(median, sigma):
+    # Среднее логнормального распределения с заданной медианой
+    return median * math.exp(sigma ** 2 / 2)
+
+
+def random_date(start, days):
+    # Выходные в полтора раза вероятнее будних дней
+    while True:
+        day = start + timedelta(days=random.randrange(days))
+        if day.weekday() >= 5 or random.random() < 2 / 3:
+            return day.isoformat()
+
+
+def make_tags(count):
+    tags = list(TAG_WORDS)
+    while len(tags) < count:
+        tags.append(f"{random.choice(TAG_WORDS)}-{len(tags)}")
+    return tags[:count]
+
+
+def generate_transactions(count, start, days, accounts, tags, tag_share):
+    """ Генератор строк (amount, category, description, date, type, tags, account_id) для add_transactions_bulk """
+    expense_names = list(EXPENSE_CATEGORIES)
+    expense_weights = [EXPENSE_CATEGORIES[name][2] for name in expense_names]
+    months = max(1, days // 30)
+    # Доходы: по одному на счет и месяц для каждой категории доходов, но не больше 5% строк
+    incomes_per_month = len(accounts) * len(INCOME_CATEGORIES)
+    income_share = min(0.05, incomes_per_month * months / max(count, 1))
+    # Доходы увеличиваются так, чтобы в среднем покрывать расходы с запасом 5% и балансы не уходили в минус
+    expense_mean = sum(weight * mean_amount(*EXPENSE_CATEGORIES[name][:2])
+                       for name, weight in zip(expense_names, expense_weights)) / sum(expense_weights)
+    income_mean = sum(mean_amount(median, sigma) for median, sigma, _ in INCOME_CATEGORIES.values()) / len(INCOME_CATEGORIES)
+    income_scale = max(1.0, 1.05 * (1 - income_share) * expense_mean / (income_share * income_mean)) if income_share else 1.0
+    for _ in range(count):
+        account_id = random.choice(accounts)
+        if random.random() < income_share:
+            category = random.choice(list(INCOME_CATEGORIES))
+            median, sigma, descriptions = INCOME_CATEGORIES[category]
+            median *= income_scale
+            type_name = 'Доход'
+        else:
+            category = random.choices(expense_names, expense_weights)[0]
+            median, sigma, frequency, descriptions = EXPENSE_CATEGORIES[category]
+            type_name = 'Расход'
+        row_tags = random.sample(tags, random.randint(1, 3)) if tags and random.random() < tag_share else None
+        yield (lognormal_money(median, sigma), category, random.choice(descriptions),
+               random_date(start, days), type_name, row_tags, account_id)
+
+
+def generate(db_file, users=10, accounts_per_user=2, transactions=1000000, tag_count=50, tag_share=0.3,
+             years=3, batch_size=10000, report=None):
+    """ Создает базу db_file и заполняет ее. Возвращает словарь со статистикой """
+    started = time.perf_counter()
+    bd_create.create_database(db_file)
+
+    # Генерация - разовая операция: fsync на каждую пачку не нужен
+    app = FinanceApp(db_file, pragmas={'synchronous': 'OFF'})
+    try:
+        app.add_transaction_type('Расход', -1)
+        app.add_transaction_type('Доход', 1)
+        for name in list(EXPENSE_CATEGORIES) + list(INCOME_CATEGORIES):
+            app.add_category(name)
+        for number in range(1, users + 1):
+            username = f"user{number}"
+            app.add_user(username, f"password{number}")
+            for account_number in range(1, accounts_per_user + 1):
+                app.add_account(username, f"Счет {account_number} пользователя {number}",
+                                lognormal_money(50000, 1.0))
+        for name, (median, sigma, frequency, descriptions) in EXPENSE_CATEGORIES.items():
+            # Месячный бюджет с запасом к среднему расходу категории на всех пользователей
+            app.add_budget(name, Money(median * 100 * frequency * users * accounts_per_user * 1.2))
+
+        accounts = [row[0] for row in app.get_accounts()]
+        start = date.today() - timedelta(days=365 * years)
+        rows = generate_transactions(transactions, start, 365 * years, accounts, make_tags(tag_count), tag_share)
+        inserted = 0
+        while inserted < transactions:
+            chunk = [row for _, row in zip(range(batch_size), rows)]
+            if not chunk:
+                break
+            count, rejected = app.add_transactions_bulk(chunk, batch_size)
+            if rejected:
+                raise RuntimeError(f"Генератор создал некорректные строки: {rejected[:3]}")
+            inserted += count
+            if report:
+                report(inserted, transactions)
+        app.conn.execute("PRAGMA optimize")
+    finally:
+        app.close()
+    seconds = time.perf_counter() - started
+    return {'transactions': inserted, 'seconds': seconds, 'rows_per_second': inserted / seconds if seconds else 0.0}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Генерация синтетической базы для нагрузочных тестов")
+    parser.add_argument('path', nargs='?', default='finance.db')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--accounts-per-user', type=int, default=2)
+    parser.add_argument('--transactions', type=int, default=1000000)
+    parser.add_argument('--tags', type=int, default=50, help="размер словаря тегов")
+    parser.add_argument('--tag-share', type=float, default=0.3, help="доля транзакций с тегами")
+    parser.add_argument('--years', type=int, default=3, help="глубина истории в годах")
+    parser.add_argument('--batch-size', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--force', action='store_true', help="перезаписать существующий файл")
+    args = parser.parse_args(argv)
+
+    if os.path.exists(args.path):
+        if not args.force:
+            print(f"{args.path} уже существует, используйте --force", file=sys.stderr)
+            return 1
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.path + suffix):
+                os.remove(args.path + suffix)
+
+    random.seed(args.seed)
+
+    def report(done, total):
+        print(f"\rТранзакций: {done}/{total}", end='', file=sys.stderr)
+
+    stats = generate(args.path, args.users, args.accounts_per_user, args.transactions, args.tags,
+                     args.tag_share, args.years, args.batch_size, report)
+    print(file=sys.stderr)
+    print(f"Создано транзакций: {stats['transactions']}, время: {stats['seconds']:.1f} с, "
+          f"{stats['rows_per_second']:.0f} строк/с")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+""" Потоковый импорт банковских выписок (CSV и OFX) в finance.db.
+
+Файл читается построчно и проходит через цепочку генераторов: разбор, нормализация,
+сопоставление категорий и запись пачками через FinanceApp.add_transactions_bulk,
+поэтому расход памяти не зависит от размера выписки.
+
+Пример:
+    python importer.py statement.csv --account 1 --default-category Продукты
+"""
+import argparse
+import csv
+import re
+import sys
+import time
+
+from dates import parse_date
+from finance_app import FinanceApp
+from money import Money
+
+# Поле транзакции -> возможные названия колонки в выписке (в нижнем регистре)
+COLUMN_ALIASES = {
+    'date': ('date', 'дата', 'дата операции', 'transaction date', 'posted date'),
+    'amount': ('amount', 'сумма', 'сумма операции', 'sum'),
+    'description': ('description', 'описание', 'назначение платежа', 'memo', 'details'),
+    'category': ('category', 'категория'),
+    'type': ('type', 'тип'),
+    'tags': ('tags', 'теги'),
+}
+
+OFX_FIELD_RE = re.compile(r"<(\w+)>([^<\r\n]*)")
+
+
+def read_csv(path, delimiter=None, encoding='utf-8-sig'):
+    """ Генератор (номер строки, запись) по CSV-выписке """
+    with open(path, newline='', encoding=encoding) as f:
+        if delimiter is None:
+            delimiter = csv.Sniffer().sniff(f.readline(), delimiters=",;\t").delimiter
+            f.seek(0)
+        reader = csv.DictReader(f, delimiter=delimiter)
+        header = {name.strip().lower(): name for name in reader.fieldnames or []}
+        columns = {}
+        for field, aliases in COLUMN_ALIASES.items():
+            for alias in aliases:
+                if alias in header:
+                    columns[field] = header[alias]
+                    break
+        missing = [field for field in ('date', 'amount') if field not in columns]
+        if missing:
+            raise ValueError(f"В выписке нет колонок: {', '.join(missing)}")
+        for row in reader:
+            yield reader.line_num, {field: row.get(column) for field, column in columns.items()}
+
+
+def read_ofx(path, encoding='utf-8'):
+    """ Генератор (номер строки, запись) по блокам <STMTTRN> выписки OFX """
+    with open(path, encoding=encoding, errors='replace') as f:
+        block = None
+        start_line = 0
+        for line_no, line in enumerate(f, 1):
+            while line:
+                if block is None:
+                    start = line.find('<STMTTRN>')
+                    if start < 0:
+                        break
+                    block, start_line, line = [], line_no, line[start + len('<STMTTRN>'):]
+                end = line.find('</STMTTRN>')
+                if end < 0:
+                    block.append(line)
+                    break
+                block.append(line[:end])
+                fields = dict((tag.upper(), value.strip()) for tag, value in OFX_FIELD_RE.findall(''.join(block)))
+                yield start_line, {
+                    'date': fields.get('DTPOSTED', '')[:8],
+                    'amount': fields.get('TRNAMT'),
+                    'description': fields.get('MEMO') or fields.get('NAME', ''),
+                }
+                block, line = None, line[end + len('</STMTTRN>'):]
+
+
+def parse_amount(value):
+    # Банки пишут суммы с пробелами между разрядами и запятой в дробной части - Money.parse это понимает
+    return Money.parse(value or '')
+
+
+def normalize(records, category_map, default_category=None, account_id=None):
+    """ Генератор (номер строки, строка для add_transactions_bulk, ошибка) """
+    for line_no, record in records:
+        try:
+            amount = parse_amount(record.get('amount'))
+            date = parse_date(record.get('date'))
+            bank_category = (record.get('category') or '').strip()
+            category = category_map.get(bank_category, bank_category) or default_category
+            if not category:
+                raise ValueError("Не указана категория")
+            # Знак суммы определяет тип, если в выписке его нет
+            type_name = (record.get('type') or '').strip() or ('Расход' if amount.cents < 0 else 'Доход')
+            tags = record.get('tags') or None
+            yield line_no, (abs(amount), category, (record.get('description') or '').strip(), date,
+                            type_name, tags, account_id), None
+        except ValueError as e:
+            yield line_no, None, str(e)
+
+
+def batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def load_category_map(path):
+    """ CSV из двух колонок: категория банка, категория приложения """
+    if not path:
+        return {}
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        return dict((row[0].strip(), row[1].strip()) for row in csv.reader(f) if len(row) >= 2)
+
+
+def import_statement(app, records, category_map=None, default_category=None, account_id=None,
+                     batch_size=1000, report=None):
+    """ Импортирует записи выписки пачками. Возвращает словарь со статистикой """
+    started = time.perf_counter()
+    stats = {'read': 0, 'inserted': 0, 'rejected': 0}
+    for chunk in batched(normalize(records, category_map or {}, default_category, account_id), batch_size):
+        rows, lines = [], []
+        for line_no, row, error in chunk:
+            stats['read'] += 1
+            if error:
+                stats['rejected'] += 1
+                if report:
+                    report(line_no, error)
+                continue
+            rows.append(row)
+            lines.append(line_no)
+        inserted, rejected = app.add_transactions_bulk(rows, batch_size)
+        stats['inserted'] += inserted
+        stats['rejected'] += len(rejected)
+        if report:
+            for index, reason in rejected:
+                report(lines[index], reason)
+    stats['seconds'] = time.perf_counter() - started
+    stats['rows_per_second'] = stats['read'] / stats['seconds'] if stats['seconds'] else 0.0
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Импорт банковской выписки в finance.db")
+    parser.add_argument('path', help="файл выписки (.csv или .ofx)")
+    parser.add_argument('--db', default='finance.db')
+    parser.add_argument('--format', choices=('csv', 'ofx'), help="по умолчанию определяется по расширению")
+    parser.add_argument('--account', type=int, help="id счета для всех транзакций выписки")
+    parser.add_argument('--category-map', help="CSV: категория банка, категория приложения")
+    parser.add_argument('--default-category', help="категория для строк без категории")
+    parser.add_argument('--delimiter', help="разделитель CSV, по умолчанию определяется автоматически")
+    parser.add_argument('--encoding', default='utf-8-sig')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    file_format = args.format or ('ofx' if args.path.lower().endswith('.ofx') else 'csv')
+    if file_format == 'ofx':
+        records = read_ofx(args.path, args.encoding)
+    else:
+        records = read_csv(args.path, args.delimiter, args.encoding)
+
+    def report(line_no, reason):
+        print(f"Строка {line_no}: {reason}", file=sys.stderr)
+
+    app = FinanceApp(args.db)
+    stats = import_statement(app, records, load_category_map(args.category_map), args.default_category,
+                             args.account, args.batch_size, report)
+    print(f"Прочитано: {stats['read']}, добавлено: {stats['inserted']}, отклонено: {stats['rejected']}")
+    print(f"Время: {stats['seconds']:.2f} с, {stats['rows_per_second']:.0f} строк/с")
+    return 0 if not stats['rejected'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
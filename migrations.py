@@ -0,0 +1,659 @@
+import sqlite3
+import sys
+
+from dates import parse_date
+from money import BASE_CURRENCY
+
+
+class MigrationError(Exception):
+    """ Миграцию нельзя применить к данным базы без вмешательства пользователя """
+
+
+def _merge_duplicates(cursor, table, column, references):
+    # Перед созданием уникального индекса сливаем дубликаты в запись с минимальным id
+    duplicates = f"""
+        SELECT id FROM {table}
+        WHERE {column} IS NOT NULL
+          AND id NOT IN (SELECT MIN(id) FROM {table} WHERE {column} IS NOT NULL GROUP BY {column})
+    """
+    for ref_table, ref_column in references:
+        cursor.execute(f"""
+            UPDATE {ref_table} SET {ref_column} = (
+                SELECT MIN(keep.id) FROM {table} dup JOIN {table} keep ON keep.{column} = dup.{column}
+                WHERE dup.id = {ref_table}.{ref_column}
+            )
+            WHERE {ref_column} IN ({duplicates})
+        """)
+    cursor.execute(f"DELETE FROM {table} WHERE id IN ({duplicates})")
+
+
+def _add_indexes(cursor):
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions(date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_account_date ON transactions(account_id, date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_category_date ON transactions(category_id, date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transaction_tags_tag ON transaction_tags(tag)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transaction_tags_transaction ON transaction_tags(transaction_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transaction_type_mapping_transaction ON transaction_type_mapping(transaction_id)")
+    # Индексы для каскадного удаления пользователей и категорий
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_accounts_user ON accounts(user_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_budget_category ON budget(category_id)")
+
+    _merge_duplicates(cursor, "categories", "name", [("transactions", "category_id"), ("budget", "category_id")])
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_categories_name ON categories(name)")
+    # Одноименные пользователи с разными паролями - разные люди: их счета нельзя сливать
+    cursor.execute("""
+        SELECT username, group_concat(id, ', ') FROM users
+        WHERE username IS NOT NULL
+        GROUP BY username HAVING COUNT(DISTINCT quote(password)) > 1
+    """)
+    conflicts = cursor.fetchall()
+    if conflicts:
+        raise MigrationError("Пользователи с одинаковым именем и разными паролями: "
+                             + "; ".join(f"{name} (id {ids})" for name, ids in conflicts)
+                             + ". Переименуйте их и повторите обновление базы")
+    _merge_duplicates(cursor, "users", "username", [("accounts", "user_id")])
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_users_username ON users(username)")
+    _merge_duplicates(cursor, "transaction_types", "name", [("transaction_type_mapping", "type_id")])
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_transaction_types_name ON transaction_types(name)")
+
+
+# Строки без родительской записи: (таблица, условие). Порядок важен для sweep_orphans,
+# так как удаление счетов порождает осиротевшие транзакции, а транзакций - их типы и теги
+ORPHANS = [
+    ("accounts", "user_id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM users u WHERE u.id = accounts.user_id)"),
+    ("transactions", "account_id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM accounts a WHERE a.id = transactions.account_id)"),
+    ("transactions", "category_id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM categories c WHERE c.id = transactions.category_id)"),
+    ("budget", "category_id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM categories c WHERE c.id = budget.category_id)"),
+    ("transaction_type_mapping", "NOT EXISTS (SELECT 1 FROM transactions t WHERE t.id = transaction_type_mapping.transaction_id)"
+                                 " OR NOT EXISTS (SELECT 1 FROM transaction_types tt WHERE tt.id = transaction_type_mapping.type_id)"),
+    ("transaction_tags", "NOT EXISTS (SELECT 1 FROM transactions t WHERE t.id = transaction_tags.transaction_id)"),
+]
+
+
+def find_orphans(cursor):
+    """ Считает строки без родительской записи, ничего не удаляя. Возвращает {таблица: число строк}.
+
+    Строки, которые осиротеют только после удаления их родителей (транзакции
+    осиротевшего счета), здесь не учитываются.
+    """
+    found = {}
+    for table, condition in ORPHANS:
+        cursor.execute(f"SELECT COUNT(*) FROM {table} WHERE {condition}")
+        found[table] = found.get(table, 0) + cursor.fetchone()[0]
+    return found
+
+
+def sweep_orphans(cursor):
+    """ Удаляет строки без родительской записи, оставшиеся с тех пор, как внешние ключи не проверялись.
+
+    Удаление необратимо, поэтому выполняется только по запросу (FinanceApp.sweep_orphans),
+    а не миграцией. Каждая таблица чистится одним запросом.
+    Возвращает {таблица: число удаленных строк}.
+    """
+    removed = {}
+    for table, condition in ORPHANS:
+        cursor.execute(f"DELETE FROM {table} WHERE {condition}")
+        removed[table] = removed.get(table, 0) + cursor.rowcount
+    return removed
+
+
+def _keep_orphans(cursor):
+    # Раньше здесь вызывался sweep_orphans, и первый запуск после обновления молча удалял
+    # транзакции и бюджеты удаленных категорий. Теперь осиротевшие строки остаются, пока
+    # их не удалят явно; номер миграции сохранен, чтобы не сдвигать версии баз
+    pass
+
+
+# Знак типа транзакции задается явно при создании типа: -1 - расход, 1 - доход.
+# Транзакция без типа (записана до того, как тип стал обязательным) или с типом без знака
+# баланс не меняет: направление такой суммы неизвестно, а баланс счета до миграции 3
+# вводился вручную и от транзакций не зависел
+SIGNED_AMOUNT_SQL = "{row}.amount * COALESCE((SELECT sign FROM transaction_types WHERE id = {row}.type_id), 0)"
+
+# Знаки стандартных типов, которые создает bd_create.populate_initial_data. Знак остальных
+# типов, существовавших до миграции 3, неизвестен (NULL): его задает FinanceApp.set_transaction_type_sign
+STANDARD_TYPE_SIGNS = {'Расход': -1, 'Доход': 1}
+
+
+def _add_balance_ledger(cursor):
+    # Тип транзакции хранится прямо в строке, чтобы триггеры знали знак суммы при вставке
+    cursor.execute("ALTER TABLE transactions ADD COLUMN type_id INTEGER REFERENCES transaction_types(id) ON DELETE SET NULL")
+    cursor.execute("""
+        UPDATE transactions SET type_id = (
+            SELECT type_id FROM transaction_type_mapping m
+            WHERE m.transaction_id = transactions.id ORDER BY m.rowid DESC LIMIT 1
+        )
+    """)
+    cursor.execute("ALTER TABLE transaction_types ADD COLUMN sign INTEGER CHECK (sign IN (-1, 1))")
+    cursor.executemany("UPDATE transaction_types SET sign = ? WHERE name = ?",
+                       [(sign, name) for name, sign in STANDARD_TYPE_SIGNS.items()])
+
+    # balance становится вычисляемым: начальный остаток плюс сумма транзакций счета
+    cursor.execute("ALTER TABLE accounts ADD COLUMN opening_balance REAL")
+    cursor.execute("UPDATE accounts SET opening_balance = balance")
+    _create_ledger_triggers(cursor)
+
+    # transaction_type_mapping остается источником типов для старого кода: держим type_id в согласии с ним
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_type_mapping_insert AFTER INSERT ON transaction_type_mapping
+        BEGIN
+            UPDATE transactions SET type_id = NEW.type_id
+            WHERE id = NEW.transaction_id AND type_id IS NOT NEW.type_id;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_type_mapping_delete AFTER DELETE ON transaction_type_mapping
+        BEGIN
+            UPDATE transactions SET type_id = (
+                SELECT type_id FROM transaction_type_mapping m
+                WHERE m.transaction_id = OLD.transaction_id ORDER BY m.rowid DESC LIMIT 1
+            )
+            WHERE id = OLD.transaction_id AND type_id IS OLD.type_id;
+        END
+    """)
+
+    rebuild_balances(cursor)
+
+
+def _create_ledger_triggers(cursor):
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_accounts_opening_balance AFTER INSERT ON accounts
+        WHEN NEW.opening_balance IS NULL
+        BEGIN
+            UPDATE accounts SET opening_balance = NEW.balance WHERE id = NEW.id;
+        END
+    """)
+
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_ledger_insert AFTER INSERT ON transactions
+        WHEN NEW.account_id IS NOT NULL
+        BEGIN
+            UPDATE accounts SET balance = balance + {SIGNED_AMOUNT_SQL.format(row='NEW')} WHERE id = NEW.account_id;
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_ledger_delete AFTER DELETE ON transactions
+        WHEN OLD.account_id IS NOT NULL
+        BEGIN
+            UPDATE accounts SET balance = balance - {SIGNED_AMOUNT_SQL.format(row='OLD')} WHERE id = OLD.account_id;
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_ledger_update AFTER UPDATE OF amount, account_id, type_id ON transactions
+        BEGIN
+            UPDATE accounts SET balance = balance - {SIGNED_AMOUNT_SQL.format(row='OLD')} WHERE id = OLD.account_id;
+            UPDATE accounts SET balance = balance + {SIGNED_AMOUNT_SQL.format(row='NEW')} WHERE id = NEW.account_id;
+        END
+    """)
+
+
+def rebuild_balances(cursor):
+    """ Пересчитывает балансы всех счетов одним групповым запросом.
+
+    Возвращает список расхождений (id счета, сохраненный баланс, правильный баланс)
+    и исправляет их.
+    """
+    cursor.execute(f"""
+        SELECT a.id, a.balance, COALESCE(a.opening_balance, 0) + COALESCE(SUM({SIGNED_AMOUNT_SQL.format(row='t')}), 0)
+        FROM accounts a
+        LEFT JOIN transactions t ON t.account_id = a.id
+        GROUP BY a.id
+    """)
+    drift = [(account_id, stored, expected) for account_id, stored, expected in cursor.fetchall()
+             if stored != expected]
+    cursor.executemany("UPDATE accounts SET balance = ? WHERE id = ?",
+                       [(expected, account_id) for account_id, stored, expected in drift])
+    return drift
+
+
+# Вклад транзакции в месячные итоги категории: расход - тип со знаком -1, доход - со знаком 1.
+# Транзакция без типа или с типом без знака не входит ни в расходы, ни в доходы - по тому же
+# правилу, по которому она не меняет баланс счета (SIGNED_AMOUNT_SQL). В итоги она попадает,
+# когда ее типу задают знак (FinanceApp.set_transaction_type_sign)
+SPENT_SQL = "CASE WHEN (SELECT sign FROM transaction_types WHERE id = {row}.type_id) < 0 THEN {row}.amount ELSE 0 END"
+INCOME_SQL = "CASE WHEN (SELECT sign FROM transaction_types WHERE id = {row}.type_id) > 0 THEN {row}.amount ELSE 0 END"
+# Валюта суммы транзакции - валюта ее счета; транзакция без счета - в базовой валюте
+CURRENCY_SQL = f"COALESCE((SELECT currency FROM accounts WHERE id = {{row}}.account_id), '{BASE_CURRENCY}')"
+
+
+def _add_month_totals(cursor):
+    # Бюджет без месяца действует каждый месяц, с месяцем (YYYY-MM) - только в нем
+    cursor.execute("ALTER TABLE budget ADD COLUMN month TEXT")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS category_month_totals (
+            category_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            spent REAL NOT NULL DEFAULT 0,
+            income REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (category_id, month)
+        ) WITHOUT ROWID
+    """)
+    _create_month_totals_triggers(cursor, currency=False)
+    rebuild_month_totals(cursor, currency=False)
+
+
+def _create_month_totals_triggers(cursor, currency=True):
+    # currency=False - итоги без валюты, как до миграции 11 (нужно миграциям 4 и 7)
+    key = "category_id, month, currency" if currency else "category_id, month"
+    add_new = f"""
+        INSERT INTO category_month_totals ({key}, spent, income)
+        SELECT NEW.category_id, substr(NEW.date, 1, 7),{f" {CURRENCY_SQL.format(row='NEW')}," if currency else ""}
+               {SPENT_SQL.format(row='NEW')}, {INCOME_SQL.format(row='NEW')}
+        WHERE NEW.category_id IS NOT NULL AND NEW.date IS NOT NULL
+        ON CONFLICT ({key}) DO UPDATE SET
+            spent = spent + excluded.spent,
+            income = income + excluded.income;
+    """
+    subtract_old = f"""
+        UPDATE category_month_totals SET
+            spent = spent - {SPENT_SQL.format(row='OLD')},
+            income = income - {INCOME_SQL.format(row='OLD')}
+        WHERE category_id = OLD.category_id AND month = substr(OLD.date, 1, 7)
+              {f"AND currency = {CURRENCY_SQL.format(row='OLD')}" if currency else ""};
+    """
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_month_totals_insert AFTER INSERT ON transactions
+        WHEN NEW.category_id IS NOT NULL AND NEW.date IS NOT NULL
+        BEGIN {add_new} END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_month_totals_delete AFTER DELETE ON transactions
+        WHEN OLD.category_id IS NOT NULL AND OLD.date IS NOT NULL
+        BEGIN {subtract_old} END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_month_totals_update
+        AFTER UPDATE OF amount, category_id, date, type_id{", account_id" if currency else ""} ON transactions
+        BEGIN {subtract_old} {add_new} END
+    """)
+    if currency:
+        # Каскадное удаление транзакций идет уже после удаления счета, когда валюту их сумм
+        # не узнать, поэтому транзакции счета удаляются раньше, пока счет еще есть
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_accounts_month_totals_delete BEFORE DELETE ON accounts
+            BEGIN
+                DELETE FROM transactions WHERE account_id = OLD.id;
+            END
+        """)
+        # Смена валюты счета с транзакциями переоценила бы уже учтенные в итогах суммы
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_accounts_currency_update BEFORE UPDATE OF currency ON accounts
+            WHEN NEW.currency IS NOT OLD.currency AND EXISTS (SELECT 1 FROM transactions WHERE account_id = OLD.id)
+            BEGIN
+                SELECT RAISE(ABORT, 'Нельзя сменить валюту счета с транзакциями');
+            END
+        """)
+
+
+def rebuild_month_totals(cursor, currency=True):
+    """ Пересчитывает category_month_totals по таблице транзакций одним групповым запросом """
+    cursor.execute("DELETE FROM category_month_totals")
+    if not currency:
+        cursor.execute("""
+            INSERT INTO category_month_totals (category_id, month, spent, income)
+            SELECT t.category_id, substr(t.date, 1, 7),
+                   SUM(CASE WHEN tt.sign < 0 THEN t.amount ELSE 0 END),
+                   SUM(CASE WHEN tt.sign > 0 THEN t.amount ELSE 0 END)
+            FROM transactions t
+            LEFT JOIN transaction_types tt ON tt.id = t.type_id
+            WHERE t.category_id IS NOT NULL AND t.date IS NOT NULL
+            GROUP BY t.category_id, substr(t.date, 1, 7)
+        """)
+        return
+    cursor.execute("""
+        INSERT INTO category_month_totals (category_id, month, currency, spent, income)
+        SELECT t.category_id, substr(t.date, 1, 7), COALESCE(a.currency, ?),
+               SUM(CASE WHEN tt.sign < 0 THEN t.amount ELSE 0 END),
+               SUM(CASE WHEN tt.sign > 0 THEN t.amount ELSE 0 END)
+        FROM transactions t
+        LEFT JOIN accounts a ON a.id = t.account_id
+        LEFT JOIN transaction_types tt ON tt.id = t.type_id
+        WHERE t.category_id IS NOT NULL AND t.date IS NOT NULL
+        GROUP BY t.category_id, substr(t.date, 1, 7), COALESCE(a.currency, ?)
+    """, (BASE_CURRENCY, BASE_CURRENCY))
+
+
+def _add_description_search(cursor):
+    # Полнотекстовый индекс по описаниям; сами тексты хранятся только в transactions
+    cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts USING fts5(
+            description,
+            content='transactions', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_fts_insert AFTER INSERT ON transactions
+        BEGIN
+            INSERT INTO transactions_fts (rowid, description) VALUES (NEW.id, NEW.description);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_fts_delete AFTER DELETE ON transactions
+        BEGIN
+            INSERT INTO transactions_fts (transactions_fts, rowid, description) VALUES ('delete', OLD.id, OLD.description);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_fts_update AFTER UPDATE OF id, description ON transactions
+        BEGIN
+            INSERT INTO transactions_fts (transactions_fts, rowid, description) VALUES ('delete', OLD.id, OLD.description);
+            INSERT INTO transactions_fts (rowid, description) VALUES (NEW.id, NEW.description);
+        END
+    """)
+    rebuild_search_index(cursor)
+
+
+def rebuild_search_index(cursor):
+    """ Перестраивает полнотекстовый индекс по содержимому transactions """
+    cursor.execute("INSERT INTO transactions_fts (transactions_fts) VALUES ('rebuild')")
+
+
+def _normalize_tags(cursor):
+    # Справочник тегов: имя хранится один раз, без пробелов по краям
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS tags (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        )
+    """)
+    cursor.execute("""
+        INSERT OR IGNORE INTO tags (name)
+        SELECT DISTINCT trim(tag) FROM transaction_tags WHERE trim(tag) <> ''
+    """)
+    # Связь транзакция - тег без дубликатов; ключ (transaction_id, tag_id) ищет теги транзакции,
+    # индекс (tag_id, transaction_id) - транзакции тега
+    cursor.execute("""
+        CREATE TABLE transaction_tags_new (
+            transaction_id INTEGER NOT NULL REFERENCES transactions(id) ON DELETE CASCADE,
+            tag_id INTEGER NOT NULL REFERENCES tags(id) ON DELETE CASCADE,
+            PRIMARY KEY (transaction_id, tag_id)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        INSERT OR IGNORE INTO transaction_tags_new (transaction_id, tag_id)
+        SELECT tt.transaction_id, tg.id
+        FROM transaction_tags tt
+        JOIN tags tg ON tg.name = trim(tt.tag)
+        WHERE EXISTS (SELECT 1 FROM transactions t WHERE t.id = tt.transaction_id)
+    """)
+    cursor.execute("DROP TABLE transaction_tags")
+    cursor.execute("ALTER TABLE transaction_tags_new RENAME TO transaction_tags")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transaction_tags_tag ON transaction_tags(tag_id, transaction_id)")
+
+
+# Денежные колонки: (таблица, колонка). После миграции 7 в них хранятся целые копейки.
+MONEY_COLUMNS = [
+    ("transactions", "amount"),
+    ("accounts", "balance"),
+    ("accounts", "opening_balance"),
+    ("budget", "amount"),
+]
+
+# Триггеры месячных итогов категорий; пересоздаются миграциями 7 и 11
+MONTH_TOTALS_TRIGGERS = [
+    "trg_transactions_month_totals_insert",
+    "trg_transactions_month_totals_delete",
+    "trg_transactions_month_totals_update",
+]
+# Триггеры, которые читают денежные колонки и пересоздаются вместе с ними
+MONEY_TRIGGERS = [
+    "trg_accounts_opening_balance",
+    "trg_transactions_ledger_insert",
+    "trg_transactions_ledger_delete",
+    "trg_transactions_ledger_update",
+] + MONTH_TOTALS_TRIGGERS
+
+
+def _convert_to_cents(cursor):
+    # Тип колонки в SQLite не меняется: заводим INTEGER-колонку, переносим в нее суммы
+    # в копейках, удаляем старую REAL-колонку и даем новой прежнее имя
+    for trigger in MONEY_TRIGGERS:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    for table, column in MONEY_COLUMNS:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column}_cents INTEGER")
+        cursor.execute(f"UPDATE {table} SET {column}_cents = CAST(round({column} * 100) AS INTEGER)")
+        cursor.execute(f"ALTER TABLE {table} DROP COLUMN {column}")
+        cursor.execute(f"ALTER TABLE {table} RENAME COLUMN {column}_cents TO {column}")
+
+    cursor.execute("DROP TABLE category_month_totals")
+    cursor.execute("""
+        CREATE TABLE category_month_totals (
+            category_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            spent INTEGER NOT NULL DEFAULT 0,
+            income INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (category_id, month)
+        ) WITHOUT ROWID
+    """)
+    _create_ledger_triggers(cursor)
+    _create_month_totals_triggers(cursor, currency=False)
+    rebuild_balances(cursor)
+    rebuild_month_totals(cursor, currency=False)
+
+
+def _normalize_dates(cursor):
+    # Даты писались в том виде, в каком их передал вызывающий код; приводим их к ISO-8601.
+    # Обновление даты через триггер переносит сумму в месячные итоги нужного месяца.
+    # Нераспознанные даты остаются как есть, чтобы не потерять данные
+    cursor.execute("""
+        SELECT id, date FROM transactions
+        WHERE date IS NOT NULL AND NOT (length(date) = 10 AND date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]')
+    """)
+    updates = []
+    for transaction_id, value in cursor.fetchall():
+        try:
+            updates.append((parse_date(value), transaction_id))
+        except ValueError:
+            continue
+    cursor.executemany("UPDATE transactions SET date = ? WHERE id = ?", updates)
+
+
+def _add_user_scoping(cursor):
+    # Личные бюджеты пользователей; у существующих бюджетов user_id IS NULL - они общие
+    cursor.execute("ALTER TABLE budget ADD COLUMN user_id INTEGER REFERENCES users(id) ON DELETE CASCADE")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_budget_user ON budget(user_id, category_id, month)")
+    # Транзакции пользователя читаются от его счетов по индексу transactions(account_id, date) из миграции 1
+
+
+def _add_recurring_rules(cursor):
+    # Правила регулярных транзакций; next_date - ближайшее еще не созданное повторение,
+    # NULL - правило завершено (прошла end_date)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS recurring_rules (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+            account_id INTEGER REFERENCES accounts(id) ON DELETE CASCADE,
+            category_id INTEGER NOT NULL REFERENCES categories(id) ON DELETE CASCADE,
+            type_id INTEGER REFERENCES transaction_types(id) ON DELETE SET NULL,
+            amount INTEGER NOT NULL,
+            description TEXT,
+            frequency TEXT NOT NULL,
+            interval INTEGER NOT NULL DEFAULT 1,
+            start_date TEXT NOT NULL,
+            end_date TEXT,
+            next_date TEXT
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_recurring_rules_next ON recurring_rules(next_date)")
+    # Транзакция помнит правило, по которому создана; пара (правило, дата) уникальна,
+    # поэтому повторный запуск планировщика не может создать повторение дважды
+    cursor.execute("ALTER TABLE transactions ADD COLUMN recurring_rule_id INTEGER "
+                   "REFERENCES recurring_rules(id) ON DELETE SET NULL")
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_recurring "
+                   "ON transactions(recurring_rule_id, date) WHERE recurring_rule_id IS NOT NULL")
+
+
+def _add_currencies(cursor):
+    # Валюта счета; суммы транзакций и баланс хранятся в валюте их счета.
+    # Существующие счета считаются счетами в базовой валюте
+    cursor.execute(f"ALTER TABLE accounts ADD COLUMN currency TEXT NOT NULL DEFAULT '{BASE_CURRENCY}'")
+    # Курс валюты к базовой на дату; для даты без курса действует последний курс до нее.
+    # Курса базовой валюты в таблице нет - он всегда 1
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS fx_rates (
+            currency TEXT NOT NULL,
+            date TEXT NOT NULL,
+            rate REAL NOT NULL,
+            PRIMARY KEY (currency, date)
+        ) WITHOUT ROWID
+    """)
+    # Месячные итоги категорий складывали копейки разных валют: теперь у каждой валюты
+    # счетов своя строка итогов, а пересчет в базовую валюту делают отчеты бюджета
+    for trigger in MONTH_TOTALS_TRIGGERS:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    cursor.execute("DROP TABLE category_month_totals")
+    cursor.execute("""
+        CREATE TABLE category_month_totals (
+            category_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            currency TEXT NOT NULL,
+            spent INTEGER NOT NULL DEFAULT 0,
+            income INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (category_id, month, currency)
+        ) WITHOUT ROWID
+    """)
+    _create_month_totals_triggers(cursor)
+    rebuild_month_totals(cursor)
+
+
+# Список миграций: (версия, описание, функция). Версия хранится в PRAGMA user_version.
+MIGRATIONS = [
+    (1, "Индексы для сортировки по дате, поиска по категориям, счетам и тегам", _add_indexes),
+    (2, "Осиротевшие строки не удаляются (см. FinanceApp.sweep_orphans)", _keep_orphans),
+    (3, "Балансы счетов, поддерживаемые триггерами по транзакциям", _add_balance_ledger),
+    (4, "Бюджеты по месяцам и месячные итоги по категориям", _add_month_totals),
+    (5, "Полнотекстовый поиск по описаниям транзакций (FTS5)", _add_description_search),
+    (6, "Справочник тегов и связь транзакций с тегами по id", _normalize_tags),
+    (7, "Денежные суммы в целых копейках", _convert_to_cents),
+    (8, "Даты транзакций в формате ISO-8601 (YYYY-MM-DD)", _normalize_dates),
+    (9, "Бюджеты пользователей и индексы для выборок по пользователю", _add_user_scoping),
+    (10, "Регулярные транзакции (правила повторения)", _add_recurring_rules),
+    (11, "Валюты счетов, курсы валют и месячные итоги по валютам", _add_currencies),
+]
+
+
+# Миграция 7 удаляет колонки (ALTER TABLE ... DROP COLUMN), а это есть только в SQLite 3.35 и новее
+DROP_COLUMN_SQLITE_VERSION = (3, 35, 0)
+
+
+def get_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """ Применяет к базе все миграции новее текущей PRAGMA user_version """
+    # Проверяем заранее: иначе обновление остановится на миграции 7, когда 1-6 уже применены
+    if get_version(conn) < 7 and sqlite3.sqlite_version_info < DROP_COLUMN_SQLITE_VERSION:
+        raise MigrationError(f"Для обновления базы нужен SQLite "
+                             f"{'.'.join(map(str, DROP_COLUMN_SQLITE_VERSION))} или новее, "
+                             f"а Python использует SQLite {sqlite3.sqlite_version}")
+    applied = []
+    cursor = conn.cursor()
+    for version, description, upgrade in MIGRATIONS:
+        if version <= get_version(conn):
+            continue
+        try:
+            if conn.in_transaction:
+                conn.commit()
+            cursor.execute("BEGIN IMMEDIATE")
+            # Другой процесс мог успеть применить миграцию, пока мы ждали блокировку
+            if version <= get_version(conn):
+                conn.rollback()
+                continue
+            upgrade(cursor)
+            cursor.execute(f"PRAGMA user_version = {int(version)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append((version, description))
+    return applied
+
+
+# Запросы FinanceApp, которые выполняются на каждом обновлении или вставке
+HOT_QUERIES = [
+    ("Список транзакций по дате", "SELECT * FROM transactions ORDER BY date DESC", ()),
+    ("Транзакции счета", "SELECT * FROM transactions WHERE account_id = ? ORDER BY date DESC", (1,)),
+    ("Транзакции категории", "SELECT * FROM transactions WHERE category_id = ? ORDER BY date DESC", (1,)),
+    ("Транзакции за период", "SELECT * FROM transactions WHERE date BETWEEN ? AND ? ORDER BY date, id",
+     ("2024-01-01", "2024-01-31")),
+    ("Транзакции счета за период",
+     "SELECT * FROM transactions WHERE date BETWEEN ? AND ? AND account_id = ? ORDER BY date, id",
+     ("2024-01-01", "2024-01-31", 1)),
+    ("Транзакции категории за период",
+     "SELECT * FROM transactions WHERE date BETWEEN ? AND ? AND category_id = ? ORDER BY date, id",
+     ("2024-01-01", "2024-01-31", 1)),
+    ("Категория по имени", "SELECT id FROM categories WHERE name = ?", ("",)),
+    ("Категория по id", "SELECT name FROM categories WHERE id = ?", (1,)),
+    ("Пользователь по имени", "SELECT id FROM users WHERE username = ?", ("",)),
+    ("Проверка пароля", "SELECT * FROM users WHERE username = ? AND password = ?", ("", "")),
+    ("Пользователь по id", "SELECT username FROM users WHERE id = ?", (1,)),
+    ("Тип транзакции по имени", "SELECT id FROM transaction_types WHERE name = ?", ("",)),
+    ("Тег по имени", "SELECT id FROM tags WHERE name = ?", ("",)),
+    ("Транзакции по тегу", "SELECT transaction_id FROM transaction_tags WHERE tag_id = ?", (1,)),
+    ("Теги транзакции", "SELECT tag_id FROM transaction_tags WHERE transaction_id = ?", (1,)),
+    ("Число транзакций по тегам", "SELECT tag_id, COUNT(*) FROM transaction_tags GROUP BY tag_id", ()),
+    ("Тип транзакции", "SELECT type_id FROM transaction_type_mapping WHERE transaction_id = ?", (1,)),
+    ("Счета пользователя", "SELECT * FROM accounts WHERE user_id = ?", (1,)),
+    ("Бюджеты категории", "SELECT * FROM budget WHERE category_id = ?", (1,)),
+    ("Бюджеты пользователя", "SELECT * FROM budget WHERE user_id = ? AND category_id = ?", (1, 1)),
+    ("Транзакции пользователя",
+     "SELECT t.* FROM accounts a CROSS JOIN transactions t ON t.account_id = a.id WHERE a.user_id = ?", (1,)),
+    ("Страница транзакций счета",
+     "SELECT id FROM transactions WHERE account_id = ? AND (date, id) < (?, ?) ORDER BY date DESC, id DESC LIMIT 200",
+     (1, "2024-01-01", 1)),
+    ("Расходы пользователя за месяц",
+     "SELECT t.category_id, a.currency, t.amount FROM accounts a CROSS JOIN transactions t ON t.account_id = a.id "
+     "WHERE a.user_id = ? AND t.date >= ? AND t.date < ?",
+     (1, "2024-01", "2024-01~")),
+    ("Правила регулярных транзакций к запуску", "SELECT * FROM recurring_rules WHERE next_date <= ?", ("2024-01-01",)),
+    ("Созданные повторения правила",
+     "SELECT date FROM transactions WHERE recurring_rule_id = ? AND date >= ?", (1, "2024-01-01")),
+    ("Курс валюты на дату",
+     "SELECT rate FROM fx_rates WHERE currency = ? AND date <= ? ORDER BY date DESC LIMIT 1", ("USD", "2024-01-01")),
+]
+
+
+def _uses_index(details):
+    for detail in details:
+        if "USE TEMP B-TREE" in detail:
+            return False
+        if detail.startswith("SCAN") and "USING" not in detail:
+            return False
+    return True
+
+
+def explain_hot_queries(conn, queries=HOT_QUERIES):
+    """ Возвращает список (название, строки плана, используется ли индекс) """
+    report = []
+    for name, sql, params in queries:
+        details = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+        report.append((name, details, _uses_index(details)))
+    return report
+
+
+def print_query_plan_report(conn, queries=HOT_QUERIES):
+    report = explain_hot_queries(conn, queries)
+    for name, details, indexed in report:
+        print(f"[{'OK' if indexed else 'SCAN'}] {name}")
+        for detail in details:
+            print(f"    {detail}")
+    missing = [name for name, details, indexed in report if not indexed]
+    print(f"Запросов: {len(report)}, без индекса: {len(missing)}")
+    return not missing
+
+
+if __name__ == "__main__":
+    db_file = sys.argv[1] if len(sys.argv) > 1 else 'finance.db'
+    conn = sqlite3.connect(db_file)
+    for version, description in migrate(conn):
+        print(f"Применена миграция {version}: {description}")
+    print(f"Версия схемы: {get_version(conn)}")
+    orphans = dict((table, count) for table, count in find_orphans(conn.cursor()).items() if count)
+    if orphans:
+        print("Строки без родительской записи (удаляются только FinanceApp.sweep_orphans): "
+              + ", ".join(f"{table} {count}" for table, count in orphans.items()))
+    ok = print_query_plan_report(conn)
+    conn.close()
+    sys.exit(0 if ok else 1)
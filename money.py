@@ -0,0 +1,106 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from functools import total_ordering
+
+CENT = Decimal('0.01')
+
+# Валюта, к которой заданы курсы в fx_rates и в которой по умолчанию сводятся балансы
+BASE_CURRENCY = 'RUB'
+
+
+@total_ordering
+class Money:
+    """ Денежная сумма в копейках.
+
+    В базе суммы хранятся целыми числами минимальных единиц, поэтому SUM в SQLite
+    считается точно; Money появляется только на границе приложения: разбор ввода
+    пользователя и вывод сумм.
+    """
+
+    __slots__ = ('cents',)
+
+    def __init__(self, cents=0):
+        self.cents = int(round(cents))
+
+    @classmethod
+    def parse(cls, value):
+        """ Сумма из ввода пользователя: строки "1 234,56", числа или Money """
+        if isinstance(value, Money):
+            return value
+        try:
+            if isinstance(value, float):
+                # repr дает кратчайшую запись числа, без хвоста двоичного представления
+                amount = Decimal(repr(value))
+            elif isinstance(value, (int, Decimal)):
+                amount = Decimal(value)
+            else:
+                text = str(value).replace('\xa0', '').replace(' ', '').replace(',', '.')
+                amount = Decimal(text)
+            if not amount.is_finite():
+                raise ValueError
+            return cls(int(amount.quantize(CENT, rounding=ROUND_HALF_UP) * 100))
+        except (InvalidOperation, ValueError, TypeError):
+            raise ValueError(f"Некорректная сумма: {value}")
+
+    def to_decimal(self):
+        return Decimal(self.cents) / 100
+
+    def __str__(self):
+        sign = '-' if self.cents < 0 else ''
+        units, cents = divmod(abs(self.cents), 100)
+        return f"{sign}{units}.{cents:02d}"
+
+    def __repr__(self):
+        return f"Money('{self}')"
+
+    def __float__(self):
+        return self.cents / 100
+
+    def __bool__(self):
+        return self.cents != 0
+
+    def __hash__(self):
+        return hash(self.cents)
+
+    def __eq__(self, other):
+        if isinstance(other, Money):
+            return self.cents == other.cents
+        return NotImplemented
+
+    def __lt__(self, other):
+        if isinstance(other, Money):
+            return self.cents < other.cents
+        return NotImplemented
+
+    def __add__(self, other):
+        if isinstance(other, Money):
+            return Money(self.cents + other.cents)
+        return NotImplemented
+
+    def __radd__(self, other):
+        # sum() начинает с 0
+        if other == 0:
+            return self
+        return NotImplemented
+
+    def __sub__(self, other):
+        if isinstance(other, Money):
+            return Money(self.cents - other.cents)
+        return NotImplemented
+
+    def __neg__(self):
+        return Money(-self.cents)
+
+    def __abs__(self):
+        return Money(abs(self.cents))
+
+
+def money_columns(rows, *indexes):
+    """ Заменяет значения в копейках в колонках indexes строк rows на Money (NULL остается None) """
+    result = []
+    for row in rows:
+        row = list(row)
+        for index in indexes:
+            if row[index] is not None:
+                row[index] = Money(row[index])
+        result.append(tuple(row))
+    return result
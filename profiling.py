@@ -0,0 +1,283 @@
+""" Необязательное профилирование SQL-запросов FinanceApp.
+
+Если FinanceApp открыт с profiler=QueryStats(...), его соединения создаются с
+ProfiledConnection: каждый запрос учитывается по нормализованному тексту SQL
+(число вызовов, суммарное время, перцентили задержки, число строк). Время запроса
+на чтение включает выборку строк: запись закрывается, когда курсор дочитан,
+закрыт или выполняет следующий запрос. Запросы дольше slow_ms попадают в журнал
+медленных запросов вместе с EXPLAIN QUERY PLAN.
+
+Без профилировщика соединения остаются обычными sqlite3.Connection и накладных
+расходов нет. Включение из окружения: FINANCE_PROFILE=1, порог - FINANCE_SLOW_MS,
+файл для отчета при выходе - FINANCE_PROFILE_FILE.
+"""
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Для каждого запроса храним столько последних длительностей для перцентилей
+SAMPLES_PER_STATEMENT = 1000
+SLOW_LOG_SIZE = 100
+# EXPLAIN QUERY PLAN имеет смысл только для запросов к данным
+EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+def normalize_sql(sql):
+    """ Ключ статистики: пробелы схлопнуты, списки параметров IN (?, ?, ...) сведены к одному виду """
+    sql = ' '.join(sql.split())
+    return re.sub(r'\?(\s*,\s*\?)+', '?, ...', sql)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+class StatementStats:
+    __slots__ = ('count', 'total', 'max', 'rows', 'errors', 'samples')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.errors = 0
+        self.samples = deque(maxlen=SAMPLES_PER_STATEMENT)
+
+
+class QueryStats:
+    """ Статистика запросов всех соединений одного FinanceApp; безопасна для нескольких потоков """
+
+    def __init__(self, slow_ms=50.0, explain=True):
+        self.slow_ms = slow_ms
+        self.explain = explain
+        self._lock = threading.Lock()
+        self._statements = {}
+        self._slow = deque(maxlen=SLOW_LOG_SIZE)
+        self.started = time.time()
+
+    @classmethod
+    def from_env(cls, environ=None):
+        """ QueryStats, если задана переменная FINANCE_PROFILE, иначе None """
+        environ = os.environ if environ is None else environ
+        if environ.get('FINANCE_PROFILE', '') in ('', '0'):
+            return None
+        return cls(slow_ms=float(environ.get('FINANCE_SLOW_MS', 50)))
+
+    def record(self, conn, sql, params, seconds, rows, error=False):
+        key = normalize_sql(sql)
+        with self._lock:
+            stats = self._statements.get(key)
+            if stats is None:
+                stats = self._statements[key] = StatementStats()
+            stats.count += 1
+            stats.total += seconds
+            stats.max = max(stats.max, seconds)
+            stats.rows += rows
+            stats.errors += error
+            stats.samples.append(seconds)
+        if self.slow_ms is not None and seconds * 1000 >= self.slow_ms:
+            plan = self._explain(conn, sql, params) if self.explain else None
+            entry = {
+                'sql': key,
+                'params': repr(params)[:200] if params is not None else None,
+                'ms': seconds * 1000,
+                'rows': rows,
+                'time': time.strftime('%H:%M:%S'),
+                'plan': plan,
+            }
+            with self._lock:
+                self._slow.append(entry)
+            logger.warning("Медленный запрос %.1f мс: %s%s", entry['ms'], key,
+                           '\n' + plan if plan else '')
+
+    @staticmethod
+    def _explain(conn, sql, params):
+        if params is None or not sql.lstrip().upper().startswith(EXPLAINABLE):
+            return None
+        try:
+            # Через метод базового класса: сам план не должен попасть в статистику
+            rows = sqlite3.Connection.execute(conn, "EXPLAIN QUERY PLAN " + sql, params).fetchall()
+        except sqlite3.Error:
+            return None
+        depth = {0: -1}
+        lines = []
+        for node_id, parent, _, detail in rows:
+            depth[node_id] = depth.get(parent, -1) + 1
+            lines.append('  ' * depth[node_id] + detail)
+        return '\n'.join(lines)
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
+            self._slow.clear()
+            self.started = time.time()
+
+    def report(self):
+        """ Словарь для JSON: запросы по убыванию суммарного времени и журнал медленных запросов """
+        with self._lock:
+            items = [(key, stats.count, stats.total, stats.max, stats.rows, stats.errors, sorted(stats.samples))
+                     for key, stats in self._statements.items()]
+            slow = list(self._slow)
+        statements = []
+        for key, count, total, longest, rows, errors, samples in sorted(items, key=lambda item: -item[2]):
+            statements.append({
+                'sql': key,
+                'count': count,
+                'total_ms': total * 1000,
+                'mean_ms': total * 1000 / count,
+                'p50_ms': percentile(samples, 0.50) * 1000,
+                'p95_ms': percentile(samples, 0.95) * 1000,
+                'p99_ms': percentile(samples, 0.99) * 1000,
+                'max_ms': longest * 1000,
+                'rows': rows,
+                'errors': errors,
+            })
+        return {'seconds': time.time() - self.started, 'slow_ms': self.slow_ms,
+                'statements': statements, 'slow': slow}
+
+    def format_report(self, limit=20):
+        report = self.report()
+        lines = [f"Запросов: {sum(s['count'] for s in report['statements'])} за {report['seconds']:.0f} с, "
+                 f"медленных (>= {report['slow_ms']} мс): {len(report['slow'])}"]
+        for s in report['statements'][:limit]:
+            lines.append(f"{s['count']:8d} x  всего {s['total_ms']:9.1f} мс  p50 {s['p50_ms']:7.2f}  "
+                         f"p95 {s['p95_ms']:7.2f}  p99 {s['p99_ms']:7.2f}  строк {s['rows']:8d}  {s['sql'][:120]}")
+        return '\n'.join(lines)
+
+    def dump(self, path=None):
+        """ Отчет в JSON-файл path или текстом в stderr (для atexit) """
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(self.report(), f, ensure_ascii=False, indent=2)
+        else:
+            print(self.format_report(), file=sys.stderr)
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """ Курсор, который сообщает о каждом запросе профилировщику своего соединения """
+
+    _pending = None  # [sql, params, секунды, строки] незавершенного запроса на чтение
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        started = time.perf_counter()
+        try:
+            super().execute(sql, parameters)
+        except sqlite3.Error:
+            self._record(sql, parameters, time.perf_counter() - started, 0, error=True)
+            raise
+        self._pending = [sql, parameters, time.perf_counter() - started, 0]
+        if self.description is None:
+            # Запрос без результата уже выполнен целиком
+            self._pending[3] = max(self.rowcount, 0)
+            self._finish()
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        started = time.perf_counter()
+        try:
+            super().executemany(sql, seq_of_parameters)
+        except sqlite3.Error:
+            self._record(sql, None, time.perf_counter() - started, 0, error=True)
+            raise
+        self._record(sql, None, time.perf_counter() - started, max(self.rowcount, 0))
+        return self
+
+    def executescript(self, sql_script):
+        self._finish()
+        started = time.perf_counter()
+        super().executescript(sql_script)
+        self._record(sql_script, None, time.perf_counter() - started, 0)
+        return self
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._add(time.perf_counter() - started, row is not None)
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        started = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._add(time.perf_counter() - started, len(rows))
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._add(time.perf_counter() - started, len(rows))
+        self._finish()
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._add(time.perf_counter() - started, 0)
+            self._finish()
+            raise
+        self._add(time.perf_counter() - started, 1)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # Курсор без дочитанного результата (fetchone для одной строки) учитывается при удалении
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+    def _add(self, seconds, rows):
+        if self._pending is not None:
+            self._pending[2] += seconds
+            self._pending[3] += rows
+
+    def _finish(self):
+        pending = self._pending
+        if pending is not None:
+            self._pending = None
+            self._record(*pending)
+
+    def _record(self, sql, params, seconds, rows, error=False):
+        profiler = getattr(self.connection, 'profiler', None)
+        if profiler is not None:
+            profiler.record(self.connection, sql, params, seconds, rows, error)
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """ Соединение, все курсоры которого - ProfiledCursor; profiler задает connection.connect """
+
+    profiler = None
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or ProfiledCursor)
+
+    # Методы соединения в sqlite3 создают курсор в обход cursor(), поэтому переопределены
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, parameters):
+        return self.cursor().executemany(sql, parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
@@ -0,0 +1,419 @@
+""" Локальный HTTP/JSON-сервис поверх FinanceApp (только стандартная библиотека).
+
+Запросы обрабатываются параллельно (ThreadingHTTPServer): чтение идет через пул
+соединений FinanceApp без блокировок, запись - через единственное соединение
+для записи под общей блокировкой. Сервис рассчитан на локальные инструменты
+и по умолчанию слушает только 127.0.0.1.
+
+Пример:
+    python server.py --db finance.db --port 8765
+    curl 'http://127.0.0.1:8765/transactions?limit=50'
+    curl 'http://127.0.0.1:8765/transactions?limit=50&user_id=1'   # только счета пользователя 1
+    curl -X POST -d '{"transactions": [{"amount": "12.50", "category": "Продукты", "date": "2024-05-01"}]}' \\
+        http://127.0.0.1:8765/transactions/batch
+"""
+import argparse
+import json
+import re
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from finance_app import CONCURRENT_READ_METHODS, FinanceApp, ConflictError, NotFoundError
+from money import BASE_CURRENCY, Money
+from profiling import QueryStats
+
+TRANSACTION_FIELDS = ('id', 'amount', 'category', 'description', 'date', 'account', 'type')
+CATEGORY_FIELDS = ('id', 'name')
+ACCOUNT_FIELDS = ('id', 'username', 'name', 'balance', 'currency')
+CONSOLIDATED_FIELDS = ACCOUNT_FIELDS + ('converted',)
+BUDGET_FIELDS = ('category_id', 'category', 'budget', 'spent', 'remaining', 'percent')
+TAG_FIELDS = ('tag', 'count')
+FX_RATE_FIELDS = ('currency', 'date', 'rate')
+CATEGORY_TOTAL_FIELDS = ('category', 'spent', 'income')
+RECURRING_FIELDS = ('id', 'amount', 'category', 'description', 'type', 'account_id', 'frequency', 'interval',
+                    'start_date', 'end_date', 'next_date')
+
+MAX_BODY_SIZE = 16 * 1024 * 1024
+# Больше строк за один запрос не отдается: для остального есть пагинация
+MAX_LIMIT = 1000
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def records(fields, rows):
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def json_default(value):
+    if isinstance(value, Money):
+        return float(value)
+    raise TypeError(f"Не сериализуется в JSON: {type(value).__name__}")
+
+
+def query_int(query, name, default):
+    values = query.get(name)
+    if not values:
+        return default
+    try:
+        return int(values[0])
+    except ValueError:
+        raise ApiError(400, f"Параметр {name} должен быть целым числом")
+
+
+def query_limit(query, default):
+    """ Параметр limit: положительное целое, не больше MAX_LIMIT """
+    limit = query_int(query, 'limit', default)
+    if limit is None:
+        return None
+    if limit < 1:
+        raise ApiError(400, "Параметр limit должен быть положительным")
+    return min(limit, MAX_LIMIT)
+
+
+def query_str(query, name, default=None):
+    values = query.get(name)
+    return values[0] if values else default
+
+
+def transaction_row(item):
+    """ Объект JSON -> кортеж для FinanceApp.add_transactions_bulk """
+    if not isinstance(item, dict):
+        raise ApiError(400, "Транзакция должна быть объектом JSON")
+    return (item.get('amount'), item.get('category'), item.get('description', ''), item.get('date'),
+            item.get('type'), item.get('tags'), item.get('account_id'))
+
+
+class FinanceService:
+    """ Маршрутизация запросов API в методы FinanceApp """
+
+    # (HTTP-метод, путь, обработчик)
+    ROUTES = [
+        ('GET', r'/transactions', 'list_transactions'),
+        ('POST', r'/transactions', 'add_transaction'),
+        ('POST', r'/transactions/batch', 'add_transactions_batch'),
+        ('GET', r'/transactions/search', 'search_transactions'),
+        ('GET', r'/transactions/range', 'transactions_between'),
+        ('DELETE', r'/transactions/(\d+)', 'delete_transaction'),
+        ('GET', r'/categories', 'list_categories'),
+        ('POST', r'/categories', 'add_category'),
+        ('GET', r'/accounts', 'list_accounts'),
+        ('POST', r'/accounts', 'add_account'),
+        ('GET', r'/accounts/consolidated', 'consolidated_balances'),
+        ('GET', r'/fx-rates', 'list_fx_rates'),
+        ('POST', r'/fx-rates', 'add_fx_rates'),
+        ('GET', r'/reports/consolidated', 'consolidated_totals'),
+        ('GET', r'/budget', 'budget_status'),
+        ('GET', r'/tags', 'tag_counts'),
+        ('GET', r'/tags/transactions', 'transactions_by_tags'),
+        ('GET', r'/recurring', 'list_recurring_rules'),
+        ('POST', r'/recurring', 'add_recurring_rule'),
+        ('POST', r'/recurring/run', 'run_recurring_rules'),
+        ('DELETE', r'/recurring/(\d+)', 'delete_recurring_rule'),
+        ('POST', r'/batch', 'batch'),
+        ('GET', r'/debug/queries', 'query_stats'),
+    ]
+
+    def __init__(self, app):
+        self.app = app
+        self.write_lock = threading.Lock()
+        self.routes = [(method, re.compile(pattern + '$'), handler) for method, pattern, handler in self.ROUTES]
+
+    def call(self, method, *args, **kwargs):
+        # Методы, которые только читают через пул, вызываются без блокировки записи.
+        # Без пула чтения (база в памяти) все запросы идут через соединение для записи
+        if method in CONCURRENT_READ_METHODS and self.app.read_pool is not None:
+            return getattr(self.app, method)(*args, **kwargs)
+        with self.write_lock:
+            return getattr(self.app, method)(*args, **kwargs)
+
+    def dispatch(self, method, path, query=None, body=None):
+        """ Выполняет запрос API. Возвращает (HTTP-статус, объект для JSON) """
+        try:
+            handler, args = self._route(method, path)
+            return handler(*args, query or {}, body)
+        except ApiError as e:
+            return e.status, {'error': str(e)}
+        except NotFoundError as e:
+            return 404, {'error': str(e)}
+        except (ConflictError, sqlite3.IntegrityError) as e:
+            return 409, {'error': str(e)}
+        except ValueError as e:
+            return 400, {'error': str(e)}
+        except sqlite3.Error as e:
+            return 500, {'error': str(e)}
+
+    def _route(self, method, path):
+        allowed = False
+        for route_method, pattern, handler in self.routes:
+            match = pattern.match(path)
+            if match:
+                if route_method == method:
+                    return getattr(self, handler), match.groups()
+                allowed = True
+        if allowed:
+            raise ApiError(405, f"Метод {method} не поддерживается для {path}")
+        raise ApiError(404, f"Неизвестный путь: {path}")
+
+    def list_transactions(self, query, body):
+        """ Страница транзакций; следующая страница - after_date и after_id последней строки """
+        after = None
+        if 'after_date' in query:
+            after = (query_str(query, 'after_date'), query_int(query, 'after_id', 0))
+        rows = self.call('get_transactions_page', after, query_limit(query, 200),
+                         query_str(query, 'backward') == '1', query_int(query, 'user_id', None))
+        return 200, {'transactions': records(TRANSACTION_FIELDS, rows)}
+
+    def search_transactions(self, query, body):
+        rows = self.call('search_transactions', query_str(query, 'q', ''),
+                         query_limit(query, 50), query_int(query, 'offset', 0), query_int(query, 'user_id', None))
+        return 200, {'transactions': records(TRANSACTION_FIELDS, rows)}
+
+    def transactions_between(self, query, body):
+        """ ?start=2024-05-01&end=2024-05-31[&account_id=N][&category=...] - даты включительно """
+        if not query_str(query, 'start') or not query_str(query, 'end'):
+            raise ApiError(400, "Параметры start и end обязательны")
+        rows = self.call('get_transactions_between', query_str(query, 'start'), query_str(query, 'end'),
+                         query_int(query, 'account_id', None), query_str(query, 'category'),
+                         query_int(query, 'user_id', None))
+        return 200, {'transactions': records(TRANSACTION_FIELDS, rows)}
+
+    def add_transaction(self, query, body):
+        self.call('add_transaction', *transaction_row(body))
+        return 201, {'inserted': 1}
+
+    def add_transactions_batch(self, query, body):
+        """ {"transactions": [...]} -> число добавленных и отклоненные строки с причинами """
+        items = (body or {}).get('transactions') if isinstance(body, dict) else None
+        if not isinstance(items, list):
+            raise ApiError(400, "Ожидается {\"transactions\": [...]}")
+        rows = [transaction_row(item) for item in items]
+        inserted, rejected = self.call('add_transactions_bulk', rows, query_int(query, 'batch_size', 1000))
+        return 200, {
+            'inserted': inserted,
+            'rejected': [{'index': index, 'error': reason} for index, reason in rejected],
+        }
+
+    def delete_transaction(self, transaction_id, query, body):
+        self.call('delete_transaction', int(transaction_id), query_int(query, 'user_id', None))
+        return 200, {'deleted': int(transaction_id)}
+
+    def list_categories(self, query, body):
+        return 200, {'categories': records(CATEGORY_FIELDS, self.call('get_categories'))}
+
+    def add_category(self, query, body):
+        name = (body or {}).get('name') if isinstance(body, dict) else None
+        if not name:
+            raise ApiError(400, "Не указано имя категории")
+        self.call('add_category', name)
+        return 201, {'name': name}
+
+    def list_accounts(self, query, body):
+        return 200, {'accounts': records(ACCOUNT_FIELDS, self.call('get_accounts_view', query_int(query, 'user_id', None)))}
+
+    def add_account(self, query, body):
+        if not isinstance(body, dict) or not body.get('username') or not body.get('name'):
+            raise ApiError(400, "Ожидается {\"username\": ..., \"name\": ..., \"balance\": ...[, \"currency\": ...]}")
+        self.call('add_account', body['username'], body['name'], body.get('balance', 0),
+                  body.get('currency', BASE_CURRENCY))
+        return 201, {'name': body['name']}
+
+    def consolidated_balances(self, query, body):
+        """ ?currency=USD[&date=YYYY-MM-DD] - балансы счетов и итог в одной валюте """
+        currency = query_str(query, 'currency', BASE_CURRENCY)
+        rows, total = self.call('get_consolidated_balances', currency, query_str(query, 'date'),
+                                query_int(query, 'user_id', None))
+        return 200, {'currency': currency.upper(), 'accounts': records(CONSOLIDATED_FIELDS, rows), 'total': total}
+
+    def list_fx_rates(self, query, body):
+        return 200, {'rates': records(FX_RATE_FIELDS, self.call('get_fx_rates', query_str(query, 'currency')))}
+
+    def add_fx_rates(self, query, body):
+        """ {"rates": [{"currency": "USD", "date": "2024-05-01", "rate": 91.5}, ...]} - курс к базовой валюте """
+        items = (body or {}).get('rates') if isinstance(body, dict) else None
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            raise ApiError(400, "Ожидается {\"rates\": [{\"currency\": ..., \"date\": ..., \"rate\": ...}]}")
+        count = self.call('add_fx_rates', [(item.get('currency'), item.get('date'), item.get('rate')) for item in items])
+        return 200, {'inserted': count}
+
+    def consolidated_totals(self, query, body):
+        """ ?start=...&end=...[&currency=USD] - расходы и доходы по категориям в одной валюте """
+        if not query_str(query, 'start') or not query_str(query, 'end'):
+            raise ApiError(400, "Параметры start и end обязательны")
+        currency = query_str(query, 'currency', BASE_CURRENCY)
+        rows = self.call('get_consolidated_totals', query_str(query, 'start'), query_str(query, 'end'), currency,
+                         query_int(query, 'user_id', None))
+        return 200, {'currency': currency.upper(), 'categories': records(CATEGORY_TOTAL_FIELDS, rows)}
+
+    def budget_status(self, query, body):
+        month = query_str(query, 'month') or datetime.now().strftime("%Y-%m")
+        rows = self.call('get_budget_status', month, query_int(query, 'user_id', None))
+        return 200, {'month': month, 'budget': records(BUDGET_FIELDS, rows)}
+
+    def tag_counts(self, query, body):
+        return 200, {'tags': records(TAG_FIELDS, self.call('get_tag_counts', query_int(query, 'user_id', None)))}
+
+    def transactions_by_tags(self, query, body):
+        """ ?tag=a&tag=b[&match=any][&limit=N] """
+        rows = self.call('get_transactions_by_tags', query.get('tag', []),
+                         query_str(query, 'match', 'all') != 'any', query_limit(query, None),
+                         query_int(query, 'user_id', None))
+        return 200, {'transactions': records(TRANSACTION_FIELDS, rows)}
+
+    def list_recurring_rules(self, query, body):
+        rows = self.call('get_recurring_rules', query_int(query, 'user_id', None))
+        return 200, {'rules': records(RECURRING_FIELDS, rows)}
+
+    def add_recurring_rule(self, query, body):
+        """ {"amount", "category", "start_date"[, "description", "frequency", "interval", "type",
+        "account_id", "end_date", "user_id"]}; frequency - daily, weekly, monthly (по умолчанию) или yearly """
+        if not isinstance(body, dict) or not body.get('category') or not body.get('start_date'):
+            raise ApiError(400, "Ожидается {\"amount\": ..., \"category\": ..., \"start_date\": ...}")
+        rule_id = self.call('add_recurring_rule', body.get('amount'), body['category'], body.get('description', ''),
+                            body['start_date'], body.get('frequency', 'monthly'), body.get('interval', 1),
+                            body.get('type'), body.get('account_id'), body.get('end_date'), body.get('user_id'))
+        return 201, {'id': rule_id}
+
+    def run_recurring_rules(self, query, body):
+        """ Создает наступившие повторения; ?today=YYYY-MM-DD - расчетная дата вместо сегодняшней """
+        return 200, {'inserted': self.call('run_recurring_rules', query_str(query, 'today'))}
+
+    def delete_recurring_rule(self, rule_id, query, body):
+        self.call('delete_recurring_rule', int(rule_id))
+        return 200, {'deleted': int(rule_id)}
+
+    def query_stats(self, query, body):
+        """ Статистика запросов, если сервис запущен с --profile """
+        report = self.call('query_stats')
+        if report is None:
+            raise ApiError(404, "Профилирование выключено (--profile)")
+        return 200, report
+
+    def batch(self, query, body):
+        """ Несколько запросов за один обмен: {"requests": [{"method", "path", "body"}, ...]}.
+
+        Запросы выполняются по порядку; ошибка одного не прерывает остальные.
+        """
+        requests = (body or {}).get('requests') if isinstance(body, dict) else None
+        if not isinstance(requests, list):
+            raise ApiError(400, "Ожидается {\"requests\": [...]}")
+        responses = []
+        for request in requests:
+            if not isinstance(request, dict):
+                responses.append({'status': 400, 'body': {'error': "Запрос должен быть объектом JSON"}})
+                continue
+            url = urlsplit(request.get('path', ''))
+            if url.path == '/batch':
+                status, payload = 400, {'error': "Вложенный /batch не поддерживается"}
+            else:
+                status, payload = self.dispatch(request.get('method', 'GET').upper(), url.path,
+                                                parse_qs(url.query), request.get('body'))
+            responses.append({'status': status, 'body': payload})
+        return 200, {'responses': responses}
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1: клиент может держать соединение открытым между запросами
+    protocol_version = 'HTTP/1.1'
+    # Заголовки и тело уходят отдельными записями; без TCP_NODELAY ответ ждет отложенного ACK
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_PATCH(self):
+        self._handle('PATCH')
+
+    def _handle(self, method):
+        url = urlsplit(self.path)
+        try:
+            body = self._read_body()
+        except ApiError as e:
+            self._send(e.status, {'error': str(e)})
+            return
+        status, payload = self.server.service.dispatch(method, url.path, parse_qs(url.query), body)
+        self._send(status, payload)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return None
+        if length > MAX_BODY_SIZE:
+            raise ApiError(413, "Слишком большой запрос")
+        try:
+            return json.loads(self.rfile.read(length))
+        except ValueError:
+            raise ApiError(400, "Тело запроса не является JSON")
+
+    def _send(self, status, payload):
+        data = json.dumps(payload, ensure_ascii=False, default=json_default).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def make_server(app, host='127.0.0.1', port=8765, verbose=False):
+    """ Создает HTTP-сервер для app; port=0 - любой свободный порт (server.server_address[1]) """
+    server = ThreadingHTTPServer((host, port), RequestHandler)
+    server.daemon_threads = True
+    server.service = FinanceService(app)
+    server.verbose = verbose
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Локальный HTTP/JSON-сервис для finance.db")
+    parser.add_argument('--db', default='finance.db')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--read-pool', type=int, default=8, help="число соединений только для чтения")
+    parser.add_argument('--verbose', action='store_true', help="писать журнал запросов в stderr")
+    parser.add_argument('--profile', action='store_true', help="собирать статистику SQL (GET /debug/queries)")
+    parser.add_argument('--slow-ms', type=float, default=50.0, help="порог журнала медленных запросов, мс")
+    parser.add_argument('--profile-file', help="при выходе сохранить статистику SQL в JSON-файл")
+    args = parser.parse_args(argv)
+
+    profiler = QueryStats(slow_ms=args.slow_ms) if args.profile or args.profile_file else None
+    app = FinanceApp(args.db, read_pool_size=args.read_pool, check_same_thread=False, profiler=profiler)
+    # Регулярные транзакции, пропущенные, пока сервис не работал; дальше - POST /recurring/run
+    inserted = app.run_recurring_rules()
+    if inserted:
+        print(f"Создано регулярных транзакций: {inserted}", file=sys.stderr)
+    server = make_server(app, args.host, args.port, args.verbose)
+    print(f"Сервис слушает http://{args.host}:{server.server_address[1]}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        app.close()
+        if profiler is not None:
+            profiler.dump(args.profile_file)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
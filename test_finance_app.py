@@ -0,0 +1,80 @@
+import pytest
+
+import bd_create
+from finance_app import ConflictError, FinanceApp, NotFoundError, ValidationError
+
+
+@pytest.fixture
+def app(tmp_path):
+    db_file = str(tmp_path / 'finance.db')
+    bd_create.create_database(db_file)
+    bd_create.populate_initial_data(db_file)
+    app = FinanceApp(db_file)
+    yield app
+    app.close()
+
+
+def balances(app):
+    return {row[0]: row[3].cents for row in app.get_accounts()}
+
+
+def test_delete_category_in_use_keeps_transactions(app):
+    app.add_transaction('100', 'Продукты', 'Хлеб', '2024-05-01', 'Расход', account_id=2)
+    transactions = len(app.get_transactions())
+    before = balances(app)
+
+    with pytest.raises(ConflictError):
+        app.delete_category(1)
+
+    assert len(app.get_transactions()) == transactions
+    assert balances(app) == before
+    assert 'Продукты' in [name for _, name in app.get_categories()]
+    assert not app.conn.in_transaction
+
+
+def test_delete_unused_category(app):
+    app.add_category('Подарки')
+    category_id = app.reference_cache.get_id('categories', 'Подарки')
+
+    app.delete_category(category_id)
+
+    assert 'Подарки' not in [name for _, name in app.get_categories()]
+
+
+def test_untyped_transactions_stay_out_of_balances_and_budgets(app):
+    # Транзакции bd_create записаны без типа
+    month = app.get_transactions()[0][4][:7]
+    assert balances(app) == {1: 150000, 2: 250000}
+    assert {row[1]: row[3].cents for row in app.get_budget_status(month)}['Продукты'] == 0
+
+    app.add_transaction('100', 'Продукты', 'Хлеб', f'{month}-01', 'Расход', account_id=1)
+
+    assert balances(app) == {1: 140000, 2: 250000}
+    assert {row[1]: row[3].cents for row in app.get_budget_status(month)}['Продукты'] == 10000
+    assert {row[1]: row[3].cents for row in app.get_budget_status(month, user_id=1)}['Продукты'] == 10000
+
+
+def test_add_budget_for_unknown_user_rolls_back(app):
+    with pytest.raises(ValidationError):
+        app.add_budget('Продукты', '100', user_id=999)
+
+    assert not app.conn.in_transaction
+    assert len(app.get_budget()) == 2
+
+
+def test_user_cannot_delete_foreign_transaction_or_shared_budget(app):
+    transaction_id = app.get_transactions()[0][0]
+    shared_budget_id = app.get_budget()[0][0]
+
+    with pytest.raises(NotFoundError):
+        app.delete_transaction(transaction_id, user_id=2)
+    with pytest.raises(NotFoundError):
+        app.delete_account(1, user_id=2)
+    with pytest.raises(NotFoundError):
+        app.delete_budget(shared_budget_id, user_id=1)
+
+    assert transaction_id in [row[0] for row in app.get_transactions()]
+    assert len(app.get_budget()) == 2
+
+    app.delete_transaction(transaction_id, user_id=1)
+    assert transaction_id not in [row[0] for row in app.get_transactions()]